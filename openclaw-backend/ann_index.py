@@ -0,0 +1,110 @@
+import numpy as np
+from typing import Optional, Tuple
+
+# Rows assigned per matmul when building inverted lists (bounds peak memory)
+ASSIGN_BATCH = 8192
+
+class IVFIndex:
+    """
+    Inverted-file index over a matrix of L2-normalized rows.
+    A spherical k-means coarse quantizer partitions the rows into `n_lists`
+    cells; a query scores only the rows of its `nprobe` closest cells.
+    `nprobe` is the recall/latency knob: higher is slower and more exact.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, trained_rows: int):
+        self.centroids = centroids        # (n_lists, dim) normalized
+        self.assignments = assignments    # Cell id of every matrix row
+        self.trained_rows = trained_rows  # Matrix size the centroids were trained on
+        # Inverted lists: cell i owns list_rows[list_offsets[i]:list_offsets[i + 1]]
+        self.list_rows = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def n_rows(self) -> int:
+        return self.assignments.shape[0]
+
+    @staticmethod
+    def default_n_lists(n_rows: int) -> int:
+        return max(1, int(4 * np.sqrt(n_rows)))
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, n_lists: Optional[int] = None, iters: int = 10, seed: int = 0) -> "IVFIndex":
+        """Trains centroids with spherical k-means on a sample and assigns every row."""
+        n_rows = matrix.shape[0]
+        n_lists = min(n_lists or cls.default_n_lists(n_rows), n_rows)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n_rows, max(n_lists * 32, 10000))
+        sample = np.asarray(matrix[np.sort(rng.choice(n_rows, sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(iters):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed dead cells with random sample points
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        centroids = centroids.astype(np.float32)
+        return cls(centroids, _assign(centroids, matrix), n_rows)
+
+    def update(self, kept_rows: np.ndarray, new_block: np.ndarray) -> "IVFIndex":
+        """
+        Returns the index for `vstack([old_matrix[kept_rows], new_block])`.
+        Only the new rows are assigned, so the cost scales with the change.
+        `self` is left untouched so searches running against it stay valid.
+        """
+        assignments = np.concatenate([self.assignments[kept_rows], _assign(self.centroids, new_block)])
+        return IVFIndex(self.centroids, assignments, self.trained_rows)
+
+    def needs_retrain(self, n_rows: int) -> bool:
+        """Centroids drift out of shape once the corpus doubles or halves."""
+        return n_rows > 2 * self.trained_rows or n_rows * 2 < self.trained_rows
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (row ids, scores) of the approximate top_k, best first."""
+        nprobe = min(nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([
+            self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probes
+        ])
+        if candidates.size == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+
+        candidates.sort() # Sequential access into the memory-mapped matrix
+        scores = matrix[candidates] @ query
+        k = min(top_k, candidates.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def save(self, filepath: str):
+        with open(filepath, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments, trained_rows=np.array([self.trained_rows]))
+
+    @classmethod
+    def load(cls, filepath: str) -> "IVFIndex":
+        data = np.load(filepath)
+        return cls(data["centroids"], data["assignments"], int(data["trained_rows"][0]))
+
+def _assign(centroids: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Returns the nearest centroid of every row, in batches."""
+    n_rows = matrix.shape[0]
+    assignments = np.empty(n_rows, dtype=np.int64)
+    for start in range(0, n_rows, ASSIGN_BATCH):
+        block = np.asarray(matrix[start:start + ASSIGN_BATCH], dtype=np.float32)
+        assignments[start:start + ASSIGN_BATCH] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
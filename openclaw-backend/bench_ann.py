@@ -0,0 +1,78 @@
+"""
+Benchmarks IVF (approximate) search against exact search for the code indexer.
+Reports recall@k and p50/p99 latency for a range of `nprobe` values.
+
+Usage:
+    python bench_ann.py                       # synthetic clustered corpus
+    python bench_ann.py --chunks 500000       # bigger synthetic corpus
+    python bench_ann.py --index code_index.npy  # the real index (queries are perturbed rows)
+"""
+import time
+import argparse
+import numpy as np
+from ann_index import IVFIndex
+from indexer import CodeIndexer
+
+def synthetic_corpus(n_rows: int, dim: int, n_topics: int, rng) -> np.ndarray:
+    """Clustered unit vectors, a rough stand-in for code-chunk embeddings."""
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    matrix = topics[rng.integers(0, n_topics, n_rows)] + 1.2 * rng.standard_normal((n_rows, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+def make_queries(matrix: np.ndarray, n_queries: int, rng) -> np.ndarray:
+    rows = matrix[rng.integers(0, matrix.shape[0], n_queries)].astype(np.float32)
+    noise = rng.standard_normal(rows.shape).astype(np.float32) / np.float32(np.sqrt(rows.shape[1]))
+    queries = rows + 0.5 * noise
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+def percentile_ms(samples, q) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+def run(matrix: np.ndarray, queries: np.ndarray, top_k: int, nprobes, n_lists=None):
+    print(f"Corpus: {matrix.shape[0]} chunks x {matrix.shape[1]} dims, {len(queries)} queries, k={top_k}")
+
+    exact_results, exact_times = [], []
+    for q in queries:
+        start = time.perf_counter()
+        rows, _ = CodeIndexer._exact_top_k(matrix, q, top_k)
+        exact_times.append(time.perf_counter() - start)
+        exact_results.append(set(rows.tolist()))
+
+    start = time.perf_counter()
+    ivf = IVFIndex.train(matrix, n_lists=n_lists)
+    print(f"IVF trained in {time.perf_counter() - start:.2f}s ({ivf.n_lists} lists)\n")
+
+    print(f"{'mode':<16}{'recall@' + str(top_k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'exact':<16}{1.0:>10.3f}{percentile_ms(exact_times, 50):>10.3f}{percentile_ms(exact_times, 99):>10.3f}")
+
+    for nprobe in nprobes:
+        times, hits = [], 0
+        for q, truth in zip(queries, exact_results):
+            start = time.perf_counter()
+            rows, _ = ivf.search(matrix, q, top_k, nprobe)
+            times.append(time.perf_counter() - start)
+            hits += len(truth & set(rows.tolist()))
+        recall = hits / (len(queries) * top_k)
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<16}{recall:>10.3f}{percentile_ms(times, 50):>10.3f}{percentile_ms(times, 99):>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (MiniLM: 384)")
+    parser.add_argument("--topics", type=int, default=2000, help="Synthetic cluster count")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=None, help="IVF cell count (default 4*sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--index", help="Benchmark a saved embedding matrix instead")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index:
+        matrix = np.load(args.index, mmap_mode="r")
+    else:
+        matrix = synthetic_corpus(args.chunks, args.dim, args.topics, rng)
+
+    run(matrix, make_queries(matrix, args.queries, rng), args.top_k, args.nprobe, args.lists)
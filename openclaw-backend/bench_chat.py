@@ -0,0 +1,220 @@
+"""
+End-to-end benchmark of the /ws/chat pipeline. Drives the gateway with a
+prompt corpus from N concurrent clients and reports time to first chunk,
+turn latency and the gateway's per-stage timings (retrieval and each of its
+sources, pack, prompt, inference, send, verify) as p50/p95/p99, plus
+throughput per concurrency level. Results can be written as JSON and
+compared against an earlier run.
+
+The mock inference server is started in-process (see mock_inference_server.py);
+start the gateway pointed at it:
+    OPENCLAW_INFERENCE_URL=http://localhost:11435/v1/chat/completions python gateway.py
+
+Usage:
+    python bench_chat.py                                   # 1, 4 and 8 clients, 5 turns each
+    python bench_chat.py --clients 1 16 --turns 20 --profile instant
+    python bench_chat.py --json results.json --compare baseline.json
+    python bench_chat.py --no-mock                         # gateway already talks to a real model
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import aiohttp
+import numpy as np
+from typing import Any, Dict, List, Optional
+from mock_inference_server import PROFILES, MockInferenceServer, serve_in_thread
+
+DEFAULT_PROMPTS = [
+    "Write a python function that sums a list of values.",
+    "How does the retrieval orchestrator handle a slow source?",
+    "Explain what the context packer does with the token budget.",
+    "Implement a binary search in python.",
+    "Where is the knowledge graph built and how often is it refreshed?",
+    "What does the heartbeat service check on each pulse?",
+    "Write code to parse a CSV file and print the column sums.",
+    "Why would a chat reply be regenerated after streaming?",
+]
+QUANTILES = (50, 95, 99)
+TURN_TIMEOUT = 300
+
+def summarize(samples: List[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    return {f"p{q}": round(float(np.percentile(samples, q)), 1) for q in QUANTILES}
+
+async def chat_turn(ws, prompt: str) -> Dict[str, Any]:
+    """Sends one message and waits for its `done`; returns client-side and gateway timings."""
+    start = time.perf_counter()
+    first, chunks = None, 0
+    await ws.send_str(json.dumps({"message": prompt}))
+    while True:
+        msg = await ws.receive(timeout=TURN_TIMEOUT)
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            raise ConnectionError(f"Socket closed mid-turn ({msg.type})")
+        try:
+            data = json.loads(msg.data)
+        except json.JSONDecodeError:
+            continue # Plain-text notices
+        if data.get("chunk"):
+            chunks += 1
+            if first is None:
+                first = time.perf_counter() - start
+        elif data.get("error"):
+            raise RuntimeError(data["error"])
+        elif data.get("done"):
+            return {
+                "ttfc_ms": (first if first is not None else time.perf_counter() - start) * 1000,
+                "total_ms": (time.perf_counter() - start) * 1000,
+                "chunks": chunks,
+                "server": data.get("timings") or {}
+            }
+
+async def client(session: aiohttp.ClientSession, ws_url: str, prompts: List[str], offset: int, turns: int,
+                 results: List[Dict], errors: List[str]):
+    async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+        for i in range(turns):
+            try:
+                results.append(await chat_turn(ws, prompts[(offset + i) % len(prompts)]))
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+
+async def run_level(ws_url: str, prompts: List[str], n_clients: int, turns: int) -> Dict[str, Any]:
+    results: List[Dict] = []
+    errors: List[str] = []
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session, ws_url, prompts, c, turns, results, errors) for c in range(n_clients)])
+        wall = time.perf_counter() - start
+
+    stages: Dict[str, List[float]] = {}
+    sources: Dict[str, List[float]] = {}
+    missed: Dict[str, int] = {}
+    for r in results:
+        for name, ms in r["server"].get("stages", {}).items():
+            stages.setdefault(name, []).append(ms)
+        for name, ms in r["server"].get("sources", {}).items():
+            if ms is None:
+                missed[name] = missed.get(name, 0) + 1
+            else:
+                sources.setdefault(name, []).append(ms)
+    attempts = [r["server"]["attempts"] for r in results if r["server"].get("attempts")]
+    return {
+        "clients": n_clients,
+        "turns": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(len(results) / wall, 3) if wall else None,
+        "chunks_per_s": round(sum(r["chunks"] for r in results) / wall, 1) if wall else None,
+        "retry_rate": round(sum(a > 1 for a in attempts) / len(attempts), 3) if attempts else None,
+        "ttfc_ms": summarize([r["ttfc_ms"] for r in results]),
+        "total_ms": summarize([r["total_ms"] for r in results]),
+        "server_total_ms": summarize([r["server"]["total_ms"] for r in results if r["server"].get("total_ms")]),
+        "stages": {name: summarize(v) for name, v in sorted(stages.items())},
+        "sources": {name: summarize(v) for name, v in sorted(sources.items())},
+        "sources_missed": missed
+    }
+
+def print_level(level: Dict[str, Any]):
+    print(f"\n{level['clients']} client(s): {level['turns']} turns in {level['wall_s']}s, "
+          f"{level['turns_per_s']} turns/s, {level['chunks_per_s']} chunks/s, "
+          f"retry rate {level['retry_rate']}, errors {level['errors']}")
+    for sample in level["error_samples"]:
+        print(f"  ! {sample}")
+    print(f"  {'metric':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [("time to first chunk", level["ttfc_ms"]), ("turn (client)", level["total_ms"]),
+            ("turn (gateway)", level["server_total_ms"])]
+    rows += [(f"stage: {name}", v) for name, v in level["stages"].items()]
+    rows += [(f"source: {name}", v) for name, v in level["sources"].items()]
+    for label, stats in rows:
+        if stats:
+            print(f"  {label:<24}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Prints p50/p95 changes of each metric against a saved run, matched by client count."""
+    previous = {level["clients"]: level for level in baseline.get("levels", [])}
+    print(f"\nCompared with {baseline.get('meta', {}).get('commit', 'baseline')}:")
+    for level in current["levels"]:
+        base = previous.get(level["clients"])
+        if not base:
+            continue
+        print(f"  {level['clients']} client(s): turns/s {base['turns_per_s']} -> {level['turns_per_s']}")
+        metrics = [("ttfc", level["ttfc_ms"], base["ttfc_ms"]), ("turn", level["total_ms"], base["total_ms"])]
+        metrics += [(f"stage {k}", v, base["stages"].get(k)) for k, v in level["stages"].items()]
+        for label, now, before in metrics:
+            if now and before:
+                deltas = "  ".join(
+                    f"{q} {before[q]:.1f} -> {now[q]:.1f} ({(now[q] - before[q]) / before[q] * 100 if before[q] else 0:+.0f}%)"
+                    for q in ("p50", "p95")
+                )
+                print(f"    {label:<20}{deltas}")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+async def run(args):
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        with open(args.prompts) as f:
+            prompts = [line.strip() for line in f if line.strip()]
+
+    httpd = None
+    if not args.no_mock:
+        httpd = serve_in_thread(MockInferenceServer(profile=args.profile, parallel=args.parallel, seed=args.seed), port=args.mock_port)
+        print(f"Mock inference on :{args.mock_port} (profile {args.profile}, parallel {args.parallel})")
+    ws_url = args.gateway.replace("http", "ws", 1) + "/ws/chat"
+    print(f"Gateway: {ws_url}, {len(prompts)} prompts, {args.turns} turns per client")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "profile": None if args.no_mock else args.profile,
+            "parallel": args.parallel,
+            "turns_per_client": args.turns,
+            "prompts": len(prompts)
+        },
+        "levels": []
+    }
+    try:
+        if args.warmup:
+            await run_level(ws_url, prompts, 1, args.warmup)
+        for n_clients in args.clients:
+            level = await run_level(ws_url, prompts, n_clients, args.turns)
+            report["levels"].append(level)
+            print_level(level)
+    finally:
+        if httpd is not None:
+            httpd.should_exit = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0 if all(level["errors"] == 0 for level in report["levels"]) else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gateway", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 8], help="Concurrency levels")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per client at each level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unrecorded turns before the first level")
+    parser.add_argument("--prompts", help="Prompt corpus, one per line")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="phi3-m3")
+    parser.add_argument("--parallel", type=int, default=1, help="Concurrent generations in the mock")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mock-port", type=int, default=11435)
+    parser.add_argument("--no-mock", action="store_true", help="Don't start the mock inference server")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Earlier --json output to diff against")
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,113 @@
+"""
+Benchmarks cold knowledge graph builds (no cache) with 1..N parse processes.
+Reports wall time, files/s, speedup over one process and parallel efficiency,
+and checks every parallel build produces the same graph as the serial one.
+
+Usage:
+    python bench_graph.py                          # synthetic repo, 10k files
+    python bench_graph.py --files 50000 --workers 1 2 4 8 16
+    python bench_graph.py --root ..                # the real project
+"""
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from graph_engine import GRAPH_WORKERS, KnowledgeGraph
+
+def synthetic_python(rng: random.Random, module: int, n_modules: int) -> str:
+    """A module of a few classes and functions calling into its own and other modules."""
+    lines = ["import os", f"from pkg{rng.randrange(n_modules) // 100}.mod{rng.randrange(n_modules)} import helper_{rng.randrange(20)}", ""]
+    for c in range(rng.randint(1, 3)):
+        lines.append(f"class Service{module}_{c}:")
+        for m in range(rng.randint(2, 6)):
+            lines += [
+                f"    def method_{m}(self, value):",
+                f"        result = helper_{rng.randrange(20)}(value) + len(str(value))",
+                f"        if result > {rng.randrange(100)}:",
+                f"            return self.method_{rng.randrange(m + 1)}(result - 1)",
+                "        return os.path.join(str(result), 'x')",
+                ""
+            ]
+    for f in range(rng.randint(3, 10)):
+        lines += [
+            f"def helper_{f}(value):",
+            f"    \"\"\"Synthetic helper {module}.{f}.\"\"\"",
+            f"    total = sum(range(value % {rng.randint(5, 50)}))",
+            f"    return max(total, helper_{rng.randrange(f + 1)}(value - 1) if value > 0 else 0)",
+            ""
+        ]
+    return "\n".join(lines)
+
+def synthetic_c(rng: random.Random, module: int) -> str:
+    lines = ["#include <stdio.h>", f"#include \"mod{rng.randrange(module + 1)}.h\"", ""]
+    for f in range(rng.randint(3, 10)):
+        lines += [f"int func_{module}_{f}(int value) {{", f"    if (value > {rng.randrange(100)}) {{", "        return value - 1;",
+                  "    }", "    return printf(\"%d\\n\", value);", "}", ""]
+    return "\n".join(lines)
+
+def make_repo(root: str, n_files: int, c_share: float, seed: int):
+    rng = random.Random(seed)
+    for i in range(n_files):
+        directory = os.path.join(root, f"pkg{i // 100}")
+        os.makedirs(directory, exist_ok=True)
+        if rng.random() < c_share:
+            path, content = os.path.join(directory, f"mod{i}.c"), synthetic_c(rng, i)
+        else:
+            path, content = os.path.join(directory, f"mod{i}.py"), synthetic_python(rng, i, n_files)
+        with open(path, "w") as f:
+            f.write(content)
+
+def build(root: str, workers: int):
+    graph = KnowledgeGraph(root, cache_path=None)
+    start = time.perf_counter()
+    graph.build_graph(workers=workers)
+    return graph, time.perf_counter() - start
+
+def run(root: str, worker_counts, repeats: int):
+    baseline_graph, baseline = None, None
+    print(f"{'workers':>8}{'seconds':>10}{'files/s':>10}{'speedup':>10}{'efficiency':>12}")
+    for workers in worker_counts:
+        best, graph = float("inf"), None
+        for _ in range(repeats):
+            graph, elapsed = build(root, workers)
+            best = min(best, elapsed)
+        if baseline is None:
+            baseline_graph, baseline = graph, best
+        elif graph.graph != baseline_graph.graph:
+            print(f"{workers:>8}  graph differs from the {worker_counts[0]}-worker build!")
+            continue
+        files = graph.get_stats()["files"]
+        speedup = baseline / best
+        print(f"{workers:>8}{best:>10.2f}{files / best:>10.0f}{speedup:>10.2f}{speedup / workers * worker_counts[0]:>12.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000, help="Synthetic repo size")
+    parser.add_argument("--c-share", type=float, default=0.2, help="Fraction of synthetic files that are C")
+    parser.add_argument("--workers", type=int, nargs="+", help=f"Process counts (default 1, 2, 4 ... {GRAPH_WORKERS})")
+    parser.add_argument("--repeats", type=int, default=1, help="Builds per worker count (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--root", help="Benchmark an existing tree instead")
+    args = parser.parse_args()
+
+    worker_counts = args.workers
+    if not worker_counts:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 < GRAPH_WORKERS:
+            worker_counts.append(worker_counts[-1] * 2)
+        if GRAPH_WORKERS > 1:
+            worker_counts.append(GRAPH_WORKERS)
+
+    if args.root:
+        run(args.root, worker_counts, args.repeats)
+    else:
+        root = tempfile.mkdtemp(prefix="openclaw_graph_bench_")
+        try:
+            start = time.perf_counter()
+            make_repo(root, args.files, args.c_share, args.seed)
+            print(f"Synthetic repo: {args.files} files in {root} ({time.perf_counter() - start:.1f}s to generate)\n")
+            run(root, worker_counts, args.repeats)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
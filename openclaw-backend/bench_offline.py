@@ -0,0 +1,159 @@
+"""
+Benchmarks the LLM-backed paths against the mock inference server, so runs
+are reproducible without a model. The mock is started in-process unless
+--inference points at one already running (e.g. a --replay cassette).
+
+In-process targets (no gateway needed):
+    smart_fix   SandboxAgent.smart_fix on passing code and on code that never compiles
+    heartbeat   HeartbeatService.perform_scan plus its proactive suggestion
+    security    SecurityScanner.scan_file on a sample file
+
+Gateway target (start the gateway with OPENCLAW_INFERENCE_URL set to the mock):
+    fix         POST /tools/fix on a scratch copy of a file
+
+The chat pipeline has its own suite with per-stage timings: bench_chat.py.
+
+Usage:
+    python bench_offline.py                                    # in-process targets, phi3-m3 profile
+    python bench_offline.py --profile instant --runs 50
+    python bench_offline.py --targets fix --gateway http://localhost:8000
+"""
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import functools
+import tempfile
+import aiohttp
+import numpy as np
+from llm_client import LLMClient
+from llm_scheduler import Priority
+from model_router import ModelRouter
+from mock_inference_server import PROFILES, MockInferenceServer, serve_in_thread
+
+BROKEN_CODE = "def broken(:\n    return 1\n"
+PASSING_CODE = "def add(a, b):\n    return a + b\n\nassert add(2, 3) == 5\n"
+
+def percentile_ms(samples, q) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+def report(name: str, samples, extra: str = ""):
+    print(f"{name:<22}{len(samples):>6}{percentile_ms(samples, 50):>10.1f}{percentile_ms(samples, 95):>10.1f}"
+          f"{percentile_ms(samples, 99):>10.1f}  {extra}")
+
+async def timed(coro_fn, runs: int):
+    samples, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await coro_fn()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+def make_call_llm(llm: LLMClient):
+    """Same shape as the gateway's call_llm, bound per task with task_llm."""
+    async def call_llm(prompt: str, max_tokens: int = None, temperature: float = None,
+                       priority: int = Priority.USER, task: str = "default", sources=None):
+        return await llm.chat([{"role": "user", "content": prompt}], max_tokens=max_tokens,
+                              temperature=temperature, priority=priority, task=task, sources=sources)
+
+    def task_llm(task: str, priority: int = Priority.USER):
+        return functools.partial(call_llm, task=task, priority=priority)
+    return task_llm
+
+async def bench_smart_fix(task_llm, runs: int):
+    from sandbox_agent import SandboxAgent
+    agent = SandboxAgent(task_llm("sandbox"))
+    samples, result = await timed(lambda: agent.smart_fix(PASSING_CODE, "python"), runs)
+    report("smart_fix (passes)", samples, f"attempts={result.get('attempts')}")
+    samples, result = await timed(lambda: agent.smart_fix(BROKEN_CODE, "python"), runs)
+    report("smart_fix (3 retries)", samples, f"status={result['status']}")
+
+async def bench_heartbeat(llm: LLMClient, runs: int, project_root: str):
+    from heartbeat import HeartbeatService
+
+    async def broadcast(_):
+        pass
+
+    async def suggest(message: str):
+        await llm.chat([
+            {"role": "system", "content": "You are OpenClaw Proactive AI. Provide a concise 1-sentence fix for the issue."},
+            {"role": "user", "content": message}
+        ], max_tokens=100, priority=Priority.BACKGROUND, task="suggestion")
+
+    service = HeartbeatService(broadcast, suggest)
+    service.project_root = project_root
+    scans, pulse = await timed(service.perform_scan, runs)
+    report("heartbeat scan", scans, f"todos={len(pulse['high_priority_todos'])} quality={pulse['quality_score']}")
+    message = "Found 3 high-priority TODOs. Would you like me to implement them?"
+    samples, _ = await timed(lambda: suggest(message), runs)
+    report("heartbeat suggestion", samples)
+
+async def bench_security(task_llm, runs: int, path: str):
+    from security_scanner import SecurityScanner
+    scanner = SecurityScanner(task_llm("security", Priority.BACKGROUND))
+    samples, result = await timed(lambda: scanner.scan_file(path), runs)
+    report("security scan", samples, f"findings={len(result.get('findings', []))}")
+
+async def bench_fix(gateway: str, runs: int, path: str, use_sandbox: bool):
+    scratch_dir = tempfile.mkdtemp(prefix="openclaw_bench_")
+    scratch = os.path.join(scratch_dir, os.path.basename(path))
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def fix():
+                shutil.copy(path, scratch) # /tools/fix rewrites the file
+                async with session.post(f"{gateway}/tools/fix", json={"filepath": scratch, "use_sandbox": use_sandbox}) as resp:
+                    return resp.status
+            samples, status = await timed(fix, runs)
+        report("/tools/fix" + (" +sandbox" if use_sandbox else ""), samples, f"http={status}")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+async def run(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    httpd = None
+    inference = args.inference
+    if not inference:
+        server = MockInferenceServer(profile=args.profile, parallel=args.parallel)
+        httpd = serve_in_thread(server, port=args.port)
+        inference = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+    print(f"Inference: {inference} (profile {args.profile if httpd else 'external'}), {args.runs} runs per target\n")
+
+    llm = LLMClient(inference)
+    llm.router = ModelRouter({"fast": args.fast_model, "quality": args.quality_model, "code": args.code_model})
+    task_llm = make_call_llm(llm)
+    print(f"{'target':<22}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    try:
+        for target in args.targets:
+            if target == "smart_fix":
+                await bench_smart_fix(task_llm, args.runs)
+            elif target == "heartbeat":
+                await bench_heartbeat(llm, args.runs, os.path.dirname(here))
+            elif target == "security":
+                await bench_security(task_llm, args.runs, args.file)
+            elif target == "fix" and not args.gateway:
+                print(f"{target:<22}  skipped (needs --gateway)")
+            elif target == "fix":
+                await bench_fix(args.gateway, args.runs, args.file, args.sandbox)
+    finally:
+        await llm.close()
+        if httpd is not None:
+            httpd.should_exit = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", nargs="+", default=["smart_fix", "heartbeat", "security", "fix"],
+                        choices=["smart_fix", "heartbeat", "security", "fix"])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="phi3-m3", help="Latency profile of the in-process mock")
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--port", type=int, default=11435, help="Port for the in-process mock")
+    parser.add_argument("--inference", help="Use an already running server instead (chat completions URL)")
+    parser.add_argument("--gateway", help="Gateway base URL for the fix target, e.g. http://localhost:8000")
+    parser.add_argument("--file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "compiler.py"),
+                        help="File scanned by security and fixed by /tools/fix")
+    parser.add_argument("--sandbox", action="store_true", help="Verify /tools/fix results in the sandbox")
+    parser.add_argument("--fast-model", default="phi3:mini")
+    parser.add_argument("--quality-model", default="llama3.1:70b-instruct-q8_0")
+    parser.add_argument("--code-model", default="qwen2.5-coder:1.5b")
+    asyncio.run(run(parser.parse_args()))
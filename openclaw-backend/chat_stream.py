@@ -0,0 +1,95 @@
+import re
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Closed ```c / ```python fences, as in the chat verification step
+CODE_FENCE_PATTERN = re.compile(r"```(c|python)\n(.*?)```", re.DOTALL)
+
+class FenceVerifier:
+    """
+    Compile-checks code blocks while a reply is still streaming: each fence is
+    handed to `check_fn(code, lang) -> (success, error)` in a worker thread as
+    soon as its closing ``` arrives.
+    """
+
+    def __init__(self, check_fn: Callable[[str, str], Tuple[bool, str]]):
+        self.check_fn = check_fn
+        self.blocks: List[Tuple[str, str]] = []
+        self.checks: List[asyncio.Future] = []
+        self._scanned = 0 # Text before this offset has no open fence left to close
+
+    def feed(self, text: str):
+        """Schedules checks for fences closed since the last call. `text` is the full reply so far."""
+        for match in CODE_FENCE_PATTERN.finditer(text, self._scanned):
+            lang, code = match.group(1), match.group(2)
+            self.blocks.append((lang, code))
+            self.checks.append(asyncio.ensure_future(asyncio.to_thread(self._check, code, lang)))
+            self._scanned = match.end()
+
+    def _check(self, code: str, lang: str) -> Tuple[bool, str]:
+        try:
+            return self.check_fn(code, lang)
+        except Exception as e:
+            print(f"⚠️ Verification skipped ({lang}): {e}")
+            return True, ""
+
+    def failed(self) -> Optional[str]:
+        """First error among the checks finished so far (non-blocking)."""
+        for check in self.checks:
+            if check.done() and not check.cancelled():
+                success, error = check.result()
+                if not success:
+                    return error
+        return None
+
+    async def first_error(self) -> Optional[str]:
+        """Waits for the outstanding checks and returns the first error, if any."""
+        for check in self.checks:
+            success, error = await check
+            if not success:
+                return error
+        return None
+
+    def cancel(self):
+        for check in self.checks:
+            check.cancel()
+
+class TurnTimings:
+    """
+    Wall time per stage of one chat turn (retrieval, pack, prompt, inference,
+    send, verify), summed over retry attempts, plus time to first chunk.
+    Sent to the client with the turn's `done` message.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.sources: Dict[str, Optional[float]] = {} # Per retrieval source; None = missed its deadline
+        self.first_chunk_ms: Optional[float] = None
+        self.attempts = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, elapsed_ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def first_chunk(self):
+        if self.first_chunk_ms is None:
+            self.first_chunk_ms = (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "ttfc_ms": round(self.first_chunk_ms, 1) if self.first_chunk_ms is not None else None,
+            "attempts": self.attempts,
+            "stages": {name: round(ms, 1) for name, ms in self.stages.items()},
+            "sources": {name: round(ms, 1) if ms is not None else None for name, ms in self.sources.items()}
+        }
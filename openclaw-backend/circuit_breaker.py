@@ -0,0 +1,128 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Configuration
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("OPENCLAW_BREAKER_FAILURES", "3")) # Consecutive failures that trip it
+BREAKER_OPEN_SECONDS = 5.0       # First wait before probing a tripped backend
+BREAKER_MAX_OPEN_SECONDS = 60.0  # Wait doubles after each failed probe, up to this
+BREAKER_PROBE_TIMEOUT = 3.0
+
+class LLMUnavailable(Exception):
+    """The circuit breaker is open: the inference server is considered down."""
+
+class CircuitState:
+    CLOSED = "closed"       # Healthy: calls go through
+    OPEN = "open"           # Down: calls fail fast until the next probe
+    HALF_OPEN = "half_open" # Probing: one check decides between closed and open
+
+class CircuitBreaker:
+    """
+    Health tracking for the inference server. Consecutive connection errors,
+    timeouts and 5xx responses trip it open; while open every call fails fast
+    with LLMUnavailable instead of waiting out its timeout. After a cooldown it
+    goes half-open and probes the server with `probe_fn` (or, without one, lets
+    a single call through): success closes it, failure reopens it with a
+    doubled cooldown. `on_change(stats)` is called on every state change.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 max_open_seconds: float = BREAKER_MAX_OPEN_SECONDS,
+                 probe_fn: Optional[Callable[[], Awaitable[Any]]] = None,
+                 on_change: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_fn = probe_fn
+        self.on_change = on_change
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = open_seconds
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self._trial_inflight = False
+        self._probe_task: Optional[asyncio.Task] = None
+        self.stats = {"trips": 0, "rejected": 0, "probes": 0, "probe_failures": 0}
+
+    @property
+    def available(self) -> bool:
+        """False while open or probing: background work should be skipped, not queued."""
+        return self.state == CircuitState.CLOSED
+
+    def retry_in(self) -> float:
+        if self.state == CircuitState.CLOSED:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def check(self):
+        """Raises LLMUnavailable unless a call may go to the server now."""
+        if self.state == CircuitState.CLOSED:
+            return
+        if self.state == CircuitState.OPEN and self.probe_fn is None and self.retry_in() == 0:
+            self._set(CircuitState.HALF_OPEN) # No probe: the next call is the trial
+        if self.state == CircuitState.HALF_OPEN and self.probe_fn is None and not self._trial_inflight:
+            self._trial_inflight = True
+            return
+        self.stats["rejected"] += 1
+        raise LLMUnavailable(f"Inference server unavailable ({self.last_error}); retrying in {self.retry_in():.0f}s")
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._trial_inflight = False
+        if self.state != CircuitState.CLOSED:
+            self.cooldown = self.open_seconds
+            self._set(CircuitState.CLOSED)
+
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        self._trial_inflight = False
+        if self.state == CircuitState.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_open_seconds)
+            self._open()
+        elif self.state == CircuitState.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self.stats["trips"] += 1
+            self._open()
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._set(CircuitState.OPEN)
+        if self.probe_fn is not None and (self._probe_task is None or self._probe_task.done()):
+            try:
+                self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop())
+            except RuntimeError:
+                pass # No loop (sync caller): check() stays open until a probe can run
+
+    async def _probe_loop(self):
+        while self.state != CircuitState.CLOSED:
+            await asyncio.sleep(self.retry_in())
+            self._set(CircuitState.HALF_OPEN)
+            self.stats["probes"] += 1
+            try:
+                await asyncio.wait_for(self.probe_fn(), BREAKER_PROBE_TIMEOUT)
+            except Exception as e:
+                self.stats["probe_failures"] += 1
+                self.record_failure(f"probe: {type(e).__name__}: {e}")
+            else:
+                self.record_success()
+
+    def _set(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        print(f"🔌 Inference circuit {state.upper()}" + (f" ({self.last_error})" if state != CircuitState.CLOSED else ""))
+        if self.on_change:
+            try:
+                self.on_change(self.get_stats())
+            except Exception as e:
+                print(f"⚠️ Circuit state callback failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_s": round(self.retry_in(), 1),
+            "last_error": self.last_error,
+            **self.stats
+        }
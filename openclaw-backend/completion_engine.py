@@ -0,0 +1,280 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from llm_client import LLMClient, LLMError, LLMUnavailable
+from llm_scheduler import LLMOverloaded, Priority
+
+# Configuration
+PREFIX_CHARS = 1500  # Text before the cursor sent to the model
+SUFFIX_CHARS = 500   # Text after the cursor
+COMPLETION_TIMEOUT = 10
+COMPLETION_STOP = ["\n\n\n"]
+TRIE_CONTEXT_CHARS = 1024   # Text above the suggestion's line that must match for a local hit
+TRIE_MAX_LINES = 4          # A suggestion can be continued this many lines below where it was made
+TRIE_MAX_CONTEXTS = 256
+LATENCY_SAMPLES = 500
+
+# Fill-in-the-middle prompt formats, matched by substring of the model name
+FIM_TEMPLATES = {
+    "qwen2.5-coder": "<|fim_prefix|>{prefix}<|fim_suffix|>{suffix}<|fim_middle|>",
+    "codegemma": "<|fim_prefix|>{prefix}<|fim_suffix|>{suffix}<|fim_middle|>",
+    "starcoder": "<fim_prefix>{prefix}<fim_suffix>{suffix}<fim_middle>",
+    "deepseek-coder": "<｜fim▁begin｜>{prefix}<｜fim▁hole｜>{suffix}<｜fim▁end｜>",
+    "codellama": "<PRE> {prefix} <SUF>{suffix} <MID>",
+}
+
+def fim_template(model: str) -> Optional[str]:
+    for family, template in FIM_TEMPLATES.items():
+        if family in model:
+            return template
+    return None
+
+def cursor_window(code: str, cursor_line: int, cursor_column: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Splits `code` at the cursor (1-based line; column defaults to end of line)
+    and returns (prefix, suffix) trimmed to PREFIX_CHARS / SUFFIX_CHARS at line boundaries.
+    """
+    lines = code.split("\n")
+    index = max(0, min(cursor_line - 1, len(lines) - 1))
+    column = len(lines[index]) if cursor_column is None else max(0, min(cursor_column, len(lines[index])))
+    offset = sum(len(line) + 1 for line in lines[:index]) + column
+
+    prefix, suffix = code[:offset], code[offset:]
+    if len(prefix) > PREFIX_CHARS:
+        prefix = prefix[-PREFIX_CHARS:]
+        cut = prefix.find("\n")
+        if 0 <= cut < len(prefix) - 1:
+            prefix = prefix[cut + 1:]
+    if len(suffix) > SUFFIX_CHARS:
+        cut = suffix.rfind("\n", 0, SUFFIX_CHARS)
+        suffix = suffix[:cut if cut > 0 else SUFFIX_CHARS]
+    return prefix, suffix
+
+class _TrieNode:
+    __slots__ = ("children", "entry")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.entry: Optional[str] = None # Full text (anchor line + suggestion) this node lies on
+
+class SuggestionTrie:
+    """
+    Suggestions served earlier, so typing along one is answered locally. Each
+    suggestion is stored as a trie path: its line's text from the line start,
+    then the suggestion. Tries are keyed by (session, text above that line), so
+    a lookup walks the text typed since the line start and returns the rest of
+    the stored path.
+    """
+
+    def __init__(self, max_contexts: int = TRIE_MAX_CONTEXTS):
+        self.max_contexts = max_contexts
+        self._roots: "OrderedDict[Tuple[str, str], _TrieNode]" = OrderedDict()
+
+    @staticmethod
+    def _context_key(session: str, above: str) -> Tuple[str, str]:
+        return session, hashlib.sha1(above[-TRIE_CONTEXT_CHARS:].encode()).hexdigest()
+
+    def insert(self, session: str, prefix: str, suggestion: str):
+        line_start = prefix.rfind("\n") + 1
+        key = self._context_key(session, prefix[:line_start])
+        root = self._roots.get(key)
+        if root is None:
+            root = self._roots[key] = _TrieNode()
+            if len(self._roots) > self.max_contexts:
+                self._roots.popitem(last=False)
+        self._roots.move_to_end(key)
+
+        text = prefix[line_start:] + suggestion
+        anchor = len(text) - len(suggestion)
+        node = root
+        if anchor == 0:
+            root.entry = text
+        for depth, ch in enumerate(text, 1):
+            node = node.children.setdefault(ch, _TrieNode())
+            if depth >= anchor:
+                node.entry = text # Only positions from the suggestion's start on can answer
+
+    def lookup(self, session: str, prefix: str) -> Optional[str]:
+        """Remainder of a stored suggestion that `prefix` has typed partway into, or None."""
+        line_start = prefix.rfind("\n") + 1
+        for _ in range(TRIE_MAX_LINES):
+            node = self._roots.get(self._context_key(session, prefix[:line_start]))
+            typed = prefix[line_start:]
+            for ch in typed:
+                if node is None:
+                    break
+                node = node.children.get(ch)
+            if node is not None and node.entry and len(node.entry) > len(typed):
+                return node.entry[len(typed):]
+            if line_start == 0:
+                break
+            line_start = prefix.rfind("\n", 0, line_start - 1) + 1
+        return None
+
+class CompletionEngine:
+    """
+    Ghost-text completion. Sends a prefix/suffix window around the cursor to
+    a fill-in-the-middle model (chat prompt when the routed model has no FIM
+    format), cancels a session's in-flight request when a newer one arrives,
+    and serves continuations of earlier suggestions from a local trie.
+    Attributes (after `obj.`) and call arguments the project's symbols can
+    answer are served by `symbols` ahead of the model; for a bare identifier
+    the model still runs and the symbols are its fallback.
+    """
+
+    def __init__(self, llm: LLMClient, router, symbols=None):
+        self.llm = llm
+        self.router = router
+        self.symbols = symbols
+        self.trie = SuggestionTrie()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"requests": 0, "trie_hits": 0, "symbols": 0, "fim": 0, "chat": 0, "cancelled": 0, "errors": 0}
+        self._latencies: Dict[str, deque] = {}
+
+    async def complete(self, code: str, cursor_line: int, cursor_column: Optional[int] = None,
+                       language: str = "python", session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Returns {"completion", "source", "latency_ms"}; source is trie, symbols, fim,
+        chat, cancelled or error. Answers also carry "candidates" when symbols matched.
+        """
+        started = time.perf_counter()
+        self.stats["requests"] += 1
+        session = session_id or "default"
+        prefix, suffix = cursor_window(code, cursor_line, cursor_column)
+
+        previous = self._inflight.get(session)
+        if previous is not None and not previous.done():
+            previous.cancel() # The cursor moved on; its answer would be stale
+
+        local = self.trie.lookup(session, prefix)
+        if local:
+            return self._result(local, "trie", started)
+
+        symbol = self.symbols.complete(prefix, suffix) if self.symbols is not None else None
+        if symbol and symbol["context"] != "identifier":
+            return self._symbol_result(symbol, started)
+
+        task = asyncio.ensure_future(self._generate(prefix, suffix, language))
+        self._inflight[session] = task
+        try:
+            completion, source = await task
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise # Our own caller went away
+            self.stats["cancelled"] += 1
+            return self._result("", "cancelled", started)
+        except Exception as e:
+            print(f"Completion Error: {e}")
+            self.stats["errors"] += 1
+            if symbol:
+                return self._symbol_result(symbol, started)
+            return self._result("", "error", started)
+        finally:
+            if self._inflight.get(session) is task:
+                del self._inflight[session]
+
+        if not completion:
+            return self._symbol_result(symbol, started) if symbol else self._result("", source, started)
+        self.trie.insert(session, prefix, completion)
+        result = self._result(completion, source, started)
+        if symbol:
+            result["candidates"] = symbol["candidates"]
+        return result
+
+    async def _generate(self, prefix: str, suffix: str, language: str) -> Tuple[str, str]:
+        decision = await self.router.resolve("completion")
+        template = fim_template(decision["model"])
+        if template:
+            try:
+                return await self._run(decision, self._fim(template, prefix, suffix, decision)), "fim"
+            except LLMError as e:
+                if e.status not in (400, 404):
+                    raise
+                # Model missing or no /v1/completions: use the chat model instead
+                decision = await self.router.resolve("chat", decision["max_tokens"])
+                decision["task"] = "completion"
+        return await self._run(decision, self._chat(prefix, suffix, language, decision)), "chat"
+
+    async def _run(self, decision: Dict[str, Any], request) -> str:
+        started = time.perf_counter()
+        try:
+            text = await request
+        except (LLMOverloaded, LLMUnavailable):
+            raise # Never reached the model
+        except Exception:
+            self.router.record(decision, (time.perf_counter() - started) * 1000, ok=False)
+            raise
+        self.router.record(decision, (time.perf_counter() - started) * 1000, ok=True)
+        return text.rstrip()
+
+    def _fim(self, template: str, prefix: str, suffix: str, decision: Dict[str, Any]):
+        return self.llm.complete(
+            template.format(prefix=prefix, suffix=suffix),
+            model=decision["model"],
+            max_tokens=decision["max_tokens"],
+            temperature=0.1,
+            stop=COMPLETION_STOP,
+            timeout=COMPLETION_TIMEOUT,
+            retries=0, # A stale completion is worthless; the next keystroke asks again
+            priority=Priority.INTERACTIVE
+        )
+
+    def _chat(self, prefix: str, suffix: str, language: str, decision: Dict[str, Any]):
+        prompt = (
+            f"Complete the following {language} code at <CURSOR>. "
+            "Return ONLY the code that goes at the cursor. "
+            "Do not repeat the input. Do not wrap in markdown.\n\n"
+            f"{prefix}<CURSOR>{suffix}"
+        )
+        return self.llm.chat(
+            [
+                {"role": "system", "content": "You are a code completion engine. Output ONLY code."},
+                {"role": "user", "content": prompt}
+            ],
+            model=decision["model"],
+            max_tokens=decision["max_tokens"],
+            temperature=0.1,
+            stop=["\n\n", "```"],
+            timeout=COMPLETION_TIMEOUT,
+            retries=0,
+            priority=Priority.INTERACTIVE,
+            semantic_cache=False # A near-identical prefix still needs its own continuation
+        )
+
+    async def prewarm(self):
+        """Loads the completion model so the router doesn't treat it as cold."""
+        model = self.router.preferred_model("completion")
+        template = fim_template(model)
+        if template:
+            await self.llm.complete(template.format(prefix="", suffix=""), model=model, max_tokens=1,
+                                    timeout=120, retries=0, keep_alive=-1)
+
+    def _result(self, completion: str, source: str, started: float) -> Dict[str, Any]:
+        latency_ms = (time.perf_counter() - started) * 1000
+        if source in ("symbols", "fim", "chat"):
+            self.stats[source] += 1
+        if source == "trie":
+            self.stats["trie_hits"] += 1
+        self._latencies.setdefault(source, deque(maxlen=LATENCY_SAMPLES)).append(latency_ms)
+        return {"completion": completion, "source": source, "latency_ms": round(latency_ms, 1)}
+
+    def _symbol_result(self, symbol: Dict[str, Any], started: float) -> Dict[str, Any]:
+        return {**self._result(symbol["completion"], "symbols", started), "candidates": symbol["candidates"]}
+
+    def get_stats(self) -> Dict[str, Any]:
+        latency = {}
+        served: List[float] = []
+        for source, samples in self._latencies.items():
+            ordered = sorted(samples)
+            latency[source] = {"p50_ms": round(ordered[len(ordered) // 2], 1), "count": len(ordered)}
+            if source != "cancelled":
+                served.extend(samples)
+        served.sort()
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "p50_ms": round(served[len(served) // 2], 1) if served else None,
+            "latency": latency
+        }
@@ -0,0 +1,105 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Configuration
+CHARS_PER_TOKEN = 4 # Rough estimate for code + English with Llama/Phi tokenizers
+MODEL_CONTEXT_WINDOWS = {"phi3:mini": 4096}
+MAX_CONTEXT_TOKENS = int(os.environ.get("OPENCLAW_MAX_CONTEXT_TOKENS", "1200")) # Keeps time-to-first-token low
+MIN_PARTIAL_TOKENS = 120  # Smallest useful truncated excerpt
+DUPLICATE_OVERLAP = 0.6   # Share of an excerpt's shingles already packed that makes it a duplicate
+SHINGLE_WORDS = 5
+
+# Per-source trust, multiplied into each candidate's relevance (0..1)
+SOURCE_WEIGHTS = {"code": 1.0, "rag": 0.9, "lore": 0.8, "snippets": 0.7, "preferences": 0.6}
+SOURCE_HEADERS = {
+    "code": "Relevant Local Code Context:",
+    "snippets": "Recall from Previous Successes (Memory):",
+    "preferences": "Relevant User Preferences & Project Decisions:",
+    "lore": "Relevant Project Lore (Architectural Decisions):",
+    "rag": "[RAG Document Context]:"
+}
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def context_budget(n_ctx: int, model: str, prompt_tokens: int, completion_tokens: int) -> int:
+    """Tokens left for retrieved context once the prompt and the answer are accounted for."""
+    window = min(n_ctx, MODEL_CONTEXT_WINDOWS.get(model, n_ctx))
+    return max(0, min(MAX_CONTEXT_TOKENS, window - prompt_tokens - completion_tokens))
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+class ContextPacker:
+    """
+    Collects context candidates from every retrieval source and packs the most
+    valuable ones into a token budget: near-duplicates are dropped, then items are
+    taken greedily by value per token (value = source weight x relevance). The last
+    item that doesn't fit whole is truncated at a line boundary if enough room remains.
+    """
+
+    def __init__(self):
+        self.candidates: List[Dict] = []
+
+    def add(self, source: str, text: str, relevance: float, citation: Optional[Dict] = None):
+        text = text.strip()
+        if not text:
+            return
+        value = SOURCE_WEIGHTS.get(source, 0.5) * max(0.0, min(1.0, relevance))
+        self.candidates.append({
+            "source": source,
+            "text": text,
+            "value": value,
+            "tokens": estimate_tokens(text) + 1, # + separator
+            "citation": citation
+        })
+
+    def _deduplicate(self) -> List[Dict]:
+        kept, seen = [], set()
+        for candidate in sorted(self.candidates, key=lambda c: -c["value"]):
+            shingles = _shingles(candidate["text"])
+            if shingles and len(shingles & seen) / len(shingles) >= DUPLICATE_OVERLAP:
+                continue
+            seen |= shingles
+            kept.append(candidate)
+        return kept
+
+    def pack(self, budget_tokens: int) -> Tuple[str, List[Dict]]:
+        """Returns (context string, citations of the packed items)."""
+        remaining = budget_tokens
+        packed: Dict[str, List[str]] = {}
+        citations = []
+        candidates = self._deduplicate()
+        candidates.sort(key=lambda c: -c["value"] / c["tokens"])
+
+        for candidate in candidates:
+            source = candidate["source"]
+            header_tokens = 0 if source in packed else estimate_tokens(SOURCE_HEADERS.get(source, "")) + 2
+            text = candidate["text"]
+            cost = candidate["tokens"] + header_tokens
+            if cost > remaining:
+                room = remaining - header_tokens
+                if room < MIN_PARTIAL_TOKENS:
+                    continue
+                text = self._truncate(text, room)
+                cost = estimate_tokens(text) + 1 + header_tokens
+            packed.setdefault(source, []).append(text)
+            remaining -= cost
+            if candidate["citation"]:
+                citations.append(candidate["citation"])
+
+        sections = []
+        for source in SOURCE_WEIGHTS:
+            if source in packed:
+                sections.append(SOURCE_HEADERS[source] + "\n" + "\n---\n".join(packed[source]))
+        return "\n\n".join(sections), citations
+
+    @staticmethod
+    def _truncate(text: str, tokens: int) -> str:
+        limit = max(0, tokens - 2) * CHARS_PER_TOKEN
+        cut = text.rfind("\n", 0, limit)
+        return text[:cut if cut > limit // 2 else limit] + "\n..."
@@ -0,0 +1,250 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+# Configuration
+MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_DIMENSIONS = {"all-MiniLM-L6-v2": 384} # Known sizes: no model load just to allocate arrays
+BATCH_WINDOW_MS = float(os.environ.get("OPENCLAW_EMBED_BATCH_WINDOW_MS", "5")) # Wait for company after the first request
+MAX_BATCH_SIZE = int(os.environ.get("OPENCLAW_EMBED_MAX_BATCH", "64"))        # Texts per model call
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+QUERY_CACHE_SIZE = int(os.environ.get("OPENCLAW_QUERY_CACHE_SIZE", "1024")) # Query embeddings kept (~1.5 KB each)
+QUERY_CACHE_TTL = float(os.environ.get("OPENCLAW_QUERY_CACHE_TTL", "900"))  # Seconds
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query embeddings keyed by (model, normalized text), with a TTL."""
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict" = OrderedDict() # key -> (expires_at, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model_name: str, text: str):
+        return (model_name, " ".join(text.split()))
+
+    def get(self, key) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key] # Expired
+            self.misses += 1
+            return None
+
+    def put(self, key, embedding: np.ndarray):
+        embedding.setflags(write=False) # Shared between callers
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+class EmbeddingService:
+    """
+    Process-wide sentence-embedding model, shared by the code indexer and every
+    Chroma store. The model is loaded on first use. Concurrent `encode` calls are
+    coalesced by a worker thread into batches of up to `max_batch_size` texts
+    collected within `batch_window_ms`. Embeddings are L2-normalized.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue() # (texts, Future)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.load_seconds = None
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.direct_calls = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.query_cache = QueryEmbeddingCache()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    print(f"Loading embedding model: {self.model_name}...")
+                    start = time.time()
+                    self._model = SentenceTransformer(self.model_name)
+                    self.load_seconds = time.time() - start
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dimension(self) -> int:
+        if self.model_name in MODEL_DIMENSIONS and not self.loaded:
+            return MODEL_DIMENSIONS[self.model_name]
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        """Returns a (len(texts), dim) float32 matrix of normalized embeddings. Blocking."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        if len(texts) >= self.max_batch_size:
+            # Bulk jobs (index builds, ingestion) are already batched
+            with self._stats_lock:
+                self.direct_calls += 1
+            return self._encode(texts, show_progress_bar)
+        return self._submit(texts).result()
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """Non-blocking `encode` for the event loop."""
+        texts = list(texts)
+        if not texts or len(texts) >= self.max_batch_size:
+            return await asyncio.to_thread(self.encode, texts)
+        return await asyncio.wrap_future(self._submit(texts))
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embedding of a search query, served from the query cache when possible. Read-only."""
+        key = QueryEmbeddingCache.key(self.model_name, text)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.encode([key[1]])[0].copy() # Don't pin the whole batch
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    def _encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        embeddings = np.asarray(
+            self.model.encode(texts, batch_size=self.max_batch_size, show_progress_bar=show_progress_bar),
+            dtype=np.float32
+        )
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+    def _submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        self._queue.put((texts, future))
+        with self._stats_lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        self._ensure_worker()
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.batch_window
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = self._encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self._record_batch(len(texts))
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def _record_batch(self, size: int):
+        with self._stats_lock:
+            self.batches += 1
+            self.texts += size
+            bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+            self.batch_sizes[bucket] += 1
+
+    def embedding_function(self) -> "SharedEmbeddingFunction":
+        return SharedEmbeddingFunction(self)
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "loaded": self.loaded,
+                "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0,
+                "batch_size_histogram": {f"<={b}": n for b, n in self.batch_sizes.items()},
+                "direct_calls": self.direct_calls,
+                "query_cache": self.query_cache.get_stats()
+            }
+
+class SharedEmbeddingFunction:
+    """Chroma `embedding_function` adapter backed by the shared service."""
+
+    def __init__(self, service: EmbeddingService):
+        self.service = service
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.service.encode(input).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Cached query embedding, for `collection.query(query_embeddings=[...])`."""
+        return self.service.embed_query(text).tolist()
+
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+def get_embedding_service(model_name: str = MODEL_NAME) -> EmbeddingService:
+    """Returns the process-wide service for `model_name` (created without loading the model)."""
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name)
+        return _services[model_name]
+
+embedding_service = get_embedding_service()
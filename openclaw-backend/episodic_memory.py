@@ -1,6 +1,6 @@
 import sqlite3
 import chromadb
-from chromadb.utils import embedding_functions
+from embedding_service import embedding_service
 import time
 import os
 import json
@@ -16,7 +16,7 @@ class EpisodicMemory:
         
         # Initialize ChromaDB
         self.client = chromadb.PersistentClient(path=vector_db_path)
-        self.emb_fn = embedding_functions.DefaultEmbeddingFunction()
+        self.emb_fn = embedding_service.embedding_function()
         self.collection = self.client.get_or_create_collection(
             name="episodic_logs",
             embedding_function=self.emb_fn
@@ -77,7 +77,7 @@ class EpisodicMemory:
     def search_episodes(self, query: str, n_results: int = 3) -> List[Dict]:
         """Semantically searches for related episodes."""
         results = self.collection.query(
-            query_texts=[query],
+            query_embeddings=[self.emb_fn.embed_query(query)],
             n_results=n_results
         )
         
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, WebSocket, Request, HTTPException, UploadFile, File
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, UploadFile, File
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -7,9 +7,10 @@ import time
 import json
 import os
 import shutil
+import functools
+from collections import OrderedDict
 from typing import List, Dict, Any
 import aiofiles  # Optimized I/O
-import aiohttp
 
 
 from memory import Memory
@@ -29,6 +30,7 @@ from heartbeat import HeartbeatService
 from observer import Observer, observer
 import observer as observer_module
 from rag_system import rag_system
+from embedding_service import embedding_service
 from deadlock_detector import DeadlockDetector
 
 import whisper # Add whisper import here for typing if needed, but it's lazy loaded.
@@ -62,7 +64,6 @@ active_connections: List[WebSocket] = []
 LAST_ACTIVITY_TIME = time.time()
 ACTIVE_FILE_PATH = None
 
-GLOBAL_PROJECT_CONTEXT = ""
 peripheral_mon = None
 PENDING_GREETING = None
 
@@ -77,11 +78,49 @@ PROMPT_TUNING = {
 # Build Graph on Startup (Async)
 @app.on_event("startup")
 async def startup_event():
-    global GLOBAL_PROJECT_CONTEXT
-    print("🕸️ Building Knowledge Graph...")
-    project_graph.build_graph()
-    GLOBAL_PROJECT_CONTEXT = project_graph.get_project_map()
-    print("🔥 Warming up KV Cache...")
+    global knowledge_graph_task
+
+    # Off the event loop: the server accepts connections while the graph loads. With a
+    # warm cache only files changed since the last run are parsed.
+    async def build_knowledge_graph():
+        print("🕸️ Building Knowledge Graph...")
+        try:
+            await asyncio.to_thread(project_graph.build_graph)
+            stats = project_graph.get_stats()
+            print(f"🕸️ Knowledge Graph Ready: {stats['files']} files ({stats['parsed']} parsed) in {stats['build_ms']:.0f}ms")
+        except Exception as e:
+            print(f"⚠️ Knowledge Graph Build Failed: {e}")
+        prompt_builder.update_project_map(project_graph.files_snapshot())
+        asyncio.create_task(build_symbol_table())
+
+    # Qualified symbols and call edges, so the first callers/impact query doesn't wait for them.
+    # Separate from the graph task: saves don't wait for it (the table catches up by itself)
+    async def build_symbol_table():
+        try:
+            await asyncio.to_thread(project_graph.symbol_table)
+            print(f"🕸️ Symbol Table Ready: {project_graph.get_stats()['symbols']}")
+        except Exception as e:
+            print(f"⚠️ Symbol Table Build Failed: {e}")
+    knowledge_graph_task = asyncio.create_task(build_knowledge_graph())
+
+    async def open_snippet_memory():
+        global memory_db
+        memory_db = await asyncio.to_thread(Memory)
+    asyncio.create_task(open_snippet_memory())
+
+    # Sync the code index with files changed while the gateway was down, then build
+    # the symbol completion tier from it and the graph
+    async def build_code_models():
+        if not await asyncio.to_thread(indexer.load_index):
+            print("Warning: No index found. Please run indexer.py directly to build it.")
+        await refresh_code_index()
+        await knowledge_graph_task
+        try:
+            await asyncio.to_thread(lambda: symbol_completer.build(project_graph.graph, indexer.chunk_texts()))
+            print(f"🔤 Symbol Completion Ready ({len(symbol_completer.vocab)} identifiers).")
+        except Exception as e:
+            print(f"⚠️ Symbol Completion Build Failed: {e}")
+    asyncio.create_task(build_code_models())
     
     # Phase AT: Start Voice Engine in Background
     try:
@@ -104,21 +143,15 @@ async def startup_event():
 
     asyncio.create_task(memory_monitor())
 
-    # Pre-warm CHAT_MODEL (phi3:mini) so it's loaded and ready before first user message
+    # Pre-warm the chat model with the prompt prefix so the first message skips loading and prefill
     async def prewarm_chat_model():
+        await asyncio.sleep(5)  # Let uvicorn finish starting
+        await knowledge_graph_task  # The prefix includes the project map
+        await prewarm_prompt_prefix()
         try:
-            await asyncio.sleep(5)  # Let uvicorn finish starting
-            import requests as _req
-            print(f"⚡ Pre-warming {CHAT_MODEL} for instant chat responses...")
-            resp = _req.post(INFERENCE_URL, json={
-                "model": CHAT_MODEL,
-                "messages": [{"role": "user", "content": "ping"}],
-                "max_tokens": 1,
-                "keep_alive": -1  # Keep model loaded in memory forever
-            }, timeout=60)
-            print(f"⚡ {CHAT_MODEL} warm — status {resp.status_code}")
+            await completion_engine.prewarm()
         except Exception as e:
-            print(f"⚡ Pre-warm skipped: {e}")
+            print(f"⚡ Completion model pre-warm skipped: {e}")
     asyncio.create_task(prewarm_chat_model())
 
     # Phase BM: Episodic Memory Greeting
@@ -143,7 +176,7 @@ async def startup_event():
                     f"Mention the specific context to show you remember using specific technical details from the context."
                 )
                 
-                greeting = await call_llm(prompt, max_tokens=150)
+                greeting = await call_llm(prompt, max_tokens=150, priority=Priority.BACKGROUND, task="greeting")
                 
                 # Fallback if LLM fails
                 if greeting.startswith("Error") or "cannot connect" in greeting.lower():
@@ -165,25 +198,19 @@ async def startup_event():
     # Phase AX: Heartbeat Service
     async def trigger_proactive_suggestion(suggestion_msg: str):
         """Generates an AI suggestion based on heartbeat trigger and broadcasts it."""
+        if not llm.available:
+            return # Inference is down: skip rather than queue
         try:
             # We fetch a quick AI fix or strategy for the detected issue
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "messages": [
-                        {"role": "system", "content": "You are OpenClaw Proactive AI. Provide a concise 1-sentence fix for the issue."},
-                        {"role": "user", "content": suggestion_msg}
-                    ],
-                    "max_tokens": 100
-                }
-                async with session.post(INFERENCE_URL, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        ai_suggestion = data['choices'][0]['message']['content'].strip()
-                        await broadcast_system_event({
-                            "type": "proactive_suggestion",
-                            "severity": "info",
-                            "text": ai_suggestion
-                        })
+            ai_suggestion = await llm.chat([
+                {"role": "system", "content": "You are OpenClaw Proactive AI. Provide a concise 1-sentence fix for the issue."},
+                {"role": "user", "content": suggestion_msg}
+            ], max_tokens=100, priority=Priority.BACKGROUND, task="suggestion")
+            await broadcast_system_event({
+                "type": "proactive_suggestion",
+                "severity": "info",
+                "text": ai_suggestion.strip()
+            })
         except Exception as e:
             print(f"⚠️ Proactive Suggestion Failed: {e}")
 
@@ -195,17 +222,17 @@ async def startup_event():
     print("👁️ Observer Module Activated.")
 
     # Phase BA: Deadlock Detector
-    deadlock_module.detector = DeadlockDetector(broadcast_system_event, call_llm)
+    deadlock_module.detector = DeadlockDetector(broadcast_system_event, task_llm("deadlock", Priority.BACKGROUND))
     await deadlock_module.detector.start()
 
     # Phase BC: Agent Engine
     global agent_engine
-    agent_engine = get_agent_engine(call_llm)
+    agent_engine = get_agent_engine(task_llm("agent"))
     print("🤖 Agent Engine Online.")
 
     # Phase BS: Sandbox Agent
     import sandbox_agent as sb_module
-    sb_module.sandbox_agent = SandboxAgent(call_llm)
+    sb_module.sandbox_agent = SandboxAgent(task_llm("sandbox"))
     print("📦 Sandbox Agent Online (Docker-Ready).")
 
     # Phase BD: Memory System
@@ -219,12 +246,12 @@ async def startup_event():
     print("📜 Lore Engine Online.")
 
     # Phase BH: Security Scanner
-    security_module.security_scanner = SecurityScanner(call_llm)
+    security_module.security_scanner = SecurityScanner(task_llm("security", Priority.BACKGROUND))
     print("💓 System Heartbeat Active.")
     asyncio.create_task(heartbeat_loop())
 
     # Phase BJ: Reasoning Engine
-    reasoning_module.reasoning_engine = ReasoningEngine(call_llm)
+    reasoning_module.reasoning_engine = ReasoningEngine(task_llm("reasoning"))
     print("🧠 Reasoning Engine Online.")
 
     # Phase BL: Peripheral Monitor
@@ -236,8 +263,12 @@ async def startup_event():
         print(f"🔔 File Update: {path}")
         asyncio.run_coroutine_threadsafe(broadcast_file_update(path, has_error, msg), loop)
 
+    def code_file_callback(path: str):
+        # Edits made outside the editor (git, other tools) update the graph too
+        asyncio.run_coroutine_threadsafe(sync_code_file(path), loop)
+
     try:
-        peripheral_mon = PeripheralMonitor(".", monitor_callback)
+        peripheral_mon = PeripheralMonitor(".", monitor_callback, code_callback=code_file_callback)
         peripheral_mon.start()
         print("👀 Peripheral Monitor Started.")
     except Exception as e:
@@ -260,8 +291,9 @@ async def broadcast_file_update(path: str, has_error: bool, msg: str):
             print(f"Broadcast Error: {e}")
 
 @app.get("/tools/graph")
-async def query_graph(type: str, target: str):
-    return project_graph.query(type, target)
+async def query_graph(type: str, target: str, to: str = None, depth: int = None):
+    # In a thread: the first qualified query may have to build the symbol table
+    return await asyncio.to_thread(project_graph.query, type, target, to, depth)
 
 @app.get("/graph/dependencies")
 async def get_dependency_graph():
@@ -284,11 +316,49 @@ async def get_system_status():
         "project": {
             "functions_indexed": len(project_graph.graph['functions']),
             "active_files": len(project_graph.graph.get('files', [])),
+            "graph_version": project_graph.version,
             "high_capacity_mode": context_manager.high_capacity_active,
             "context_tokens": context_manager.current_context
-        }
+        },
+        "embeddings": embedding_service.get_stats(),
+        "retrieval": retrieval_orchestrator.get_stats(),
+        "llm": llm.get_stats(),
+        "prompt": prompt_builder.get_stats(),
+        "completion": completion_engine.get_stats(),
+        "symbols": symbol_completer.get_stats(),
+        "graph": project_graph.get_stats()
     }
 
+class RouteUpdate(BaseModel):
+    task: str = None                # Route to create or change
+    tier: str = None
+    max_tokens: int = None
+    latency_budget_ms: int = None
+    fallback: str = None            # Tier name, or "none" to disable fallback
+    model: str = None               # With `tier` and no `task`: points the tier at another model
+
+@app.get("/router")
+async def get_router():
+    """Routing table (task -> tier, budgets), tier models and per-route latency stats."""
+    return router.get_stats()
+
+@app.post("/router")
+async def update_router(update: RouteUpdate):
+    """Changes a route or re-points a tier at runtime."""
+    if update.task:
+        changes = {k: v for k, v in update.dict().items() if k not in ("task", "model") and v is not None}
+        if changes.get("fallback") == "none":
+            changes["fallback"] = None # Pin the route to its tier
+        try:
+            route = router.configure(update.task, **changes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"status": "success", "task": update.task, "route": route}
+    if update.tier and update.model:
+        router.set_tier(update.tier, update.model)
+        return {"status": "success", "tiers": router.tiers}
+    raise HTTPException(status_code=400, detail="Provide a task to configure, or a tier and model")
+
 class RetrieveDeletedRequest(BaseModel):
     filepath: str
     query: str
@@ -320,7 +390,7 @@ async def fix_file_cli(request: FixRequest):
         prompt = f"Analyze and fix any bugs in this file. Return ONLY the corrected code.\n\nFile: {request.filepath}\nContent:\n{content}"
         
         # 1. Get Initial Fix
-        fixed_code = await call_llm(prompt) # Using internal helper or direct call logic
+        fixed_code = await call_llm(prompt, task="fix")
         # Clean markdown
         if fixed_code.strip().startswith("```"):
             lines = fixed_code.strip().split('\n')
@@ -364,39 +434,16 @@ async def fix_file_cli(request: FixRequest):
 class CompletionRequest(BaseModel):
     code: str
     language: str
-    cursor_line: int # 0-indexed for backend logic if needed, but usually just context suffices
+    cursor_line: int           # 1-based, as reported by the editor
+    cursor_column: int = None  # 0-based; defaults to the end of the line
+    session_id: str = None     # Editor instance: a newer request cancels its older one
     
 @app.post("/tools/completion")
 async def get_completion(request: CompletionRequest):
-    """Low-latency code completion for Ghost Text."""
-    try:
-        # Construct a prompt optimized for completion
-        prompt = (
-            f"Complete the following {request.language} code. "
-            "Return ONLY the completion code that follows the cursor. "
-            "Do not repeat the input. Do not wrap in markdown.\n\n"
-            f"{request.code}"
-        )
-
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "messages": [
-                    {"role": "system", "content": "You are a code completion engine. Output ONLY code."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.1, # Low temp for deterministic completion
-                "max_tokens": 64,   # Short generation for speed
-                "stop": ["\n\n", "```"] # Stop at block ends
-            }
-            async with session.post(INFERENCE_URL, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    completion = data['choices'][0]['message']['content']
-                    return {"completion": completion}
-                return {"completion": ""}
-    except Exception as e:
-        print(f"Completion Error: {e}")
-        return {"completion": ""}
+    """Low-latency code completion for Ghost Text (fill-in-the-middle around the cursor)."""
+    return await completion_engine.complete(
+        request.code, request.cursor_line, request.cursor_column, request.language, request.session_id
+    )
 
 class StructureRequest(BaseModel):
     code: str
@@ -413,8 +460,6 @@ class DescRequest(BaseModel):
 
 @app.post("/tools/docs")
 async def create_docs(request: DescRequest):
-    async with aiohttp.ClientSession(): # Keep import happy if needed or remove
-         pass
     try:
         from doc_engine import doc_agent
         if doc_agent:
@@ -477,14 +522,215 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Indexer
-from indexer import get_indexer
-indexer = get_indexer()
-# indexer.build_index() # Optional: Rebuild on startup if needed, or rely on persisted index
+# Code Indexer: loaded on startup (build_code_models), not at import. Spawned graph
+# workers re-import the main module, and must not map the index each time
+from indexer import CodeIndexer, INDEX_ROOT
+indexer = CodeIndexer()
+
+INDEX_SAVE_DELAY = 30.0 # Quiet seconds after an index change before it's written to disk
+_index_save_task = None
+
+async def refresh_code_index(filepath: str = None):
+    """Incrementally re-indexes the workspace (or a single saved file) off the event loop."""
+    try:
+        if filepath:
+            await asyncio.to_thread(indexer.update_file, filepath)
+        else:
+            await asyncio.to_thread(indexer.refresh, INDEX_ROOT)
+        if indexer.dirty:
+            schedule_index_save()
+    except Exception as e:
+        print(f"⚠️ Code Index Refresh Failed: {e}")
+
+def schedule_index_save():
+    """Persists the index once edits settle; saving rewrites the whole index, so a burst of saves costs one write."""
+    global _index_save_task
+    if _index_save_task is not None and not _index_save_task.done():
+        _index_save_task.cancel()
 
-INFERENCE_URL = "http://localhost:11434/v1/chat/completions" # Local Ollama Proxy
+    async def save():
+        await asyncio.sleep(INDEX_SAVE_DELAY)
+        try:
+            await asyncio.to_thread(indexer.save_if_dirty)
+        except Exception as e:
+            print(f"⚠️ Code Index Save Failed: {e}")
+    _index_save_task = asyncio.ensure_future(save())
+
+# Snippet Memory (compiled-successfully code blocks); opened on startup, like the indexer
+memory_db = None
+
+# --- Retrieval Sources (run concurrently by the orchestrator, in worker threads) ---
+from retrieval import retrieval_orchestrator
+from context_packer import ContextPacker, context_budget, estimate_tokens
+from chat_stream import FenceVerifier, TurnTimings
+from prompt_builder import prompt_builder
+
+def _retrieve_code(query: str):
+    return indexer.search(query, top_k=2)
+
+def _retrieve_snippets(query: str):
+    return memory_db.search(query, n_results=1) if memory_db else []
+
+def _retrieve_preferences(query: str):
+    return memory_module.memory_system.get_context_string() if memory_module.memory_system else ""
+
+def _retrieve_lore(query: str):
+    return lore_module.lore_engine.search_lore(query) if lore_module.lore_engine else []
+
+def _retrieve_rag(query: str):
+    return rag_system.search(query, n_results=3)
+
+retrieval_orchestrator.register("code", _retrieve_code, deadline_ms=300)
+retrieval_orchestrator.register("snippets", _retrieve_snippets, deadline_ms=250)
+retrieval_orchestrator.register("preferences", _retrieve_preferences, deadline_ms=100)
+retrieval_orchestrator.register("lore", _retrieve_lore, deadline_ms=250)
+retrieval_orchestrator.register("rag", _retrieve_rag, deadline_ms=300)
+
+INFERENCE_URL = os.environ.get("OPENCLAW_INFERENCE_URL", "http://localhost:11434/v1/chat/completions") # Local Ollama (or mock_inference_server.py)
 CHAT_MODEL    = "phi3:mini"                   # Fast model for interactive chat (2.2GB)
+CHAT_MAX_TOKENS = 2048                        # Answer budget; the rest of the 4K window is prompt + context
+MAX_RETRIES   = 2                             # Self-correction attempts when generated code fails to compile
 BRIEF_MODEL   = "llama3.1:70b-instruct-q8_0" # High-quality model for briefings & summaries
+FIM_MODEL     = os.environ.get("OPENCLAW_FIM_MODEL", "qwen2.5-coder:1.5b") # Fill-in-the-middle model for ghost text
+
+OLLAMA_PS_URL = INFERENCE_URL.split("/v1/")[0] + "/api/ps" # Models currently resident in memory
+
+# One pooled keep-alive client for every call to the inference server
+from llm_client import LLMClient, LLMError
+from llm_scheduler import Priority, LLMOverloaded
+from circuit_breaker import CircuitBreaker, CircuitState, LLMUnavailable, BREAKER_PROBE_TIMEOUT
+from model_router import ModelRouter
+from response_cache import ResponseCache, SEMANTIC_CACHE
+response_cache = ResponseCache(embed_fn=embedding_service.embed_query if SEMANTIC_CACHE else None)
+
+async def probe_inference():
+    """Any HTTP answer means the server is back; only connection errors and 5xx keep the breaker open."""
+    try:
+        await llm.get(OLLAMA_PS_URL, timeout=BREAKER_PROBE_TIMEOUT)
+    except LLMError as e:
+        if e.status >= 500:
+            raise
+
+def on_inference_state(state: Dict[str, Any]):
+    """Tells the UI when inference goes down or comes back; a recovered server gets its prefix re-warmed."""
+    asyncio.ensure_future(broadcast_system_event({"type": "inference_state", **state}))
+    if state["state"] == CircuitState.CLOSED:
+        asyncio.ensure_future(prewarm_prompt_prefix())
+
+# Fails calls fast while the inference server is down instead of letting each wait out its timeout
+inference_breaker = CircuitBreaker(probe_fn=probe_inference, on_change=on_inference_state)
+llm = LLMClient(INFERENCE_URL, cache=response_cache, breaker=inference_breaker)
+
+async def ollama_loaded_models():
+    data = await llm.get(OLLAMA_PS_URL, timeout=2)
+    return [m.get("name") or m.get("model") for m in data.get("models", [])]
+
+# Each call site names its task; the router maps it to a model tier and budgets
+WARM_KEEP_ALIVE = "30m" # How long a model the router loaded on demand stays resident once idle
+
+async def warm_model(model: str):
+    """Loads a model a route found cold; until it's resident the route uses its fallback tier."""
+    await llm.chat([{"role": "user", "content": "ping"}], model=model, max_tokens=1, timeout=600,
+                   retries=0, priority=Priority.BACKGROUND, keep_alive=WARM_KEEP_ALIVE)
+
+router = ModelRouter({"fast": CHAT_MODEL, "quality": BRIEF_MODEL, "code": FIM_MODEL},
+                     loaded_models_fn=ollama_loaded_models, warm_fn=warm_model)
+llm.router = router
+
+from completion_engine import CompletionEngine
+from symbol_completer import symbol_completer
+completion_engine = CompletionEngine(llm, router, symbols=symbol_completer)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await llm.close()
+    project_graph.save_cache() # Edits made this session: the next start doesn't re-parse them
+    if _index_save_task is not None:
+        _index_save_task.cancel()
+    await asyncio.to_thread(indexer.save_if_dirty) # Index changes still waiting on the save debounce
+
+async def prewarm_prompt_prefix():
+    """Sends the current chat prefix once so the server loads the model and caches the prefix's KV state."""
+    version = prompt_builder.version
+    model = router.preferred_model("chat")
+    print(f"🔥 Warming {model} with prompt prefix {version} ({prompt_builder.prefix_tokens} tokens)...")
+    started = time.perf_counter()
+    try:
+        await llm.chat(
+            prompt_builder.warmup_messages(),
+            model=model,
+            max_tokens=1,
+            timeout=120,
+            keep_alive=-1  # Keep model loaded in memory forever
+        )
+        prompt_builder.record_prewarm(version, (time.perf_counter() - started) * 1000)
+        print(f"🔥 Prefix {version} warm")
+    except Exception as e:
+        print(f"🔥 Pre-warm skipped: {e}")
+
+PREFIX_REWARM_DELAY = 10.0 # Quiet seconds after a project map change before the new prefix is warmed
+_prefix_rewarm_task = None
+
+def refresh_prompt_prefix():
+    """Re-warms the prefix once edits settle; a burst of saves (e.g. a git checkout) costs one warm-up."""
+    global _prefix_rewarm_task
+    if _prefix_rewarm_task is not None and not _prefix_rewarm_task.done():
+        _prefix_rewarm_task.cancel()
+
+    async def rewarm():
+        await asyncio.sleep(PREFIX_REWARM_DELAY)
+        if llm.available:
+            await prewarm_prompt_prefix()
+    _prefix_rewarm_task = asyncio.ensure_future(rewarm())
+
+knowledge_graph_task = None # Startup build; saves wait for it so the build can't overwrite their update
+SYNCED_FILES_MAX = 4096 # Recently synced files remembered for save/watcher dedup
+_synced_files: "OrderedDict[str, Any]" = OrderedDict() # abs path -> (mtime_ns, size) last synced
+
+async def sync_code_file(filepath: str):
+    """
+    Brings everything derived from one saved, edited or deleted file up to date:
+    knowledge graph (and the prompt's project map), symbol completion, code index
+    and cached answers. A save and the watcher event it causes are handled once
+    (a repeated delete finds nothing left to remove).
+    """
+    path = os.path.abspath(filepath)
+    try:
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None
+    if key is None:
+        _synced_files.pop(path, None)
+    elif _synced_files.get(path) == key:
+        _synced_files.move_to_end(path)
+        return
+    else:
+        _synced_files[path] = key
+        _synced_files.move_to_end(path)
+        if len(_synced_files) > SYNCED_FILES_MAX:
+            _synced_files.popitem(last=False)
+
+    if project_graph.tracks(path):
+        if knowledge_graph_task is not None:
+            await knowledge_graph_task
+        try:
+            if await asyncio.to_thread(project_graph.update_file, path):
+                if prompt_builder.update_project_map(project_graph.files_snapshot()):
+                    refresh_prompt_prefix()
+            if key is None:
+                symbol_completer.remove_file(path)
+            else:
+                async with aiofiles.open(path, mode='r', errors='ignore') as f:
+                    content = await f.read()
+                await asyncio.to_thread(symbol_completer.update_file, path, content)
+        except Exception as e:
+            print(f"⚠️ Graph Update Failed for {filepath}: {e}")
+
+    # Keep the code index current (only this file's changed chunks are re-embedded)
+    await refresh_code_index(path)
+    # Cached answers about the old content are stale now
+    await asyncio.to_thread(response_cache.invalidate_source, path)
 
 # --- Hardware Vitals ---
 from monitor import monitor
@@ -539,7 +785,8 @@ async def heartbeat_loop():
     while True:
         await asyncio.sleep(10) # Check every 10s
         if time.time() - LAST_ACTIVITY_TIME > 60: # 60s inactivity
-            if ACTIVE_FILE_PATH and security_module.security_scanner:
+            # While inference is down the audit waits; activity isn't reset, so it runs after recovery
+            if ACTIVE_FILE_PATH and security_module.security_scanner and llm.available:
                 print(f"💓 Heartbeat: Auditing {ACTIVE_FILE_PATH}...")
                 report = await security_module.security_scanner.scan_file(ACTIVE_FILE_PATH)
                 if report.get("findings"):
@@ -705,15 +952,18 @@ async def save_file_post(request: FileFixRequest):
         async with aiofiles.open(request.filepath, mode='w') as f:
             await f.write(request.content)
             
-        # Phase BG: Lore Extraction
-        if lore_module.lore_engine:
+        # Graph, project map, symbols, code index and cached answers follow the new content
+        asyncio.create_task(sync_code_file(request.filepath))
+
+        # Phase BG: Lore Extraction (background LLM work is skipped while inference is down)
+        if lore_module.lore_engine and llm.available:
             diff_summary = f"Updated {os.path.basename(request.filepath)} with user-requested changes."
             asyncio.create_task(lore_module.lore_engine.extract_lore_from_diff(
-                request.filepath, diff_summary, call_llm
+                request.filepath, diff_summary, task_llm("lore", Priority.BACKGROUND)
             ))
 
         # Trigger Autonomous Testing (Phase AQ)
-        if request.filepath.endswith((".py", ".c")):
+        if request.filepath.endswith((".py", ".c")) and llm.available:
             from test_engine import test_agent
             if test_agent:
                 asyncio.create_task(test_agent.cycle(
@@ -854,25 +1104,33 @@ async def search_files(q: str):
     except Exception as e:
         return {"error": str(e), "results": []}
 
-async def call_llm(prompt: str, max_tokens: int = 2048):
-    """Internal helper to call the local LLM (via Ollama)."""
-    import requests as _requests
-    def _sync_call():
-        try:
-            payload = {
-                "model": "llama3.1:70b-instruct-q8_0",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_tokens
-            }
-            resp = _requests.post(INFERENCE_URL, json=payload, timeout=180)
-            if resp.status_code == 200:
-                return resp.json()['choices'][0]['message']['content']
-            else:
-                return f"Error: LLM returned {resp.status_code}: {resp.text[:200]}"
-        except Exception as e:
-            return f"Error connecting to LLM: {type(e).__name__}: {e}"
+async def call_llm(prompt: str, max_tokens: int = None, temperature: float = None, priority: int = Priority.USER,
+                   task: str = "default", sources: List[str] = None):
+    """
+    Internal helper to call the local LLM (via Ollama) through the pooled client, routed by task.
+    Low-temperature answers are cached; `sources` are the files the prompt was built from.
+    """
+    try:
+        return await llm.chat(
+            [{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            priority=priority,
+            task=task,
+            sources=sources
+        )
+    except LLMOverloaded as e:
+        return f"Error: LLM busy: {e}"
+    except LLMUnavailable as e:
+        return f"Error: {e}"
+    except LLMError as e:
+        return f"Error: LLM returned {e.status}: {e.body[:200]}"
+    except Exception as e:
+        return f"Error connecting to LLM: {type(e).__name__}: {e}"
 
-    return await asyncio.to_thread(_sync_call)
+def task_llm(task: str, priority: int = Priority.USER):
+    """call_llm bound to a routing task. Agents reacting to saves and timers pass Priority.BACKGROUND."""
+    return functools.partial(call_llm, task=task, priority=priority)
 
 
 @app.post("/tools/autodoc")
@@ -932,7 +1190,7 @@ async def get_morning_brief():
             "Start with 'Good morning.' or 'Welcome back.'"
         )
         
-        briefing = await call_llm(prompt, max_tokens=512)
+        briefing = await call_llm(prompt, max_tokens=512, task="briefing")
         return {"briefing": briefing}
 
     except Exception as e:
@@ -1009,10 +1267,16 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.send_text(json.dumps(PENDING_GREETING))
         PENDING_GREETING = None
     
+    # Messages are read by a separate task so a "stop" can interrupt a streaming reply
+    inbox: asyncio.Queue = asyncio.Queue()
+    turn = {"cancel": asyncio.Event()}
+    reader = asyncio.create_task(read_chat_messages(websocket, inbox, turn))
+
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await inbox.get()
+            if message_data is None:
+                break # Disconnected
             
             # Handle Actions (like Apply Fix from Diff Modal)
             if message_data.get("type") == "apply_fix":
@@ -1044,18 +1308,11 @@ async def websocket_endpoint(websocket: WebSocket):
                 # Add recent history if available (simplified here)
                 # In a real app, we'd append the last N messages of context.
                 
-                def _sync_summary():
-                        import requests as _req
-                        r = _req.post(INFERENCE_URL, json={
-                            "model": CHAT_MODEL,
-                            "messages": conversation_messages,
-                            "max_tokens": 512,
-                            "keep_alive": -1
-                        }, timeout=60)
-                        if r.status_code == 200:
-                            return r.json()['choices'][0]['message']['content']
-                        return None
-                summary = await asyncio.to_thread(_sync_summary)
+                try:
+                    summary = await llm.chat(conversation_messages, max_tokens=512, timeout=60, keep_alive=-1, task="summary")
+                except Exception as e:
+                    print(f"Summary Error: {e}")
+                    summary = None
                 if summary:
                     await websocket.send_text(json.dumps({"type": "summary", "content": summary}))
                 else:
@@ -1067,6 +1324,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
             if not user_message:
                 continue
+            timings = TurnTimings()
 
             # --- Slash Command Handling (Phase AO) ---
             if user_message.startswith("/"):
@@ -1097,170 +1355,197 @@ async def websocket_endpoint(websocket: WebSocket):
                         "Focus on Metal acceleration, vectorization (SIMD), and memory management."
                     )
                 
-            # Context Injection
+            # Context Injection: candidates from every source, packed into the token budget
+            packer = ContextPacker()
             context_str = ""
             citations = []
             try:
+                # All sources run concurrently off the event loop; late ones are dropped
+                with timings.stage("retrieval"):
+                    retrieved = await retrieval_orchestrator.retrieve(user_message)
+                timings.sources = retrieved.timings
+                pack_started = time.perf_counter()
+
                 # 1. Codebase Search
-                relevant_chunks = indexer.search(user_message, top_k=2)
-                if relevant_chunks:
-                    context_blocks = []
-                    for res, score in relevant_chunks:
-                        if score > 0.3:
-                            context_blocks.append(f"File: {res.get('path', 'unknown')}\nContent:\n{res.get('content', '')}")
-                    if context_blocks:
-                        context_str += "\n\nRelevant Local Code Context:\n" + "\n---\n".join(context_blocks)
-                
-                # 2. Memory Search
-                if memory_db:
-                    memory_hits = memory_db.search(user_message, n_results=1)
-                    if memory_hits:
-                        context_str += "\n\nRecall from Previous Successes (Memory):\n"
-                        for hit in memory_hits:
-                             context_str += f"```\n{hit['code']}\n```\n"
-
-                # 3. Human-Assistant Memory (Phase BD)
-                if memory_module.memory_system:
-                    memory_context = memory_module.memory_system.get_context_string()
-                    if memory_context:
-                        context_str += f"\n\n{memory_context}"
-                
+                for res, score in retrieved.get("code") or []:
+                    # Fused ranking: keep keyword matches and semantically close chunks
+                    if res.get('bm25') or (res.get('similarity') or 0) > 0.3:
+                        location = f"{res.get('path', 'unknown')}:{res.get('start_line')}-{res.get('end_line')}"
+                        symbol = f" ({res['symbol']})" if res.get('symbol') else ""
+                        packer.add("code", f"File: {location}{symbol}\nContent:\n{res.get('content', '')}", score, citation={
+                            "filename": res.get('path', 'unknown'),
+                            "chunk_index": res.get('chunk_id', 0),
+                            "symbol": res.get('symbol'),
+                            "start_line": res.get('start_line'),
+                            "end_line": res.get('end_line'),
+                            "content": res.get('content', '')[:200] + "...",
+                            "distance": 1 - score
+                        })
+
+                # 2. Memory Search (no scores: ranked by position)
+                for rank, hit in enumerate(retrieved.get("snippets") or []):
+                    packer.add("snippets", f"```\n{hit['code']}\n```", 0.6 - 0.1 * rank)
+
+                # 3. Human-Assistant Memory (Phase BD), one candidate per preference
+                preferences = [line for line in (retrieved.get("preferences") or "").split("\n") if line.startswith("- ")]
+                for rank, line in enumerate(preferences):
+                    packer.add("preferences", line, 0.5 - 0.02 * rank)
+
                 # 4. Project Lore (Phase BG)
-                if lore_module.lore_engine:
-                    lore_hits = lore_module.lore_engine.search_lore(user_message)
-                    if lore_hits:
-                        context_str += "\n\nRelevant Project Lore (Architectural Decisions):\n"
-                        for hit in lore_hits:
-                            context_str += f"- {hit['description']}\n"
+                for rank, hit in enumerate(retrieved.get("lore") or []):
+                    packer.add("lore", f"- {hit['description']}", 0.6 - 0.1 * rank)
 
                 # 5. RAG Document Search (Phase CB)
-                rag_hits = rag_system.search(user_message, n_results=3)
-                if rag_hits:
-                    context_str += "\n\n[RAG Document Context]:\n"
-                    for hit in rag_hits:
-                        filename = hit['metadata'].get('filename', 'Unknown')
-                        chunk_idx = hit['metadata'].get('chunk_index', 0)
-                        distance = hit.get('distance', 0)
-                        
-                        # Only include relevant hits
-                        if distance is not None and distance < 1.0: # Chroma distances are small if similar
-                            context_str += f"--- Excerpt from {filename} (Chunk {chunk_idx}) ---\n{hit['content']}\n"
-                            citations.append({
-                                "filename": filename,
-                                "chunk_index": chunk_idx,
-                                "content": hit['content'][:200] + "...", # Snippet for the badge hover
-                                "distance": distance
-                            })
+                for hit in retrieved.get("rag") or []:
+                    filename = hit['metadata'].get('filename', 'Unknown')
+                    chunk_idx = hit['metadata'].get('chunk_index', 0)
+                    distance = hit.get('distance', 0)
+
+                    # Only include relevant hits
+                    if distance is not None and distance < 1.0: # Chroma distances are small if similar
+                        packer.add("rag", f"--- Excerpt from {filename} (Chunk {chunk_idx}) ---\n{hit['content']}", 1.0 - distance, citation={
+                            "filename": filename,
+                            "chunk_index": chunk_idx,
+                            "content": hit['content'][:200] + "...", # Snippet for the badge hover
+                            "distance": distance
+                        })
+
+                prompt_tokens = prompt_builder.prefix_tokens + estimate_tokens(user_message)
+                budget = context_budget(context_manager.current_context, router.preferred_model("chat"), prompt_tokens, CHAT_MAX_TOKENS)
+                context_str, citations = packer.pack(budget)
+                timings.add("pack", (time.perf_counter() - pack_started) * 1000)
 
             except Exception as e:
                 print(f"Context error: {e}")
 
-            # Send Citations Payload to UI (Phase CB)
+            # Send Citations Payload to UI (Phase CB): only what actually reached the prompt
             if citations:
                 await websocket.send_text(json.dumps({"type": "citations", "data": citations}))
 
-            # --- Compact system prompt (phi3:mini has 4K context) ---
-            # Keep system msg under ~300 tokens; attach only the most relevant context snippet
-            system_message_content = (
-                "You are OpenClaw, an AI coding assistant running on Apple M3 Max hardware.\n"
-                "Be helpful, concise, and accurate. When writing code, prefer Python unless asked otherwise.\n"
-            )
-
-            # Append only the single best RAG/codebase hit, hard-capped at 800 chars
-            if context_str:
-                trimmed = context_str[:800]
-                system_message_content += f"\nRelevant context:\n{trimmed}\n"
-
-            conversation_messages = [
-                {"role": "system", "content": system_message_content},
-                {"role": "user", "content": user_message}
-            ]
+            with timings.stage("prompt"):
+                # Stable prefix (system prompt + project map) first, per-turn context last
+                conversation_messages = prompt_builder.build(user_message, context_str)
 
             final_response_content = ""
+            stopped = False
+            turn["cancel"] = asyncio.Event()
 
-
-            import requests as _requests
             for attempt in range(MAX_RETRIES + 1):
-                    # Notify Status
-                    if attempt > 0:
-                        await websocket.send_text(json.dumps({"status": f"Compiler Error Detected. Self-Correcting (Attempt {attempt}/{MAX_RETRIES})..."}))
-                    else:
-                        await websocket.send_text(json.dumps({"status": "Thinking & Verifying..."}))
-
-                    payload = {
-                        "model": CHAT_MODEL,
-                        "messages": conversation_messages,
-                        "stream": False, 
-                        "max_tokens": 2048,
-                        "keep_alive": -1
-                    }
-                    
+                timings.attempts = attempt + 1
+                # Notify Status
+                if attempt > 0:
+                    await websocket.send_text(json.dumps({"status": f"Compiler Error Detected. Self-Correcting (Attempt {attempt}/{MAX_RETRIES})..."}))
+                else:
+                    await websocket.send_text(json.dumps({"status": "Thinking & Verifying..."}))
+
+                payload = {
+                    "messages": conversation_messages,
+                    "max_tokens": CHAT_MAX_TOKENS,
+                    "keep_alive": -1
+                }
+                # Code fences are compiled as they close; a failure ends the attempt early
+                verifier = FenceVerifier(compiler_agent.check_code)
+                stream_task = asyncio.create_task(stream_reply(websocket, payload, verifier, fail_fast=attempt < MAX_RETRIES, timings=timings))
+                stop_task = asyncio.create_task(turn["cancel"].wait())
+                await asyncio.wait({stream_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+                stop_task.cancel()
+
+                if not stream_task.done():
+                    # Stop message or disconnect: closing the stream aborts generation upstream
+                    stream_task.cancel()
                     try:
-                        def _do_inference(p):
-                            return _requests.post(INFERENCE_URL, json=p, timeout=180)
-                        response = await asyncio.to_thread(_do_inference, payload)
-                        if response.status_code != 200:
-                            await websocket.send_text(json.dumps({"error": f"Inference error: {response.status_code}: {response.text[:200]}"}))
-                            break 
-                        
-                        resp_json = response.json()
-                        if not resp_json or not resp_json.get('choices'):
-                            await websocket.send_text(json.dumps({"error": "Invalid response from LLM"}))
-                            break
-                        
-                        content = resp_json['choices'][0]['message']['content']
-                        conversation_messages.append({"role": "assistant", "content": content})
+                        await stream_task
+                    except (asyncio.CancelledError, Exception):
+                        pass
+                    verifier.cancel()
+                    stopped = True
+                    break
 
-                        # Code Verification
-                        code_blocks = re.findall(r"```(c|python)\n(.*?)```", content, re.DOTALL)
-                        compile_error = None
-                        
-                        if code_blocks:
-                            all_passed = True
-                            for lang, code in code_blocks:
-                                success, error = compiler_agent.check_code(code, lang)
-                                if not success:
-                                    compile_error = error
-                                    all_passed = False
-                                    break
-                            
-                            if all_passed and memory_db:
-                                for lang, code in code_blocks:
-                                    memory_db.add(code, lang, tags=["compiled_success"])
-                                    file_match = re.search(r"//\s*file:\s*(.+)", code)
-                                    if file_match:
-                                        target_path = file_match.group(1).strip()
-                                        save_snapshot(target_path, code)
-                        
-                        if compile_error and attempt < MAX_RETRIES:
-                            print(f"Verification Failed: {compile_error}")
-                            conversation_messages.append({"role": "system", "content": f"The code you provided failed to compile/lint with error:\n{compile_error}\nPlease fix it."})
-                            continue 
-                        
-                        final_response_content = content
-                        break 
+                try:
+                    content = stream_task.result()
+                    with timings.stage("verify"): # Only the wait left after the stream; most checks overlap it
+                        compile_error = await verifier.first_error()
+                except Exception as e:
+                    print(f"Loop Error: {type(e).__name__}: {e}")
+                    await websocket.send_text(json.dumps({"error": f"{type(e).__name__}: {e}"}))
+                    break
 
-                    except Exception as e:
-                        print(f"Loop Error: {type(e).__name__}: {e}")
-                        await websocket.send_text(json.dumps({"error": f"{type(e).__name__}: {e}"}))
-                        break
-            
-            # Stream Final Response
-            if final_response_content:
-                chunk_size = 20
-                for i in range(0, len(final_response_content), chunk_size):
-                    await websocket.send_text(json.dumps({"chunk": final_response_content[i:i+chunk_size]}))
-                    await asyncio.sleep(0.005)
-                
-                await websocket.send_text(json.dumps({"done": True}))
+                conversation_messages.append({"role": "assistant", "content": content})
+
+                if compile_error and attempt < MAX_RETRIES:
+                    print(f"Verification Failed: {compile_error}")
+                    await websocket.send_text(json.dumps({"type": "stream_reset"}))
+                    conversation_messages.append({"role": "system", "content": f"The code you provided failed to compile/lint with error:\n{compile_error}\nPlease fix it."})
+                    continue
+
+                if verifier.blocks and not compile_error and memory_db:
+                    for lang, code in verifier.blocks:
+                        memory_db.add(code, lang, tags=["compiled_success"])
+                        file_match = re.search(r"//\s*file:\s*(.+)", code)
+                        if file_match:
+                            target_path = file_match.group(1).strip()
+                            save_snapshot(target_path, code)
+
+                final_response_content = content
+                break
+
+            if final_response_content or stopped:
+                await websocket.send_text(json.dumps({"done": True, "stopped": stopped, "timings": timings.to_dict()}))
 
     except Exception as e:
         print(f"WebSocket Error: {e}")
     finally:
+        reader.cancel()
         if websocket in active_connections:
             active_connections.remove(websocket)
             print("🔌 Client disconnected")
 
+async def read_chat_messages(websocket: WebSocket, inbox: asyncio.Queue, turn: Dict):
+    """Feeds client messages to the chat loop; {"type": "stop"} and disconnects cancel the current reply."""
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message_data = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if message_data.get("type") == "stop":
+                turn["cancel"].set()
+            else:
+                await inbox.put(message_data)
+    except Exception:
+        # WebSocketDisconnect or a broken socket
+        turn["cancel"].set()
+        await inbox.put(None)
+
+async def stream_reply(websocket: WebSocket, payload: Dict, verifier: FenceVerifier, fail_fast: bool,
+                       timings: TurnTimings = None) -> str:
+    """Forwards the model's tokens to the client as they arrive; returns the full reply."""
+    content = ""
+    started = time.perf_counter()
+    sending = 0.0
+    stream = llm.stream(payload, task="chat")
+    try:
+        async for delta in stream:
+            content += delta
+            send_started = time.perf_counter()
+            await websocket.send_text(json.dumps({"chunk": delta}))
+            sending += time.perf_counter() - send_started
+            if timings:
+                timings.first_chunk()
+            if "`" in delta:
+                verifier.feed(content)
+                if fail_fast and verifier.failed():
+                    break # This reply will be regenerated; stop paying for it
+    finally:
+        await stream.aclose() # Drops the connection, so generation stops upstream
+        if timings:
+            # Inference is the stream's wall time minus what we spent writing to the socket
+            timings.add("inference", (time.perf_counter() - started - sending) * 1000)
+            timings.add("send", sending * 1000)
+    verifier.feed(content)
+    return content
+
 # --- Terminal Endpoint (Phase W) ---
 import re
 
@@ -1453,25 +1738,20 @@ async def voice_socket(websocket: WebSocket):
                         
                         system_prompt = "You are OpenClaw Voice-to-Code. The user will dictate code intent. Output ONLY syntactically valid code matching their spoken request. Do not include markdown codeblocks, docstrings, or explanations—just the raw exact code. If they say 'create a function that returns hello world', output: `def hello_world():\n    return 'hello world'` (without backticks)."
                         
-                        payload = {
-                            "messages": [
+                        try:
+                            raw_code = await llm.chat([
                                 {"role": "system", "content": system_prompt},
                                 {"role": "user", "content": text}
-                            ],
-                            "stream": False,
-                            "max_tokens": 1024
-                        }
-                        
-                        async with aiohttp.ClientSession() as session:
-                            async with session.post(INFERENCE_URL, json=payload) as response:
-                                if response.status == 200:
-                                    resp_json = await response.json()
-                                    raw_code = resp_json['choices'][0]['message']['content']
-                                    # Strip backticks if the LLM leaked them
-                                    clean_code = raw_code.replace("```python", "").replace("```c", "").replace("```", "").strip()
-                                    await websocket.send_json({"transcript": text, "code": clean_code})
-                                else:
-                                    await websocket.send_json({"error": f"LLM Inference failed: {response.status}"})
+                            ], max_tokens=1024, priority=Priority.INTERACTIVE, task="voice")
+                            # Strip backticks if the LLM leaked them
+                            clean_code = raw_code.replace("```python", "").replace("```c", "").replace("```", "").strip()
+                            await websocket.send_json({"transcript": text, "code": clean_code})
+                        except LLMOverloaded as e:
+                            await websocket.send_json({"transcript": text, "error": f"LLM busy: {e}"})
+                        except LLMUnavailable as e:
+                            await websocket.send_json({"transcript": text, "error": str(e)})
+                        except LLMError as e:
+                            await websocket.send_json({"error": f"LLM Inference failed: {e.status}"})
                                     
                     except sr.UnknownValueError:
                         await websocket.send_json({"error": "Could not understand audio."})
@@ -1,96 +1,410 @@
 
 import ast
+import gc
 import os
 import re
-from typing import Dict, List, Any
+import time
+import pickle
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+from symbol_table import SymbolTable, module_name
+from graph_parser import parse_file, scan_source, _scan_batch
+
+GRAPH_EXTENSIONS = (".py", ".c", ".h")
+SKIP_DIRS = {"venv", "node_modules", "__pycache__", "dist"} # As the indexer's SKIP_MARKERS
+GRAPH_CACHE_FILE = "graph_cache.pkl" # Per-file parse records, keyed by (mtime, size, content hash)
+GRAPH_CACHE_VERSION = 2              # Bump when parse records change so saved caches are re-parsed
+GRAPH_WORKERS = int(os.environ.get("OPENCLAW_GRAPH_WORKERS", "0")) or os.cpu_count() or 1 # Parse processes for cold builds
+GRAPH_PARALLEL_MIN_FILES = 1000 # Fewer files than this are parsed in-process: pool start-up would cost more
+GRAPH_FILES_PER_WORKER = 250    # Spawning a worker costs ~100ms, about 30-50 parses: each must get far more
+GRAPH_BATCH_FILES = 64          # Files per worker task: amortizes IPC while keeping the tail short
+
+@contextmanager
+def _gc_paused():
+    """Bulk loads allocate ~10 objects per call edge; collections triggered midway only re-scan them."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def scan_sources(batch: List[Tuple[str, Optional[str]]], workers: int = GRAPH_WORKERS) -> List[tuple]:
+    """
+    scan_source over many files, fanned out to a process pool in chunks when
+    there are enough of them (ast.parse holds the GIL, so threads wouldn't help).
+    Results are in input order. Falls back to in-process if the pool can't run.
+    Workers are spawned, never forked (the gateway calls this from a thread of a
+    threaded process), and only import graph_parser.
+    """
+    workers = min(workers, len(batch) // GRAPH_FILES_PER_WORKER)
+    if workers <= 1 or len(batch) < GRAPH_PARALLEL_MIN_FILES:
+        return _scan_batch(batch)
+    chunks = [batch[i:i + GRAPH_BATCH_FILES] for i in range(0, len(batch), GRAPH_BATCH_FILES)]
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [result for chunk in pool.map(_scan_batch, chunks) for result in chunk]
+    except Exception as e:
+        print(f"⚠️ Parallel parse unavailable, parsing in-process: {e}")
+        return _scan_batch(batch)
 
 class KnowledgeGraph:
-    def __init__(self, root_dir: str):
+    """
+    Functions, imports and call edges of the project's Python and C files.
+    Each file's parse is kept as a record, so a changed file is re-parsed and
+    swapped in (its old functions, imports and edges retracted) without a
+    rebuild. `called_by` is maintained from a reverse call index, and
+    `version` increases on every change. Records are persisted to
+    `cache_path`, so a restart only re-parses files that changed meanwhile.
+    Qualified symbols and transitive call queries live in a SymbolTable,
+    built from the records on first use and updated with them.
+    """
+
+    def __init__(self, root_dir: str, cache_path: Optional[str] = GRAPH_CACHE_FILE):
         self.root_dir = os.path.abspath(root_dir)
+        self.cache_path = cache_path
         self.graph = {
-            "functions": {}, # name -> {defined_in, calls: [], called_by: []}
+            "functions": {}, # name -> {defined_in, line, calls: [], called_by: []}
             "variables": {}, # name -> {modified_in: []}
             "files": {}      # path -> {functions: [], imports: []}
         }
+        self.records: Dict[str, Dict[str, Any]] = {} # rel path -> parse record
+        self._definers: Dict[str, Dict[str, None]] = {} # function name -> files defining it (set; the last path wins)
+        self._callers: Dict[str, Dict[str, int]] = {} # callee name -> caller name -> call sites
+        self._file_keys: Dict[str, Tuple[int, int, str]] = {} # rel path -> (mtime_ns, size, sha1) of the parsed content
+        self._cache_dirty = False
+        self.version = 0
+        self._lock = threading.RLock()
+        self._modules: Dict[str, set] = {}  # dotted module and each dotted suffix ("b.c" for a/b/c.py) -> files
+        self._headers: Dict[str, set] = {}  # header path and each path suffix ("x/y.h", "y.h") -> files
+        self._dependency_graph: Optional[Tuple[int, Dict[str, Any]]] = None # (version, payload)
+        self._symbols: Optional[SymbolTable] = None
+        self._symbols_build_lock = threading.Lock()
+        self.stats = {"cached": 0, "parsed": 0, "build_ms": 0.0, "symbols_build_ms": None}
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root_dir)
+
+    def tracks(self, path: str) -> bool:
+        """True for graph source files under the root (outside skipped directories)."""
+        rel = self._rel(path)
+        return path.endswith(GRAPH_EXTENSIONS) and not rel.startswith("..") and \
+            not any(part in SKIP_DIRS or part.startswith(".") for part in rel.split(os.sep))
 
-    def build_graph(self):
-        for root, _, files in os.walk(self.root_dir):
+    def build_graph(self, workers: int = GRAPH_WORKERS):
+        """
+        Scans the root and rebuilds the graph. Files whose (mtime, size) or content
+        hash match the cache reuse their record; only the others are parsed, across
+        `workers` processes. The scan runs outside the lock, so readers see the
+        previous graph until the swap.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._file_keys:
+                known = {rel: key + (self.records.get(rel),) for rel, key in self._file_keys.items()}
+            else:
+                with _gc_paused():
+                    known = self._load_cache()
+
+        keys, records = {}, {}
+        pending = []           # (rel, path, cached entry) of files whose stat changed
+        for root, dirs, files in os.walk(self.root_dir):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+            rel_root = os.path.relpath(root, self.root_dir)
             for file in files:
-                if file.startswith("."): continue
+                if file.startswith(".") or not file.endswith(GRAPH_EXTENSIONS): continue
+                rel = file if rel_root == "." else os.path.join(rel_root, file)
                 path = os.path.join(root, file)
-                
-                if file.endswith(".py"):
-                    self._parse_python(path)
-                elif file.endswith(".c") or file.endswith(".h"):
-                    self._parse_c(path)
+                entry = known.get(rel)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                keys[rel], records[rel] = (entry[:3], entry[3]) if entry is not None else (None, None)
+                if entry is None or entry[0] != st.st_mtime_ns or entry[1] != st.st_size:
+                    pending.append((rel, path, entry))
 
-    def _parse_python(self, path: str):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                tree = ast.parse(f.read())
-            
-            rel_path = os.path.relpath(path, self.root_dir)
-            self.graph["files"][rel_path] = {"functions": [], "imports": []}
-
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Import):
-                    for alias in node.names:
-                        self.graph["files"][rel_path]["imports"].append(alias.name)
-                elif isinstance(node, ast.ImportFrom):
-                    if node.module:
-                        self.graph["files"][rel_path]["imports"].append(node.module)
-
-                if isinstance(node, ast.FunctionDef):
-                    func_name = node.name
-                    self.graph["functions"][func_name] = {
-                        "defined_in": rel_path,
-                        "line": node.lineno,
-                        "calls": [] 
-                    }
-                    self.graph["files"][rel_path]["functions"].append(func_name)
-                    
-                    # Analyze body for calls (simplified)
-                    for subnode in ast.walk(node):
-                        if isinstance(subnode, ast.Call):
-                            if isinstance(subnode.func, ast.Name):
-                                self.graph["functions"][func_name]["calls"].append(subnode.func.id)
-                            elif isinstance(subnode.func, ast.Attribute):
-                                self.graph["functions"][func_name]["calls"].append(subnode.func.attr)
+        parsed = 0
+        results = scan_sources([(path, entry[2] if entry else None) for _, path, entry in pending], workers)
+        for (rel, _, entry), (key, record, was_parsed) in zip(pending, results):
+            if key is None:
+                del keys[rel], records[rel]
+                continue
+            keys[rel] = key
+            if was_parsed:
+                records[rel] = record
+                parsed += 1
 
+        with self._lock, _gc_paused():
+            self.graph["functions"], self.graph["files"] = {}, {}
+            self.records, self._definers, self._callers = {}, {}, {}
+            self._modules, self._headers = {}, {}
+            # Path order, as incremental updates keep it: the last path defining a shared name wins
+            for rel in sorted(records):
+                if records[rel] is not None:
+                    self._insert(rel, records[rel], sync=False)
+            self._sync_called_by(self.graph["functions"])
+            self._cache_dirty = self._cache_dirty or keys != {rel: entry[:3] for rel, entry in known.items()}
+            self._file_keys = keys
+            self._symbols = None # Rebuilt from the new records on next use
+            self.version += 1
+        self.stats.update(cached=len(keys) - parsed, parsed=parsed, build_ms=round((time.perf_counter() - started) * 1000, 1))
+        self.save_cache()
+
+    def _load_cache(self) -> Dict[str, tuple]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "rb") as f:
+                state = pickle.load(f)
         except Exception as e:
-            print(f"Error parsing {path}: {e}")
+            print(f"⚠️ Graph cache unreadable, re-parsing: {e}")
+            return {}
+        if state.get("version") != GRAPH_CACHE_VERSION or state.get("root") != self.root_dir:
+            return {}
+        return state["files"]
 
-    def _parse_c(self, path: str):
-        # Very simple regex parsing for C
-        rel_path = os.path.relpath(path, self.root_dir)
-        self.graph["files"][rel_path] = {"functions": [], "imports": []}
-        
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
-
-        # Parse Includes
-        include_pattern = re.compile(r'#include\s*[<"]([^>"]+)[>"]')
-        includes = include_pattern.findall(content)
-        self.graph["files"][rel_path]["imports"] = includes
-
-        # Find Function Definitions: type name(...) {
-        # regex is brittle but works for demo
-        func_pattern = re.compile(r'\w+\s+(\w+)\s*\([^)]*\)\s*\{')
-        matches = func_pattern.finditer(content)
-        
-        for match in matches:
-            func_name = match.group(1)
-            if func_name in ["if", "for", "while", "switch"]: continue
-            
-            self.graph["functions"][func_name] = {
-                "defined_in": rel_path,
-                "calls": []
-            }
-            self.graph["files"][rel_path]["functions"].append(func_name)
-
-    def query(self, query_type: str, target: str):
-        if query_type == "definition":
-            return self.graph["functions"].get(target)
+    def save_cache(self):
+        """Writes the per-file records to `cache_path` if they changed since the last save."""
+        if not self.cache_path:
+            return
+        with self._lock:
+            if not self._cache_dirty:
+                return
+            # Records are replaced on change, never mutated, so they can be pickled outside the lock
+            files = {rel: key + (self.records.get(rel),) for rel, key in self._file_keys.items()}
+            self._cache_dirty = False
+        state = {"version": GRAPH_CACHE_VERSION, "root": self.root_dir, "files": files}
+        try:
+            with open(self.cache_path + ".tmp", "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+        except OSError as e:
+            self._cache_dirty = True
+            print(f"⚠️ Graph cache not saved: {e}")
+
+    def update_file(self, path: str, content: Optional[str] = None) -> bool:
+        """
+        Re-parses one file (from disk unless `content` is given) and swaps its
+        record in; a deleted file is removed. Returns True if the graph changed.
+        """
+        if content is None and not os.path.exists(path):
+            return self.remove_file(path)
+        if not self.tracks(path):
+            return False
+        # Parsed outside the lock: readers aren't held up by parsing
+        if content is None:
+            key, record, _ = scan_source(path)
+        else:
+            key, record = None, parse_file(path, content) # Unsaved buffer: re-checked against disk on next build
+        rel = self._rel(path)
+        with self._lock:
+            if key is not None:
+                self._file_keys[rel] = key
+            else:
+                self._file_keys.pop(rel, None)
+            self._cache_dirty = True
+            if record == self.records.get(rel) or (record is None and rel not in self.records):
+                return False
+            self._retract(rel, replacing=record is not None)
+            if record is not None:
+                self._insert(rel, record)
+            if self._symbols is not None:
+                self._symbols.set_file(rel, record)
+            self.version += 1
+            return True
+
+    def remove_file(self, path: str) -> bool:
+        rel = self._rel(path)
+        with self._lock:
+            if self._file_keys.pop(rel, None) is not None:
+                self._cache_dirty = True
+            if rel not in self.records:
+                return False
+            self._retract(rel)
+            if self._symbols is not None:
+                self._symbols.set_file(rel, None)
+            self.version += 1
+            return True
+
+    def _insert(self, rel: str, record: Dict[str, Any], sync: bool = True):
+        """
+        Adds a file's record; with sync=False (bulk builds, in path order) called_by
+        is left for one final pass. A file already in graph["files"] keeps its place.
+        """
+        self.records[rel] = record
+        self._index_paths(rel, add=True)
+        functions = record["functions"]
+        files = self.graph["files"]
+        reorder = sync and rel not in files and files and rel < next(reversed(files))
+        files[rel] = {"functions": [f["name"] for f in functions], "imports": list(record["imports"])}
+        if reorder:
+            self.graph["files"] = dict(sorted(files.items())) # New file: same order as a full build
+        touched = set()
+        entries, definers, callers_of = self.graph["functions"], self._definers, self._callers
+        for func in functions:
+            name = func["name"]
+            defined_in = definers.setdefault(name, {})
+            defined_in[rel] = None
+            if not sync or rel == max(defined_in):
+                entries[name] = self._entry(rel, func) # Last path wins, as in a full build
+            for callee in func["calls"]:
+                callers = callers_of.get(callee)
+                if callers is None:
+                    callers = callers_of[callee] = {}
+                callers[name] = callers.get(name, 0) + 1
+            if sync:
+                touched.add(name)
+                touched.update(func["calls"])
+        self._sync_called_by(touched)
+
+    def _retract(self, rel: str, replacing: bool = False):
+        """Removes a file's record; `replacing` keeps its graph["files"] slot for the new one."""
+        record = self.records.pop(rel, None)
+        if record is None:
+            return
+        if not replacing:
+            del self.graph["files"][rel]
+        self._index_paths(rel, add=False)
+        touched = set()
+        for func in record["functions"]:
+            name = func["name"]
+            for callee in func["calls"]:
+                callers = self._callers[callee]
+                callers[name] -= 1
+                if callers[name] <= 0:
+                    del callers[name]
+                if not callers:
+                    del self._callers[callee]
+                touched.add(callee)
+            definers = self._definers.get(name, {})
+            definers.pop(rel, None)
+            current = self.graph["functions"].get(name)
+            if current is not None and current["defined_in"] == rel:
+                if definers:
+                    # Another file still defines this name: its definition takes over
+                    other = max(definers)
+                    func_other = [f for f in self.records[other]["functions"] if f["name"] == name][-1]
+                    self.graph["functions"][name] = self._entry(other, func_other)
+                    touched.add(name)
+                else:
+                    del self.graph["functions"][name]
+            if not definers:
+                self._definers.pop(name, None)
+        self._sync_called_by(touched)
+
+    def _index_paths(self, rel: str, add: bool):
+        """Registers a file under the names an import or #include can use for it."""
+        if rel.endswith(".py"):
+            parts, index = module_name(rel).split("."), self._modules
+            keys = [".".join(parts[i:]) for i in range(len(parts))]
+        elif rel.endswith(".h"):
+            parts, index = rel.split(os.sep), self._headers
+            keys = ["/".join(parts[i:]) for i in range(len(parts))]
+        else:
+            return
+        for key in keys:
+            if add:
+                index.setdefault(key, set()).add(rel)
+            elif key in index:
+                index[key].discard(rel)
+                if not index[key]:
+                    del index[key]
+
+    def resolve_import(self, rel: str, name: str) -> Optional[str]:
+        """
+        The project file an import (dotted module) or #include (header path) in `rel`
+        refers to, or None for external ones. Several matches: the one nearest `rel`.
+        """
+        index = self._modules if rel.endswith(".py") else self._headers
+        files = index.get(name)
+        if not files:
+            return None
+        if len(files) == 1:
+            return next(iter(files))
+        return min(files, key=lambda f: (-len(os.path.commonprefix([f, rel])), f))
+
+    @staticmethod
+    def _entry(rel: str, func: Dict[str, Any]) -> Dict[str, Any]:
+        return {"defined_in": rel, "line": func["line"], "calls": list(func["calls"]), "called_by": []}
+
+    def _sync_called_by(self, names):
+        functions = self.graph["functions"]
+        for name in names:
+            if name in functions:
+                functions[name]["called_by"] = sorted(self._callers.get(name, ()))
+
+    def files_snapshot(self) -> Dict[str, Dict]:
+        """Copy of the file table, safe to read while updates run in other threads."""
+        with self._lock:
+            return dict(self.graph["files"])
+
+    def symbol_table(self) -> SymbolTable:
+        """
+        The qualified symbol table. Built on first use from a snapshot of the
+        records (outside the graph lock), then caught up with any files that
+        changed meanwhile; afterwards kept current by update_file/remove_file.
+        """
+        with self._symbols_build_lock:
+            with self._lock:
+                if self._symbols is not None:
+                    return self._symbols
+                records = dict(self.records)
+            started = time.perf_counter()
+            table = SymbolTable()
+            with _gc_paused():
+                table.build(records)
+            with self._lock:
+                if self._symbols is None:
+                    for rel in set(records) | set(self.records):
+                        if self.records.get(rel) is not records.get(rel):
+                            table.set_file(rel, self.records.get(rel))
+                    self._symbols = table
+                    self.stats["symbols_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return self._symbols
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            symbols = self._symbols.get_stats() if self._symbols is not None else None
+        return {
+            "files": len(self.records),
+            "functions": len(self.graph["functions"]),
+            "version": self.version,
+            "symbols": symbols,
+            **self.stats
+        }
+
+    def query(self, query_type: str, target: str, to: Optional[str] = None, depth: Optional[int] = None):
+        """
+        Bare-name queries: definition, called_by, calls. Qualified ones
+        (`module.Class.method`, `Class.method` or a bare name, which matches every
+        definition): symbols, callers, callees, impact (transitive callers, up to
+        `depth` levels) and path (shortest call chain from `target` to `to`).
+        """
+        if query_type in ("symbols", "callers", "callees", "impact", "path"):
+            table = self.symbol_table()
+            with self._lock:
+                if query_type == "symbols":
+                    return [table.describe(sid) for sid in table.find(target)]
+                if query_type == "callers":
+                    return table.callers_of(target)
+                if query_type == "callees":
+                    return table.callees_of(target)
+                if query_type == "impact":
+                    return table.impact(target, depth)
+                return table.shortest_path(target, to) if to else None
+        with self._lock:
+            entry = self.graph["functions"].get(target)
+            if query_type == "definition":
+                return entry
+            if query_type == "called_by":
+                return sorted(self._callers.get(target, ()))
+            if query_type == "calls":
+                return entry["calls"] if entry else None
         return None
 
     def get_context_summary(self) -> str:
@@ -104,11 +418,13 @@ class KnowledgeGraph:
         Returns a detailed textual map of the project for KV Caching.
         Includes file structure, key functions, and common external libraries.
         """
+        with self._lock:
+            files = dict(self.graph["files"])
         map_str = "OPENCLAW PROJECT MAP:\n"
         
         # 1. External Libraries
         libraries = set()
-        for data in self.graph["files"].values():
+        for data in files.values():
             for imp in data.get("imports", []):
                 # Heuristic: simple names often external, paths often internal. 
                 # Better: check if it's in our file list?
@@ -116,14 +432,14 @@ class KnowledgeGraph:
                 libraries.add(imp)
         
         # Filter internal modules (approximation)
-        internal_modules = {os.path.splitext(f)[0].replace("/", ".") for f in self.graph["files"].keys()}
+        internal_modules = {os.path.splitext(f)[0].replace("/", ".") for f in files.keys()}
         external_libs = [lib for lib in libraries if lib not in internal_modules and "." not in lib] # Simple heuristic
         
         if external_libs:
             map_str += f"Common Libraries: {', '.join(sorted(external_libs))}\n\n"
 
         # 2. File Structure
-        for file_path, data in sorted(self.graph["files"].items()):
+        for file_path, data in sorted(files.items()):
             map_str += f"File: {file_path}\n"
             funcs = data.get("functions", [])
             if funcs:
@@ -139,28 +455,34 @@ class KnowledgeGraph:
     def get_dependency_graph(self):
         """
         Returns nodes and links for force-directed graph.
+        Imports resolve through the module/header index; the payload is cached
+        until the graph changes.
         """
+        with self._lock:
+            if self._dependency_graph is not None and self._dependency_graph[0] == self.version:
+                return self._dependency_graph[1]
+            version = self.version
+            files = dict(self.graph["files"])
+            # Resolved under the lock: the indexes change with the files
+            resolved = {path: [(imp, self.resolve_import(path, imp)) for imp in data["imports"]]
+                        for path, data in files.items()}
+
         nodes = []
         links = []
-        
+        external = set()
+
         # Files as nodes (Group 1)
-        for file_path in self.graph["files"]:
+        for file_path in files:
             nodes.append({"id": file_path, "group": 1, "radius": 5})
-            
+
             # Imports as links (File -> File/Module)
-            for imp in self.graph["files"][file_path]["imports"]:
-                # Try to map import to a known file
-                target = None
-                for potential_path in self.graph["files"]:
-                    if imp in potential_path: # simplified matching
-                        target = potential_path
-                        break
-                
+            for imp, target in resolved[file_path]:
                 if target:
                     links.append({"source": file_path, "target": target, "value": 1})
                 else:
                     # External dependency node (Group 2)
-                    if not any(n["id"] == imp for n in nodes):
+                    if imp not in external:
+                        external.add(imp)
                         nodes.append({"id": imp, "group": 2, "radius": 3})
                     links.append({"source": file_path, "target": imp, "value": 1})
 
@@ -169,7 +491,11 @@ class KnowledgeGraph:
         #     nodes.append({"id": func, "group": 3})
         #     links.append({"source": data["defined_in"], "target": func, "value": 2})
 
-        return {"nodes": nodes, "links": links}
+        payload = {"nodes": nodes, "links": links}
+        with self._lock:
+            if self.version == version:
+                self._dependency_graph = (version, payload)
+        return payload
 
     def identify_symbol(self, code: str, line: int, filepath: str) -> Dict[str, Any]:
         """
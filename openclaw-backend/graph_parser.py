@@ -0,0 +1,206 @@
+"""
+Source parsing for the knowledge graph. Kept free of import-time side effects:
+cold builds run `_scan_batch` in spawned worker processes, which import this
+module (and whatever module is __main__) fresh.
+"""
+import ast
+import os
+import re
+import hashlib
+from typing import Dict, List, Any, Optional, Tuple
+
+# C parsing (regex is brittle but works for demo); shared with the indexer's chunker
+C_INCLUDE_PATTERN = re.compile(r'#include\s*[<"]([^>"]+)[>"]')
+# Function Definitions: type name(...) {
+C_FUNC_PATTERN = re.compile(r'\w+\s+(\w+)\s*\([^)]*\)\s*\{')
+# Struct/union/enum bodies: struct name {  /  typedef struct {
+C_STRUCT_PATTERN = re.compile(r'(?:typedef\s+)?\b(?:struct|union|enum)\s*(\w*)\s*\{')
+C_KEYWORDS = {"if", "for", "while", "switch"}
+
+def _match_brace(content: str, open_idx: int) -> int:
+    """Returns the index of the brace closing the one at `open_idx` (skips strings and comments)."""
+    depth = 0
+    i = open_idx
+    n = len(content)
+    while i < n:
+        ch = content[i]
+        if ch == '/' and content.startswith('//', i):
+            i = content.find('\n', i)
+            if i == -1:
+                return n - 1
+        elif ch == '/' and content.startswith('/*', i):
+            i = content.find('*/', i + 2)
+            if i == -1:
+                return n - 1
+            i += 1
+        elif ch in '"\'':
+            i += 1
+            while i < n and content[i] != ch:
+                i += 2 if content[i] == '\\' else 1
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return n - 1
+
+def find_c_definitions(content: str) -> List[Tuple[str, str, int, int]]:
+    """
+    Finds top-level C function and struct definitions.
+    Returns (name, kind, start_line, end_line) tuples with 1-based inclusive lines.
+    """
+    candidates = []
+    for match in C_FUNC_PATTERN.finditer(content):
+        if match.group(1) not in C_KEYWORDS:
+            candidates.append((match.start(), match.end() - 1, match.group(1), "function"))
+    for match in C_STRUCT_PATTERN.finditer(content):
+        candidates.append((match.start(), match.end() - 1, match.group(1), "struct"))
+    candidates.sort()
+
+    definitions = []
+    last_end = -1
+    for start, brace, name, kind in candidates:
+        if start <= last_end:
+            continue # Nested inside the previous definition
+        end = _match_brace(content, brace)
+        if kind == "struct":
+            # Include the declarator list up to the terminating semicolon
+            semi = content.find(';', end)
+            if semi != -1 and '{' not in content[end:semi]:
+                if not name:
+                    # typedef struct { ... } Name;
+                    declarator = re.match(r'\}\s*(\w+)', content[end:semi])
+                    name = declarator.group(1) if declarator else ""
+                end = semi
+        name = name or "<anonymous>"
+        definitions.append((name, kind, content.count('\n', 0, start) + 1, content.count('\n', 0, end) + 1))
+        last_end = end
+    return definitions
+
+def _qualnames(tree: ast.AST) -> Dict[ast.AST, Tuple[str, Optional[str]]]:
+    """Function node -> (qualified name within the module, e.g. "Class.method"; enclosing class)."""
+    names = {}
+
+    def visit(node, prefix, cls):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                visit(child, f"{prefix}{child.name}.", prefix + child.name)
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                names[child] = (prefix + child.name, cls)
+                visit(child, f"{prefix}{child.name}.", cls)
+            else:
+                visit(child, prefix, cls)
+    visit(tree, "", None)
+    return names
+
+def _receiver(func: ast.expr) -> Optional[str]:
+    """What a call is made on: None for `f()`, "self" for `self.f()`/`cls.f()`, "a.b" for `a.b.f()`, "?" otherwise."""
+    if not isinstance(func, ast.Attribute):
+        return None
+    parts = []
+    value = func.value
+    while isinstance(value, ast.Attribute):
+        parts.append(value.attr)
+        value = value.value
+    if not isinstance(value, ast.Name):
+        return "?"
+    if not parts and value.id in ("self", "cls"):
+        return "self"
+    parts.append(value.id)
+    return ".".join(reversed(parts))
+
+def parse_python(content: str) -> Dict[str, Any]:
+    """
+    Per-file record: {"functions": [{name, qualname, cls, line, calls, receivers}],
+    "imports": [...], "aliases": {bound name: dotted target}}. Relative import
+    targets keep their leading dots. Raises SyntaxError.
+    """
+    tree = ast.parse(content)
+    qualnames = _qualnames(tree)
+    record = {"functions": [], "imports": [], "aliases": {}}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                record["imports"].append(alias.name)
+                if alias.asname:
+                    record["aliases"][alias.asname] = alias.name
+                else:
+                    head = alias.name.split(".")[0]
+                    record["aliases"][head] = head
+        elif isinstance(node, ast.ImportFrom):
+            if node.module:
+                record["imports"].append(node.module)
+            base = "." * node.level + (node.module + "." if node.module else "")
+            for alias in node.names:
+                if alias.name != "*":
+                    record["aliases"][alias.asname or alias.name] = base + alias.name
+
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            calls, receivers = [], []
+            # Analyze body for calls (simplified)
+            for subnode in ast.walk(node):
+                if isinstance(subnode, ast.Call):
+                    if isinstance(subnode.func, ast.Name):
+                        calls.append(subnode.func.id)
+                        receivers.append(None)
+                    elif isinstance(subnode.func, ast.Attribute):
+                        calls.append(subnode.func.attr)
+                        receivers.append(_receiver(subnode.func))
+            qualname, cls = qualnames.get(node, (node.name, None))
+            record["functions"].append({"name": node.name, "qualname": qualname, "cls": cls, "line": node.lineno,
+                                        "calls": calls, "receivers": receivers})
+    return record
+
+def parse_c(content: str) -> Dict[str, Any]:
+    # Very simple regex parsing for C
+    record = {"functions": [], "imports": C_INCLUDE_PATTERN.findall(content)}
+    for match in C_FUNC_PATTERN.finditer(content):
+        func_name = match.group(1)
+        if func_name in C_KEYWORDS: continue
+        record["functions"].append({"name": func_name, "line": content.count("\n", 0, match.start()) + 1, "calls": []})
+    return record
+
+def parse_file(path: str, content: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Parses one source file into its record, or None if it can't be read or parsed."""
+    try:
+        if path.endswith(".py"):
+            if content is None:
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+            return parse_python(content)
+        if content is None:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read()
+        return parse_c(content)
+    except Exception as e:
+        print(f"Error parsing {path}: {e}")
+        return None
+
+def scan_source(path: str, cached_hash: Optional[str] = None) -> Tuple[Optional[Tuple[int, int, str]], Optional[Dict[str, Any]], bool]:
+    """
+    (key, record, parsed) for one file, key being (mtime_ns, size, sha1). A file
+    whose content still hashes to `cached_hash` isn't parsed (parsed=False, no
+    record: the caller keeps its own). Unreadable files return a None key.
+    """
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"Error parsing {path}: {e}")
+        return None, None, False
+    key = (st.st_mtime_ns, st.st_size, hashlib.sha1(data).hexdigest())
+    if key[2] == cached_hash:
+        return key, None, False # Touched but not modified
+    try:
+        content = data.decode("utf-8", errors="strict" if path.endswith(".py") else "ignore")
+    except UnicodeDecodeError as e:
+        print(f"Error parsing {path}: {e}")
+        return key, None, True
+    return key, parse_file(path, content), True
+
+def _scan_batch(batch: List[Tuple[str, Optional[str]]]) -> List[tuple]:
+    """Worker task: one chunk of (path, cached hash) pairs; results are plain records, cheap to pickle back."""
+    return [scan_source(path, cached_hash) for path, cached_hash in batch]
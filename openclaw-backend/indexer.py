@@ -1,118 +1,615 @@
-
 import os
+import ast
 import glob
+import json
+import mmap
 import pickle
+import hashlib
+import threading
 import numpy as np
-from typing import List, Dict, Tuple
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Tuple, Optional
+from embedding_service import get_embedding_service
+from ann_index import IVFIndex
+from lexical_index import BM25Index, exact_identifier
+from graph_parser import find_c_definitions
 
 # Configuration
-INDEX_FILE = "code_index.pkl"
+INDEX_FILE = "code_index.npy"          # (N, dim) pre-normalized embedding matrix, memory-mapped at load
+META_FILE = "code_index.meta.json"     # Sidecar: path table, per-chunk offsets and the refresh manifest
+TEXT_FILE = "code_index.chunks"        # Concatenated UTF-8 chunk texts, addressed by (offset, length)
+LEGACY_INDEX_FILE = "code_index.pkl"   # Old pickled list of dicts; migrated on first save
+IVF_FILE = "code_index.ivf.npz"        # Coarse quantizer + inverted lists for the "ivf" search mode
+LEXICAL_FILE = "code_index.lex.pkl"    # BM25 inverted index over identifier-split tokens
+INDEX_ROOT = "../"
 MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DTYPE = np.float32           # np.float16 halves the matrix size at a small recall cost
 EXTENSIONS = [".c", ".py", ".h", ".cpp", ".hpp", ".js", ".ts", ".tsx"]
+SKIP_MARKERS = ["venv", "node_modules", "__pycache__", "dist"]
+
+# Chunking: Python/C chunks follow function/class/struct boundaries
+MAX_CHUNK_LINES = 80   # Longer symbols are split into windows of this size
+MIN_CHUNK_LINES = 8    # Shorter neighbours are merged (up to MAX_CHUNK_LINES)
+WINDOW_LINES = 30      # Fixed windows for other languages and unparsable files
+CHUNKER_VERSION = 2    # Bump when chunk boundaries change so saved files get re-chunked
+C_EXTENSIONS = (".c", ".h", ".cpp", ".hpp")
+
+# Search Mode: "exact" (brute force) or "ivf" (approximate, see ann_index.py)
+SEARCH_MODE = os.environ.get("OPENCLAW_INDEX_MODE", "exact")
+ANN_NPROBE = int(os.environ.get("OPENCLAW_INDEX_NPROBE", "8")) # Cells scanned per query: recall vs latency
+ANN_MIN_CHUNKS = 20000 # Below this, exact search is already sub-millisecond
+
+# Hybrid Retrieval: vector and BM25 rankings merged by reciprocal-rank fusion
+RRF_K = 60             # Damping constant; higher flattens the contribution of top ranks
+RRF_DEPTH = 20         # Candidates taken from each ranking (at least 4 * top_k)
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(EMBEDDING_DTYPE)
+
+def _fill_gaps(spans: List[Tuple[int, int, Optional[str]]], first: int, last: int, symbol: Optional[str] = None):
+    """Turns sorted symbol spans into segments covering lines first..last; gaps get `symbol`."""
+    segments = []
+    line = first
+    for start, end, name in spans:
+        if start > line:
+            segments.append((line, start - 1, symbol))
+        segments.append((start, end, name))
+        line = end + 1
+    if line <= last:
+        segments.append((line, last, symbol))
+    return segments
+
+def _python_spans(tree: ast.Module) -> List[Tuple[int, int, Optional[str]]]:
+    """Top-level function/class spans; oversized classes are split per method."""
+    spans = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        end = node.end_lineno
+        if isinstance(node, ast.ClassDef) and end - start + 1 > MAX_CHUNK_LINES:
+            methods = [
+                (min([child.lineno] + [d.lineno for d in child.decorator_list]), child.end_lineno, f"{node.name}.{child.name}")
+                for child in node.body
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            ]
+            spans.extend(_fill_gaps(methods, start, end, node.name))
+        else:
+            spans.append((start, end, node.name))
+    return spans
+
+def _join_symbols(a: Optional[str], b: Optional[str], limit: int = 4) -> Optional[str]:
+    """Joins the symbol labels of merged chunks, dropping repeats and capping the list."""
+    names = []
+    for label in (a, b):
+        for name in (label or "").split(", "):
+            if name and name != "..." and name not in names:
+                names.append(name)
+    # "Class" is implied by "Class.method"
+    names = [n for n in names if not any(other.startswith(n + ".") for other in names)]
+    if len(names) > limit:
+        names = names[:limit] + ["..."]
+    return ", ".join(names) or None
+
+def _resize_segments(segments):
+    """Splits segments above MAX_CHUNK_LINES and merges neighbours below MIN_CHUNK_LINES."""
+    split = []
+    for start, end, symbol in segments:
+        for window_start in range(start, end + 1, MAX_CHUNK_LINES):
+            split.append((window_start, min(window_start + MAX_CHUNK_LINES - 1, end), symbol))
+
+    merged = []
+    for start, end, symbol in split:
+        if merged:
+            prev_start, prev_end, prev_symbol = merged[-1]
+            is_small = prev_end - prev_start + 1 < MIN_CHUNK_LINES or end - start + 1 < MIN_CHUNK_LINES
+            if is_small and end - prev_start + 1 <= MAX_CHUNK_LINES:
+                merged[-1] = (prev_start, end, _join_symbols(prev_symbol, symbol))
+                continue
+        merged.append((start, end, symbol))
+    return merged
+
+def _rrf(rankings: List[List[int]]) -> Dict[int, float]:
+    """Reciprocal-rank fusion, scaled so a row ranked first everywhere scores 1.0."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    scale = (RRF_K + 1) / max(len(rankings), 1)
+    return {row: score * scale for row, score in fused.items()}
+
+def _row_lookup(chunks: List[Dict]) -> Dict[Tuple[str, int], int]:
+    return {(chunk['path'], chunk['chunk_id']): row for row, chunk in enumerate(chunks)}
+
+def _sidecar_path(filepath: str, default: str) -> str:
+    """Places sidecar files next to a custom index path."""
+    if filepath == INDEX_FILE:
+        return default
+    return os.path.splitext(filepath)[0] + default[len("code_index"):]
 
 class CodeIndexer:
-    def __init__(self, model_name=MODEL_NAME):
-        print(f"Loading embedding model: {model_name}...")
-        self.model = SentenceTransformer(model_name)
-        self.index_data = [] # List of dicts: {'path': str, 'content': str, 'embedding': np.array}
-        
-    def scan_directory(self, root_dir: str):
-        """Scans the directory for code files and chunks them."""
-        print(f"Scanning directory: {root_dir}")
+    def __init__(self, model_name=MODEL_NAME, search_mode=SEARCH_MODE, nprobe=ANN_NPROBE):
+        # Shared with the Chroma stores; the model itself loads on the first encode
+        self.embedder = get_embedding_service(model_name)
+        self.dim = self.embedder.dimension
+        self.search_mode = search_mode
+        self.nprobe = nprobe
+        # Chunk metadata ({'path', 'chunk_id', 'hash'} plus either 'content' or
+        # 'offset'/'length' into the text blob), the matching embedding rows, the
+        # optional IVF index over them and a (path, chunk_id) -> row lookup. Kept
+        # as one tuple so a concurrent refresh swaps them atomically.
+        self._index: Tuple[List[Dict], np.ndarray, Optional[IVFIndex], Dict] = ([], np.zeros((0, self.dim), dtype=EMBEDDING_DTYPE), None, {})
+        self._text_blob = b""
+        # BM25 postings keyed by (path, chunk_id); updated in place on refresh
+        self.lexical = BM25Index()
+        # Manifest: path -> {'mtime': float, 'size': int, 'hash': str, 'chunks': [chunk hashes]}
+        self.manifest: Dict[str, Dict] = {}
+        self.root_dir = INDEX_ROOT # Manifest keys are paths as a scan of this root produces them
+        self.dirty = False         # In-memory index has changes save_index hasn't written yet
+        self._lock = threading.Lock() # Serializes refreshes and saves (startup sync vs. file saves)
+
+    @property
+    def chunks(self) -> List[Dict]:
+        return self._index[0]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._index[1]
+
+    @property
+    def ann(self) -> Optional[IVFIndex]:
+        return self._index[2]
+
+    def _set_index(self, chunks: List[Dict], embeddings: np.ndarray, ann: Optional[IVFIndex]):
+        self._index = (chunks, embeddings, ann, _row_lookup(chunks))
+
+    def _build_lexical(self, chunks: List[Dict]) -> BM25Index:
+        lexical = BM25Index()
+        for chunk in chunks:
+            lexical.add((chunk['path'], chunk['chunk_id']), chunk['path'], self._chunk_text(chunk))
+        return lexical
+
+    def _build_ann(self, embeddings: np.ndarray) -> Optional[IVFIndex]:
+        """Trains the IVF index for `embeddings` when the "ivf" mode applies."""
+        if self.search_mode != "ivf" or embeddings.shape[0] < ANN_MIN_CHUNKS:
+            return None
+        print(f"Training IVF index over {embeddings.shape[0]} chunks...")
+        return IVFIndex.train(embeddings)
+
+    def _chunk_text(self, chunk: Dict) -> str:
+        if 'content' in chunk:
+            return chunk['content']
+        return self._text_blob[chunk['offset']:chunk['offset'] + chunk['length']].decode('utf-8', errors='ignore')
+
+    def chunk_texts(self) -> List[Tuple[str, str]]:
+        """(path, text) of every indexed chunk, in index order."""
+        return [(chunk['path'], self._chunk_text(chunk)) for chunk in self.chunks]
+
+    def _collect_files(self, root_dir: str) -> List[str]:
+        """Returns all indexable code files under `root_dir`."""
         file_paths = []
         for ext in EXTENSIONS:
             # Recursive search for each extension
             file_paths.extend(glob.glob(os.path.join(glob.escape(root_dir), f"**/*{ext}"), recursive=True))
-            
+
+        # Skip virtual environments and node_modules
+        return [p for p in file_paths if not any(marker in p for marker in SKIP_MARKERS)]
+
+    def scan_directory(self, root_dir: str):
+        """Scans the directory for code files and chunks them (full rebuild)."""
+        print(f"Scanning directory: {root_dir}")
+        file_paths = self._collect_files(root_dir)
         print(f"Found {len(file_paths)} files.")
-        
+
+        chunks = []
+        self.manifest = {}
         for path in file_paths:
-            # Skip virtual environments and node_modules
-            if "venv" in path or "node_modules" in path or "__pycache__" in path or "dist" in path:
-                continue
-                
             try:
+                stat = os.stat(path)
                 with open(path, 'r', encoding='utf-8', errors='ignore') as f:
                     content = f.read()
-                    if not content.strip():
-                        continue
-                        
-                    # Simple chunking: split by function/class or just fixed size
-                    # For now, let's treat small files as one chunk, large files split by lines
-                    chunks = self._chunk_content(content)
-                    
-                    for i, chunk in enumerate(chunks):
-                        self.index_data.append({
-                            'path': path,
-                            'chunk_id': i,
-                            'content': chunk,
-                            'embedding': None # To be computed
-                        })
             except Exception as e:
                 print(f"Error reading {path}: {e}")
+                continue
+
+            file_chunks = self._chunk_content(content, path) if content.strip() else []
+            for i, chunk in enumerate(file_chunks):
+                chunk.update({'path': path, 'chunk_id': i, 'hash': _hash_text(chunk['content'])})
+            self.manifest[path] = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'hash': _hash_text(content),
+                'chunks': [chunk['hash'] for chunk in file_chunks]
+            }
+            chunks.extend(file_chunks)
+        # Embeddings are computed by build_index()
+        self._set_index(chunks, np.zeros((0, self.dim), dtype=EMBEDDING_DTYPE), None)
+        self.lexical = self._build_lexical(chunks)
 
-    def _chunk_content(self, content: str, chunk_size=30) -> List[str]:
-        """Splits content into chunks of roughly `chunk_size` lines."""
+    def _chunk_content(self, content: str, path: str = "") -> List[Dict]:
+        """
+        Splits content into chunks aligned to function/class/struct boundaries
+        (Python via `ast`, C via graph_engine), falling back to fixed windows.
+        Returns dicts with 'content', 'symbol', 'start_line' and 'end_line' (1-based, inclusive).
+        """
         lines = content.split('\n')
+        n_lines = len(lines)
+        segments = None
+        if path.endswith(".py"):
+            try:
+                segments = _fill_gaps(_python_spans(ast.parse(content)), 1, n_lines)
+            except (SyntaxError, ValueError):
+                segments = None
+        elif path.endswith(C_EXTENSIONS):
+            spans = [(start, end, name) for name, _, start, end in find_c_definitions(content)]
+            segments = _fill_gaps(spans, 1, n_lines)
+
+        if segments is None:
+            segments = [(start, min(start + WINDOW_LINES - 1, n_lines), None) for start in range(1, n_lines + 1, WINDOW_LINES)]
+        else:
+            segments = _resize_segments(segments)
+
         chunks = []
-        for i in range(0, len(lines), chunk_size):
-            chunk = '\n'.join(lines[i:i+chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
+        for start, end, symbol in segments:
+            text = '\n'.join(lines[start - 1:end])
+            if text.strip():
+                chunks.append({'content': text, 'symbol': symbol, 'start_line': start, 'end_line': end})
         return chunks
 
     def build_index(self):
-        """Generates embeddings for all chunks."""
-        if not self.index_data:
+        """Generates embeddings for all scanned chunks."""
+        chunks = self.chunks
+        if not chunks:
             print("No data to index.")
             return
 
-        print(f"Generating embeddings for {len(self.index_data)} chunks...")
-        texts = [item['content'] for item in self.index_data]
-        embeddings = self.model.encode(texts, show_progress_bar=True)
-        
-        for i, item in enumerate(self.index_data):
-            item['embedding'] = embeddings[i]
-            
+        print(f"Generating embeddings for {len(chunks)} chunks...")
+        texts = [self._chunk_text(chunk) for chunk in chunks]
+        embeddings = _normalize(self.embedder.encode(texts, show_progress_bar=True))
+        self._set_index(chunks, embeddings, self._build_ann(embeddings))
         print("Index build complete.")
 
+    def refresh(self, root_dir: str = INDEX_ROOT) -> Dict[str, int]:
+        """
+        Incrementally syncs the index with `root_dir`.
+        Files whose mtime/size are unchanged are skipped without being read, and
+        only chunks whose content hash is new get re-embedded.
+        """
+        self.root_dir = root_dir
+        paths = set(self._collect_files(root_dir))
+        known = set(self.manifest) | {chunk['path'] for chunk in self.chunks}
+        removed = [p for p in known if p not in paths]
+        return self._refresh_paths(sorted(paths), removed)
+
+    def update_file(self, path: str) -> Dict[str, int]:
+        """Re-indexes a single file (e.g. after a save), or drops it if deleted."""
+        if not any(path.endswith(ext) for ext in EXTENSIONS):
+            return {'changed': 0, 'removed': 0, 'embedded': 0}
+        key = self._key(path)
+        if not os.path.exists(key):
+            return self._refresh_paths([], [key] if key in self.manifest else [])
+        return self._refresh_paths([key], [])
+
+    def _key(self, path: str) -> str:
+        """The manifest key a directory scan of `root_dir` produces for `path` (e.g. "../pkg/mod.py")."""
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root_dir))
+        if rel.startswith(".."):
+            return path # Outside the scanned tree
+        return os.path.join(self.root_dir, rel)
+
+    def _refresh_paths(self, paths: List[str], removed: List[str]) -> Dict[str, int]:
+        with self._lock:
+            stats = self._apply_refresh(paths, removed)
+            if any(stats.values()):
+                self.dirty = True
+            chunks, embeddings, ann, _ = self._index
+            stats['ann_built'] = 0
+            if ann is None and self.search_mode == "ivf" and len(chunks) >= ANN_MIN_CHUNKS:
+                # e.g. first refresh after switching modes or loading an index saved without one
+                self._set_index(chunks, embeddings, self._build_ann(embeddings))
+                stats['ann_built'] = 1
+            return stats
+
+    def _apply_refresh(self, paths: List[str], removed: List[str]) -> Dict[str, int]:
+        changed: Dict[str, List[Dict]] = {}
+
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if path in self.manifest:
+                    removed.append(path)
+                continue
+
+            entry = self.manifest.get(path)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+
+            try:
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+                continue
+
+            file_hash = _hash_text(content)
+            if entry and entry['hash'] == file_hash:
+                # Touched but not modified
+                entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+                self.dirty = True
+                continue
+
+            file_chunks = self._chunk_content(content, path) if content.strip() else []
+            for i, chunk in enumerate(file_chunks):
+                chunk.update({'path': path, 'chunk_id': i, 'hash': _hash_text(chunk['content'])})
+            changed[path] = file_chunks
+            self.manifest[path] = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'hash': file_hash,
+                'chunks': [chunk['hash'] for chunk in file_chunks]
+            }
+
+        for path in removed:
+            self.manifest.pop(path, None)
+
+        stats = {'changed': len(changed), 'removed': len(removed), 'embedded': 0}
+        if not changed and not removed:
+            return stats
+
+        # Rows of the chunks being replaced can be reused when only part of a
+        # file changed (or a chunk moved between files).
+        chunks, embeddings, ann, _ = self._index
+        stale = set(changed) | set(removed)
+        reusable: Dict[str, int] = {}
+        kept_rows = []
+        for row, chunk in enumerate(chunks):
+            if chunk['path'] in stale:
+                reusable[chunk['hash']] = row
+            else:
+                kept_rows.append(row)
+
+        new_chunks = [chunk for file_chunks in changed.values() for chunk in file_chunks]
+        new_rows: List[Optional[int]] = [reusable.get(chunk['hash']) for chunk in new_chunks]
+
+        new_matrix = np.zeros((len(new_chunks), self.dim), dtype=EMBEDDING_DTYPE)
+        reused = [(i, row) for i, row in enumerate(new_rows) if row is not None]
+        if reused:
+            new_matrix[[i for i, _ in reused]] = embeddings[[row for _, row in reused]]
+        pending = [i for i, row in enumerate(new_rows) if row is None]
+        if pending:
+            encoded = self.embedder.encode([new_chunks[i]['content'] for i in pending])
+            new_matrix[pending] = _normalize(encoded)
+        stats['embedded'] = len(pending)
+
+        kept_chunks = [chunks[row] for row in kept_rows]
+        matrix = np.vstack([embeddings[kept_rows], new_matrix])
+        if ann is not None and not ann.needs_retrain(matrix.shape[0]):
+            # Only the new rows get assigned to cells
+            ann = ann.update(np.asarray(kept_rows, dtype=np.int64), new_matrix)
+        else:
+            ann = self._build_ann(matrix)
+        for path in stale:
+            self.lexical.remove_path(path)
+        for chunk in new_chunks:
+            self.lexical.add((chunk['path'], chunk['chunk_id']), chunk['path'], chunk['content'])
+        self._set_index(kept_chunks + new_chunks, matrix, ann)
+        print(f"Index refreshed: {stats['changed']} changed, {stats['removed']} removed, {stats['embedded']} chunks embedded.")
+        return stats
+
     def save_index(self, filepath=INDEX_FILE):
-        with open(filepath, 'wb') as f:
-            pickle.dump(self.index_data, f)
-        print(f"Index saved to {filepath}")
+        """
+        Writes the matrix, text blob and sidecar atomically. Holds the refresh lock
+        throughout, so the manifest on disk always describes the rows written with it.
+        """
+        with self._lock:
+            self._save_index(filepath)
+
+    def save_if_dirty(self, filepath=INDEX_FILE) -> bool:
+        """Saves only when refreshes changed the index since the last save."""
+        with self._lock:
+            if not self.dirty:
+                return False
+            self._save_index(filepath)
+            return True
+
+    def _save_index(self, filepath: str):
+        meta_path = _sidecar_path(filepath, META_FILE)
+        text_path = _sidecar_path(filepath, TEXT_FILE)
+        ivf_path = _sidecar_path(filepath, IVF_FILE)
+        lexical_path = _sidecar_path(filepath, LEXICAL_FILE)
+        chunks, embeddings, ann, _ = self._index
+
+        paths: List[str] = []
+        path_ids: Dict[str, int] = {}
+        records = []
+        offset = 0
+        with open(text_path + ".tmp", 'wb') as f:
+            for chunk in chunks:
+                data = self._chunk_text(chunk).encode('utf-8')
+                f.write(data)
+                if chunk['path'] not in path_ids:
+                    path_ids[chunk['path']] = len(paths)
+                    paths.append(chunk['path'])
+                records.append([
+                    path_ids[chunk['path']], chunk['chunk_id'], chunk['hash'], offset, len(data),
+                    chunk.get('start_line'), chunk.get('end_line'), chunk.get('symbol')
+                ])
+                offset += len(data)
+
+        with open(filepath + ".tmp", 'wb') as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=EMBEDDING_DTYPE))
+
+        meta = {
+            'version': 3,
+            'chunker': CHUNKER_VERSION,
+            'model': self.embedder.model_name,
+            'dim': self.dim,
+            'paths': paths,
+            'chunks': records,
+            'manifest': self.manifest
+        }
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump(meta, f, separators=(',', ':'))
+
+        if ann is not None:
+            ann.save(ivf_path + ".tmp")
+        self.lexical.save(lexical_path + ".tmp")
+
+        # Sidecar last: readers never see metadata pointing past the matrix
+        os.replace(text_path + ".tmp", text_path)
+        os.replace(filepath + ".tmp", filepath)
+        if ann is not None:
+            os.replace(ivf_path + ".tmp", ivf_path)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+        os.replace(lexical_path + ".tmp", lexical_path)
+        os.replace(meta_path + ".tmp", meta_path)
+        self.dirty = False
+        # No reload: the in-memory index is already current, and chunks still read
+        # from the previous blob keep it mapped after the replace
+        print(f"Index saved to {filepath} ({len(chunks)} chunks)")
 
     def load_index(self, filepath=INDEX_FILE):
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                self.index_data = pickle.load(f)
-            print(f"Index loaded from {filepath} ({len(self.index_data)} chunks)")
+        meta_path = _sidecar_path(filepath, META_FILE)
+        text_path = _sidecar_path(filepath, TEXT_FILE)
+        ivf_path = _sidecar_path(filepath, IVF_FILE)
+        lexical_path = _sidecar_path(filepath, LEXICAL_FILE)
+        if os.path.exists(filepath) and os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            # Memory-mapped: no copy at import, and pages are shared between workers
+            embeddings = np.load(filepath, mmap_mode='r')
+            if embeddings.shape[0] != len(meta['chunks']):
+                print(f"Warning: {filepath} does not match {meta_path}; ignoring index.")
+                return False
+            text_blob = b""
+            if os.path.exists(text_path) and os.path.getsize(text_path) > 0:
+                with open(text_path, 'rb') as f:
+                    text_blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            paths = meta['paths']
+            chunks = []
+            for record in meta['chunks']:
+                p, cid, h, off, length = record[:5]
+                start, end, symbol = record[5:8] if len(record) >= 8 else (None, None, None)
+                chunks.append({
+                    'path': paths[p], 'chunk_id': cid, 'hash': h, 'offset': off, 'length': length,
+                    'start_line': start, 'end_line': end, 'symbol': symbol
+                })
+            ann = None
+            if self.search_mode == "ivf" and os.path.exists(ivf_path):
+                ann = IVFIndex.load(ivf_path)
+                if ann.n_rows != len(chunks):
+                    ann = None # Stale; exact search until the next refresh rebuilds it
+            self._text_blob = text_blob
+            # Chunk boundaries changed since the save: re-chunk every file on the next
+            # refresh (identical chunk texts still reuse their embeddings)
+            self.manifest = meta['manifest'] if meta.get('chunker') == CHUNKER_VERSION else {}
+            self._set_index(chunks, embeddings, ann)
+            lexical = BM25Index.load(lexical_path) if os.path.exists(lexical_path) else None
+            if lexical is None or len(lexical) != len(chunks):
+                print("Rebuilding lexical index...")
+                lexical = self._build_lexical(chunks)
+            self.lexical = lexical
+            print(f"Index loaded from {filepath} ({len(chunks)} chunks)")
+            return True
+
+        legacy_path = LEGACY_INDEX_FILE if filepath == INDEX_FILE else filepath
+        if legacy_path.endswith(".pkl") and os.path.exists(legacy_path):
+            # Legacy list of dicts: converted in memory and written in the new format on
+            # the next save. Without a manifest the next refresh re-reads every file once,
+            # but unchanged chunks still reuse their embeddings.
+            with open(legacy_path, 'rb') as f:
+                data = pickle.load(f)
+            chunks = [
+                {'path': item['path'], 'chunk_id': item['chunk_id'], 'hash': _hash_text(item['content']), 'content': item['content']}
+                for item in data
+            ]
+            if data:
+                embeddings = _normalize(np.array([item['embedding'] for item in data]))
+            else:
+                embeddings = np.zeros((0, self.dim), dtype=EMBEDDING_DTYPE)
+            self.manifest = {}
+            self._set_index(chunks, embeddings, None)
+            self.lexical = self._build_lexical(chunks)
+            print(f"Legacy index loaded from {legacy_path} ({len(chunks)} chunks)")
             return True
         return False
 
-    def search(self, query: str, top_k=3) -> List[Tuple[Dict, float]]:
-        """Searches the index for the most relevant chunks."""
-        if not self.index_data:
+    def search(self, query: str, top_k=3, nprobe: Optional[int] = None, exact: bool = False, hybrid: bool = True) -> List[Tuple[Dict, float]]:
+        """
+        Searches the index for the most relevant chunks.
+        Vector hits (IVF when built, unless `exact`) are fused with BM25 hits by
+        reciprocal rank. A single-identifier query that occurs in the code is
+        answered from the inverted index alone, without running the model.
+        Each result dict also carries the raw 'similarity' (cosine, None when the
+        query was not embedded) and 'bm25' scores.
+        """
+        chunks, embeddings, ann, rows = self._index # Snapshot; a concurrent refresh swaps all four
+        if not chunks:
             return []
-            
-        query_embedding = self.model.encode([query])[0]
-        
-        # Prepare index matrix
-        index_embeddings = np.array([item['embedding'] for item in self.index_data])
-        
-        # Compute cosine similarity
-        similarities = cosine_similarity([query_embedding], index_embeddings)[0]
-        
-        # Get top k indices
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
+
+        if hybrid:
+            identifier = exact_identifier(query)
+            if identifier is not None:
+                hits = [(rows[doc], score) for doc, score in self.lexical.search_exact(identifier, top_k) if doc in rows]
+                if hits:
+                    fused = _rrf([[row for row, _ in hits]])
+                    return [self._result(chunks, row, fused[row], None, bm25) for row, bm25 in hits]
+
+        query_embedding = self.embedder.embed_query(query).astype(EMBEDDING_DTYPE)
+        depth = max(RRF_DEPTH, 4 * top_k) if hybrid else top_k
+
+        if ann is not None and not exact:
+            top_indices, top_scores = ann.search(embeddings, query_embedding, depth, nprobe or self.nprobe)
+        else:
+            top_indices, top_scores = self._exact_top_k(embeddings, query_embedding, depth)
+        similarities = {int(row): float(score) for row, score in zip(top_indices, top_scores)}
+
+        if not hybrid:
+            return [self._result(chunks, row, score, score, None) for row, score in similarities.items()]
+
+        lexical_hits = {rows[doc]: score for doc, score in self.lexical.search(query, depth) if doc in rows}
+        fused = _rrf([list(similarities), list(lexical_hits)])
+        ranked = sorted(fused, key=lambda row: -fused[row])[:top_k]
+
         results = []
-        for idx in top_indices:
-            results.append((self.index_data[idx], similarities[idx]))
-            
+        for row in ranked:
+            similarity = similarities.get(row)
+            if similarity is None:
+                similarity = float(np.asarray(embeddings[row], dtype=np.float32) @ query_embedding)
+            results.append(self._result(chunks, row, fused[row], similarity, lexical_hits.get(row, 0.0)))
         return results
 
+    def _result(self, chunks: List[Dict], row: int, score: float, similarity: Optional[float], bm25: Optional[float]) -> Tuple[Dict, float]:
+        chunk = chunks[row]
+        return ({
+            'path': chunk['path'],
+            'chunk_id': chunk['chunk_id'],
+            'symbol': chunk.get('symbol'),
+            'start_line': chunk.get('start_line'),
+            'end_line': chunk.get('end_line'),
+            'content': self._chunk_text(chunk),
+            'similarity': similarity,
+            'bm25': bm25
+        }, float(score))
+
+    @staticmethod
+    def _exact_top_k(embeddings: np.ndarray, query_embedding: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Rows are pre-normalized, so cosine similarity is one matrix-vector product
+        similarities = embeddings @ query_embedding
+
+        # Partial selection of the top k, then sort only those
+        k = min(top_k, similarities.shape[0])
+        top_indices = np.argpartition(-similarities, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices])]
+        return top_indices, similarities[top_indices]
+
 # Helper function for external use
 def get_indexer():
     idx = CodeIndexer()
@@ -127,24 +624,30 @@ def get_indexer():
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--root", default="../", help="Root directory to scan")
+    parser.add_argument("--root", default=INDEX_ROOT, help="Root directory to scan")
     parser.add_argument("--build", action="store_true", help="Build the index")
+    parser.add_argument("--refresh", action="store_true", help="Incrementally update the existing index")
     parser.add_argument("--query", help="Test query")
+    parser.add_argument("--mode", default=SEARCH_MODE, choices=["exact", "ivf"], help="Search mode")
     args = parser.parse_args()
 
-    indexer = CodeIndexer()
-    
+    indexer = CodeIndexer(search_mode=args.mode)
+
     if args.build:
         indexer.scan_directory(args.root)
         indexer.build_index()
         indexer.save_index()
-    
+    elif args.refresh:
+        indexer.load_index()
+        indexer.refresh(args.root)
+        indexer.save_index()
+
     if args.query:
-        if not args.build: # If not just built, load it
+        if not (args.build or args.refresh): # If not just built, load it
             indexer.load_index()
-        
+
         results = indexer.search(args.query)
         print(f"\nTop results for '{args.query}':")
         for res, score in results:
-            print(f"--- {res['path']} (Score: {score:.4f}) ---")
+            print(f"--- {res['path']}:{res['start_line']}-{res['end_line']} {res['symbol'] or ''} (Score: {score:.4f}) ---")
             print(res['content'][:200] + "...")
@@ -0,0 +1,128 @@
+import re
+import math
+import heapq
+import pickle
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple, Hashable, Iterable
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+')
+CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+EXACT_QUERY_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+# Natural-language filler that would otherwise match every comment
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "that", "the", "this", "to", "what",
+    "where", "which", "who", "why", "with"
+}
+
+def tokenize(text: str) -> List[str]:
+    """
+    Identifier-aware tokens: every identifier is kept whole (lowercased) and
+    also split on snake_case/camelCase, so `parse_leak` matches `parse_leak`,
+    `parse` and `leak`, and `getUserName` matches `get`, `user` and `name`.
+    """
+    tokens = []
+    for ident in IDENTIFIER_PATTERN.findall(text):
+        lowered = ident.lower()
+        if lowered in STOPWORDS:
+            continue
+        tokens.append(lowered)
+        parts = [p.lower() for piece in ident.split('_') for p in CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1 and p not in STOPWORDS)
+    return tokens
+
+def exact_identifier(query: str):
+    """Returns the lowercased identifier when the query is a single identifier, else None."""
+    query = query.strip()
+    return query.lower() if EXACT_QUERY_PATTERN.match(query) else None
+
+class BM25Index:
+    """
+    In-process inverted index with BM25 scoring over identifier-split tokens.
+    Documents are keyed by hashable ids and grouped by source path so a file's
+    documents can be replaced incrementally. Thread-safe.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[Hashable, int]] = {} # term -> {doc: term frequency}
+        self.doc_len: Dict[Hashable, int] = {}
+        self.doc_terms: Dict[Hashable, List[str]] = {}     # For removal without re-tokenizing
+        self.path_docs: Dict[str, List[Hashable]] = {}
+        self.total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, doc: Hashable, path: str, text: str):
+        counts = Counter(tokenize(text))
+        with self._lock:
+            if doc in self.doc_len:
+                self._remove_doc(doc)
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[doc] = tf
+            length = sum(counts.values())
+            self.doc_len[doc] = length
+            self.doc_terms[doc] = list(counts)
+            self.path_docs.setdefault(path, []).append(doc)
+            self.total_len += length
+
+    def remove_path(self, path: str):
+        with self._lock:
+            for doc in self.path_docs.pop(path, []):
+                self._remove_doc(doc)
+
+    def _remove_doc(self, doc: Hashable):
+        for term in self.doc_terms.pop(doc, []):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(doc, 0)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[Hashable, float]]:
+        """Returns (doc, bm25 score) pairs, best first."""
+        return self._score(set(tokenize(query)), top_k)
+
+    def search_exact(self, identifier: str, top_k: int = 10) -> List[Tuple[Hashable, float]]:
+        """Scores only the whole identifier's postings: the sub-millisecond exact-match path."""
+        return self._score([identifier.lower()], top_k)
+
+    def _score(self, terms: Iterable[str], top_k: int) -> List[Tuple[Hashable, float]]:
+        with self._lock:
+            n_docs = len(self.doc_len)
+            if not n_docs:
+                return []
+            avg_len = self.total_len / n_docs
+            scores: Dict[Hashable, float] = {}
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc, tf in docs.items():
+                    norm = K1 * (1 - B + B * self.doc_len[doc] / avg_len)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        if len(scores) <= top_k:
+            return sorted(scores.items(), key=lambda item: -item[1])
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def save(self, filepath: str):
+        with self._lock:
+            state = (self.postings, self.doc_len, self.doc_terms, self.path_docs, self.total_len)
+            with open(filepath, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filepath: str) -> "BM25Index":
+        index = cls()
+        with open(filepath, 'rb') as f:
+            index.postings, index.doc_len, index.doc_terms, index.path_docs, index.total_len = pickle.load(f)
+        return index
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import random
+import asyncio
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from llm_scheduler import LLMOverloaded, LLMScheduler, Priority
+from circuit_breaker import CircuitBreaker, LLMUnavailable
+from response_cache import ResponseCache, cacheable
+
+# Configuration
+LLM_MAX_CONCURRENCY = int(os.environ.get("OPENCLAW_LLM_CONCURRENCY", "4")) # In-flight requests to the inference server
+LLM_POOL_SIZE = 16            # Keep-alive connections kept open
+LLM_KEEPALIVE_TIMEOUT = 60    # Seconds an idle pooled connection is kept
+LLM_CONNECT_TIMEOUT = 5
+LLM_DEFAULT_TIMEOUT = 180     # Whole-request timeout unless a call overrides it
+LLM_DEFAULT_MAX_TOKENS = 2048
+LLM_MAX_RETRIES = 2
+LLM_BACKOFF_BASE = 0.5        # Seconds; full jitter over base * 2**attempt
+RETRY_STATUSES = {429, 502, 503, 504}
+
+class LLMError(Exception):
+    """Non-200 response from the inference server."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"LLM returned {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+class LLMClient:
+    """
+    One long-lived async client for the OpenAI-compatible inference server.
+    Connections are pooled and kept alive, in-flight requests are capped by a
+    semaphore, and connection errors, timeouts and 429/5xx responses are
+    retried with jittered exponential backoff. Every call first takes a slot
+    of its priority class from the scheduler. Calls tagged with a `task` get
+    their model and token cap from the router, which also records their latency.
+    Low-temperature chat calls are answered from the response cache when possible.
+    With a circuit breaker, calls fail fast with LLMUnavailable while the server is down.
+    """
+
+    def __init__(self, url: str, max_concurrency: int = LLM_MAX_CONCURRENCY, pool_size: int = LLM_POOL_SIZE,
+                 scheduler: Optional[LLMScheduler] = None, router=None, cache: Optional[ResponseCache] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.scheduler = scheduler or LLMScheduler(total_slots=max_concurrency)
+        self.router = router
+        self.cache = cache
+        self.breaker = breaker
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "in_flight": 0, "waiting": 0}
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        # Created lazily, inside the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=LLM_KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    @staticmethod
+    def _timeout(timeout: Optional[float]) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=timeout or LLM_DEFAULT_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Holds one of the `max_concurrency` request slots."""
+        self.stats["waiting"] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats["waiting"] -= 1
+        self.stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            self.stats["in_flight"] -= 1
+            self._semaphore.release()
+
+    async def get(self, url: str, timeout: float = LLM_CONNECT_TIMEOUT) -> Dict[str, Any]:
+        """Unscheduled, unretried GET for cheap metadata endpoints (e.g. loaded models)."""
+        session = self._ensure_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                raise LLMError(resp.status, await resp.text())
+            return await resp.json(content_type=None)
+
+    async def _route(self, task: Optional[str], payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Applies the router's model and token cap for `task` to `payload`."""
+        if not task or self.router is None:
+            return None
+        decision = await self.router.resolve(task, payload.get("max_tokens"))
+        payload["model"] = decision["model"]
+        payload["max_tokens"] = decision["max_tokens"]
+        return decision
+
+    @property
+    def available(self) -> bool:
+        """False while the breaker is open; background agents skip their LLM work then."""
+        return self.breaker is None or self.breaker.available
+
+    def _check_breaker(self):
+        if self.breaker is not None:
+            self.breaker.check()
+
+    def _health(self, error: Optional[str] = None):
+        """Feeds one attempt's outcome to the breaker. Any non-5xx answer means the server is up."""
+        if self.breaker is not None:
+            if error is None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(error)
+
+    def _record(self, decision: Optional[Dict[str, Any]], started: float, ok: bool):
+        if decision is not None:
+            self.router.record(decision, (time.perf_counter() - started) * 1000, ok)
+
+    async def _backoff(self, attempt: int):
+        self.stats["retries"] += 1
+        await asyncio.sleep(random.uniform(0, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+    async def post(self, payload: Dict[str, Any], timeout: Optional[float] = None, retries: int = LLM_MAX_RETRIES,
+                   url: Optional[str] = None, priority: int = Priority.USER) -> Dict[str, Any]:
+        """
+        POSTs `payload` and returns the decoded JSON response. Raises LLMOverloaded
+        when shed and LLMUnavailable while the breaker is open (before queueing).
+        """
+        self._check_breaker()
+        async with self.scheduler.slot(priority):
+            return await self._post(payload, timeout, retries, url)
+
+    async def _post(self, payload: Dict[str, Any], timeout: Optional[float], retries: int, url: Optional[str]) -> Dict[str, Any]:
+        session = self._ensure_session()
+        self.stats["requests"] += 1
+        attempt = 0
+        while True:
+            self._check_breaker() # It may have tripped while we queued or backed off
+            try:
+                async with self._slot():
+                    async with session.post(url or self.url, json=payload, timeout=self._timeout(timeout)) as resp:
+                        if resp.status == 200:
+                            data = await resp.json(content_type=None)
+                            self._health()
+                            return data
+                        error = LLMError(resp.status, await resp.text())
+                self._health(f"HTTP {error.status}" if error.status >= 500 else None)
+                if error.status not in RETRY_STATUSES or attempt >= retries:
+                    raise error
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self._health(type(e).__name__)
+                if attempt >= retries:
+                    self.stats["errors"] += 1
+                    raise
+            except LLMError:
+                self.stats["errors"] += 1
+                raise
+            await self._backoff(attempt)
+            attempt += 1
+
+    async def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None, max_tokens: Optional[int] = None,
+                   temperature: Optional[float] = None, timeout: Optional[float] = None,
+                   retries: int = LLM_MAX_RETRIES, priority: int = Priority.USER, task: Optional[str] = None,
+                   sources: Optional[List[str]] = None, semantic_cache: bool = True, **params) -> str:
+        """
+        Non-streaming chat completion; returns the message content. With a
+        `task`, the router picks the model and caps `max_tokens`. Cached answers
+        are tagged with `sources` (files the prompt was built from) for invalidation;
+        `semantic_cache=False` limits the lookup to exact prompt matches.
+        """
+        payload = {"messages": messages, "max_tokens": max_tokens, **params}
+        return await self._generate(payload, self.url, lambda data: data['choices'][0]['message']['content'],
+                                    model, temperature, timeout, retries, priority, task, sources, semantic_cache)
+
+    async def complete(self, prompt: str, model: Optional[str] = None, max_tokens: Optional[int] = None,
+                       temperature: Optional[float] = None, timeout: Optional[float] = None,
+                       retries: int = LLM_MAX_RETRIES, priority: int = Priority.USER, task: Optional[str] = None,
+                       semantic_cache: bool = False, **params) -> str:
+        """Raw text completion (/v1/completions, no chat template), e.g. for fill-in-the-middle prompts."""
+        payload = {"prompt": prompt, "max_tokens": max_tokens, **params}
+        return await self._generate(payload, self.completions_url, lambda data: data['choices'][0]['text'],
+                                    model, temperature, timeout, retries, priority, task, None, semantic_cache)
+
+    @property
+    def completions_url(self) -> str:
+        return self.url.replace("/chat/completions", "/completions")
+
+    async def _generate(self, payload: Dict[str, Any], url: str, extract, model: Optional[str], temperature: Optional[float],
+                        timeout: Optional[float], retries: int, priority: int, task: Optional[str],
+                        sources: Optional[List[str]], semantic_cache: bool) -> str:
+        if model:
+            payload["model"] = model
+        if temperature is not None:
+            payload["temperature"] = temperature
+        decision = await self._route(task, payload)
+        payload["max_tokens"] = payload["max_tokens"] or LLM_DEFAULT_MAX_TOKENS
+        use_cache = self.cache is not None and cacheable(payload)
+        if use_cache:
+            cached = await self._cache_op(self.cache.get, payload, semantic_cache)
+            if cached is not None:
+                return cached
+
+        started = time.perf_counter()
+        try:
+            data = await self.post(payload, timeout=timeout, retries=retries, url=url, priority=priority)
+            content = extract(data)
+        except (LLMOverloaded, LLMUnavailable):
+            raise # Never reached the model: says nothing about the route
+        except Exception:
+            self._record(decision, started, ok=False)
+            raise
+        self._record(decision, started, ok=True)
+        if use_cache:
+            await self._cache_op(self.cache.put, payload, content, sources, semantic_cache)
+        return content
+
+    @staticmethod
+    async def _cache_op(fn, *args):
+        # sqlite and embedding work stay off the event loop; a broken cache only costs the hit
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            print(f"⚠️ Response cache error: {e}")
+            return None
+
+    async def stream(self, payload: Dict[str, Any], timeout: Optional[float] = None, retries: int = LLM_MAX_RETRIES,
+                     priority: int = Priority.INTERACTIVE, task: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yields content deltas of a `stream: true` chat completion (server-sent
+        events). Only opening the stream is retried. Closing the generator early
+        drops the connection, which stops generation server-side.
+        """
+        session = self._ensure_session()
+        self._check_breaker()
+        self.stats["requests"] += 1
+        payload = dict(payload)
+        decision = await self._route(task, payload)
+        started = time.perf_counter()
+        attempt = 0
+        async with self.scheduler.slot(priority), self._slot():
+            while True:
+                self._check_breaker()
+                try:
+                    resp = await session.post(self.url, json={**payload, "stream": True}, timeout=self._timeout(timeout))
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    self._health(type(e).__name__)
+                    if attempt >= retries:
+                        self.stats["errors"] += 1
+                        self._record(decision, started, ok=False)
+                        raise
+                else:
+                    self._health(f"HTTP {resp.status}" if resp.status >= 500 else None)
+                    if resp.status == 200:
+                        break
+                    error = LLMError(resp.status, await resp.text())
+                    resp.release()
+                    if resp.status not in RETRY_STATUSES or attempt >= retries:
+                        self.stats["errors"] += 1
+                        self._record(decision, started, ok=False)
+                        raise error
+                await self._backoff(attempt)
+                attempt += 1
+
+            finished = False
+            try:
+                async for raw_line in resp.content:
+                    line = raw_line.decode("utf-8", errors="ignore").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or []
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if delta:
+                        yield delta
+                finished = True
+            except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self._health(type(e).__name__) # Server died mid-reply
+                raise
+            finally:
+                if finished:
+                    resp.release() # Connection goes back to the pool
+                    self._record(decision, started, ok=True)
+                else:
+                    resp.close()   # Abandoned mid-generation: drop it
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "max_concurrency": self.max_concurrency,
+            "pool_size": self.pool_size,
+            "scheduler": self.scheduler.get_stats(),
+            "router": self.router.get_stats() if self.router is not None else None,
+            "cache": self.cache.get_stats() if self.cache is not None else None,
+            "breaker": self.breaker.get_stats() if self.breaker is not None else None
+        }
@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Tuple
+
+class Priority:
+    INTERACTIVE = 0 # Chat replies, ghost-text completion, voice: a user is waiting on screen
+    USER = 1        # User-initiated tools (/tools/fix, briefings, summaries)
+    BACKGROUND = 2  # Agents reacting to saves and timers (lore, tests, audits, suggestions)
+
+    NAMES = {INTERACTIVE: "interactive", USER: "user", BACKGROUND: "background"}
+
+# Configuration
+SCHEDULER_TOTAL_SLOTS = int(os.environ.get("OPENCLAW_LLM_CONCURRENCY", "4")) # Matches the client's in-flight cap
+CLASS_LIMITS = {Priority.INTERACTIVE: 4, Priority.USER: 2, Priority.BACKGROUND: 1} # Running at once, per class
+MAX_QUEUED = {Priority.INTERACTIVE: 64, Priority.USER: 16, Priority.BACKGROUND: 8}  # Admission control
+BACKGROUND_MAX_WAIT = 60.0 # Seconds a background job may queue before it is shed
+WAIT_SAMPLES = 500
+
+class LLMOverloaded(Exception):
+    """The job was rejected at admission or shed from the queue."""
+
+class LLMScheduler:
+    """
+    Admission and dispatch for LLM work by priority class. A job runs when a
+    global slot and a slot of its class are free and no higher class is waiting.
+    Full queues reject new jobs; queued background jobs are shed when an
+    interactive job has to wait, or once they have waited BACKGROUND_MAX_WAIT.
+    """
+
+    def __init__(self, total_slots: int = SCHEDULER_TOTAL_SLOTS, limits: Dict[int, int] = None, max_queued: Dict[int, int] = None):
+        self.total_slots = total_slots
+        self.limits = dict(limits or CLASS_LIMITS)
+        self.max_queued = dict(max_queued or MAX_QUEUED)
+        self._waiting: Dict[int, Deque[Tuple[asyncio.Future, float]]] = {p: deque() for p in Priority.NAMES}
+        self._running: Dict[int, int] = {p: 0 for p in Priority.NAMES}
+        self._waits: Dict[int, Deque[float]] = {p: deque(maxlen=WAIT_SAMPLES) for p in Priority.NAMES}
+        self.counters: Dict[int, Dict[str, int]] = {
+            p: {"submitted": 0, "rejected": 0, "shed": 0, "completed": 0} for p in Priority.NAMES
+        }
+
+    def _can_run(self, priority: int) -> bool:
+        return sum(self._running.values()) < self.total_slots and self._running[priority] < self.limits[priority]
+
+    def _higher_waiting(self, priority: int) -> bool:
+        return any(self._waiting[p] for p in Priority.NAMES if p <= priority)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = Priority.USER):
+        """Holds a slot of `priority` for the duration of the block. Raises LLMOverloaded."""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._running[priority] -= 1
+            self.counters[priority]["completed"] += 1
+            self._dispatch()
+
+    async def _acquire(self, priority: int):
+        self.counters[priority]["submitted"] += 1
+        if not self._higher_waiting(priority) and self._can_run(priority):
+            self._running[priority] += 1
+            self._waits[priority].append(0.0)
+            return
+
+        if len(self._waiting[priority]) >= self.max_queued[priority]:
+            self.counters[priority]["rejected"] += 1
+            raise LLMOverloaded(f"{Priority.NAMES[priority]} queue is full")
+        if priority == Priority.INTERACTIVE:
+            self._shed(Priority.BACKGROUND, "preempted by interactive work")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, time.monotonic())
+        self._waiting[priority].append(entry)
+        timeout = BACKGROUND_MAX_WAIT if priority == Priority.BACKGROUND else None
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._remove(priority, entry)
+            if future.done() and not future.exception():
+                return # Granted at the last moment
+            self.counters[priority]["shed"] += 1
+            raise LLMOverloaded("background job waited too long")
+        except asyncio.CancelledError:
+            self._remove(priority, entry)
+            if future.done() and not future.cancelled() and not future.exception():
+                # Granted just as the caller went away: hand the slot back
+                self._running[priority] -= 1
+                self._dispatch()
+            raise
+
+    def _remove(self, priority: int, entry):
+        try:
+            self._waiting[priority].remove(entry)
+        except ValueError:
+            pass
+
+    def _shed(self, priority: int, reason: str):
+        while self._waiting[priority]:
+            future, _ = self._waiting[priority].popleft()
+            if not future.done():
+                self.counters[priority]["shed"] += 1
+                future.set_exception(LLMOverloaded(reason))
+
+    def _dispatch(self):
+        for priority in sorted(Priority.NAMES):
+            queue = self._waiting[priority]
+            while queue and self._can_run(priority):
+                future, enqueued = queue.popleft()
+                if future.done():
+                    continue
+                self._running[priority] += 1
+                self._waits[priority].append(time.monotonic() - enqueued)
+                future.set_result(True)
+            if queue:
+                return # Strict priority: lower classes wait behind a blocked higher one
+
+    def get_stats(self) -> Dict[str, Dict]:
+        stats = {}
+        for priority, name in Priority.NAMES.items():
+            waits = sorted(self._waits[priority])
+            stats[name] = {
+                "running": self._running[priority],
+                "queued": len(self._waiting[priority]),
+                "limit": self.limits[priority],
+                **self.counters[priority],
+                "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                "wait_p99_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 1) if waits else None
+            }
+        return stats
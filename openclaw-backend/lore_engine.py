@@ -1,6 +1,6 @@
 import os
 import chromadb
-from chromadb.utils import embedding_functions
+from embedding_service import embedding_service
 from typing import List, Dict, Any, Optional
 import json
 
@@ -12,9 +12,8 @@ class LoreEngine:
         # Initialize Persistent Client
         self.client = chromadb.PersistentClient(path=db_path)
         
-        # Default embedding function (sentence-transformers/all-MiniLM-L6-v2)
-        # Note: In a production environment, this might download model weights on first run.
-        self.emb_fn = embedding_functions.DefaultEmbeddingFunction()
+        # Shared all-MiniLM-L6-v2 service (sentence-transformers), loaded on first use
+        self.emb_fn = embedding_service.embedding_function()
         
         self.collection = self.client.get_or_create_collection(
             name="project_lore",
@@ -34,7 +33,7 @@ class LoreEngine:
         """Searches for relevant lore shards using semantic similarity."""
         try:
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=[self.emb_fn.embed_query(query)],
                 n_results=n_results
             )
             
@@ -1,7 +1,7 @@
 import chromadb
 import uuid
 import os
-from chromadb.utils import embedding_functions
+from embedding_service import embedding_service
 
 # Use a local persistent directory
 DB_PATH = "./chroma_db"
@@ -11,10 +11,8 @@ class Memory:
         try:
             self.client = chromadb.PersistentClient(path=DB_PATH)
             
-            # Use default embedding function (all-MiniLM-L6-v2) or specify one
-            # Chroma default is usually fine for MVP.
-            # If sentence-transformers is installed, we can be specific.
-            self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+            # Shared all-MiniLM-L6-v2 service (loaded once, on first use)
+            self.ef = embedding_service.embedding_function()
             
             self.collection = self.client.get_or_create_collection(
                 name="openclaw_snippets",
@@ -50,7 +48,7 @@ class Memory:
         
         try:
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=[self.ef.embed_query(query)],
                 n_results=n_results
             )
             # Flatten results
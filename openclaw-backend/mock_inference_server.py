@@ -0,0 +1,399 @@
+"""
+Offline stand-in for the OpenAI-compatible inference server (Ollama), so the
+gateway and agents can be run and benchmarked without a model.
+
+Modes:
+    synth   (default) deterministic canned answers, timed by a latency profile
+    record  proxies to a real server and appends every exchange to a cassette
+    replay  answers from a cassette; unknown requests fall back to synth (or 404)
+
+Usage:
+    python mock_inference_server.py                                  # synth, phi3-m3 profile, port 11435
+    python mock_inference_server.py --profile instant --parallel 4
+    python mock_inference_server.py --record http://localhost:11434 --cassette chat.jsonl
+    python mock_inference_server.py --replay chat.jsonl --timing recorded
+
+    OPENCLAW_INFERENCE_URL=http://localhost:11435/v1/chat/completions python gateway.py
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# Latency profiles: time to first token, decode speed (0 = unlimited), answer length
+PROFILES = {
+    "instant":   {"ttft_ms": 0,   "tokens_per_sec": 0,   "reply_tokens": 60},
+    "phi3-m3":   {"ttft_ms": 150, "tokens_per_sec": 60,  "reply_tokens": 160},
+    "coder-m3":  {"ttft_ms": 40,  "tokens_per_sec": 120, "reply_tokens": 16},
+    "70b-m3":    {"ttft_ms": 900, "tokens_per_sec": 8,   "reply_tokens": 160},
+}
+# Model-name substring -> profile, checked before the server-wide profile
+MODEL_PROFILES = {"70b": "70b-m3", "coder": "coder-m3"}
+KEY_PARAMS = ("max_tokens", "temperature", "stop", "top_p", "top_k", "seed")
+TOKEN = re.compile(r"\s*\S+|\s+")
+FENCE = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+WORDS = (
+    "the function returns early when the buffer is empty so the caller can retry "
+    "with a larger allocation and the index stays consistent across saves"
+).split()
+SNIPPET = "def solve(values):\n    total = 0\n    for value in values:\n        total += value\n    return total\n"
+FIM_LINES = ["return result", "pass", "self.stats[\"requests\"] += 1", "continue", "raise ValueError(value)"]
+
+def request_key(path: str, body: Dict[str, Any]) -> str:
+    """Replay key: endpoint, model, prompt and sampling params (not `stream`, so either form replays)."""
+    keyed = {k: body.get(k) for k in KEY_PARAMS if body.get(k) is not None}
+    keyed.update(path=path.rstrip("/"), model=body.get("model"), messages=body.get("messages"), prompt=body.get("prompt"))
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True).encode()).hexdigest()
+
+def split_tokens(text: str) -> List[str]:
+    return TOKEN.findall(text)
+
+def _apply_stop(text: str, stop) -> str:
+    for s in ([stop] if isinstance(stop, str) else stop or []):
+        if s and s in text:
+            text = text[:text.index(s)]
+    return text
+
+def synthesize(path: str, body: Dict[str, Any], reply_tokens: int, rng: random.Random) -> str:
+    """Deterministic answer shaped like what each call site expects."""
+    if "prompt" in body:
+        return "    " + rng.choice(FIM_LINES) + "\n"
+    messages = body.get("messages") or [{}]
+    prompt = messages[-1].get("content") or ""
+    if "'SAFE'" in prompt: # Security audit
+        return "SAFE"
+    code = FENCE.search(prompt)
+    if code: # Sandbox self-correction: hand the code back
+        return f"```\n{code.group(1).strip()}\n```"
+    if "Content:\n" in prompt: # /tools/fix
+        return f"```\n{prompt.split('Content:' + chr(10), 1)[1].rstrip()}\n```"
+    code_block = ""
+    if re.search(r"\b(code|function|write|implement|python)\b", prompt, re.IGNORECASE):
+        code_block = f"\n\n```python\n{SNIPPET}```\n" # Compiles, so the chat's verify step passes
+    words = [rng.choice(WORDS) for _ in range(max(1, reply_tokens - len(split_tokens(code_block))))]
+    return " ".join(words).capitalize() + "." + code_block
+
+class Cassette:
+    """Recorded exchanges (JSONL). Repeats of one request replay its recordings in order, cycling."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock() # Keeps appended lines whole when writes overlap
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.entries.values())
+
+    def next(self, key: str) -> Optional[Dict[str, Any]]:
+        recorded = self.entries.get(key)
+        if not recorded:
+            return None
+        with self._lock:
+            count = self._served.get(key, 0)
+            self._served[key] = count + 1
+        return recorded[count % len(recorded)]
+
+    async def append(self, entry: Dict[str, Any]):
+        """Replayable at once; the file write runs in a worker thread, off the event loop."""
+        with self._lock:
+            self.entries.setdefault(entry["key"], []).append(entry)
+        await asyncio.to_thread(self._write, json.dumps(entry) + "\n")
+
+    def _write(self, line: str):
+        with self._write_lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+class MockInferenceServer:
+    """
+    Serves /v1/chat/completions and /v1/completions (JSON or SSE), /v1/models
+    and /api/ps. Answers are synthesized, replayed from a cassette, or proxied
+    to `upstream` and recorded. At most `parallel` generations run at once,
+    like a single Ollama runner; the rest queue.
+    """
+
+    def __init__(self, profile: str = "phi3-m3", model_profiles: Optional[Dict[str, str]] = None,
+                 upstream: Optional[str] = None, cassette: Optional[Cassette] = None, record: bool = False,
+                 timing: str = "profile", miss: str = "synth", parallel: int = 1, jitter: float = 0.0, seed: int = 0):
+        self.profile = profile
+        self.model_profiles = MODEL_PROFILES if model_profiles is None else model_profiles
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.cassette = cassette
+        self.record = record
+        self.timing = timing # "profile" or "recorded" (replay only)
+        self.miss = miss     # Replay miss: "synth" or "error"
+        self.parallel = parallel
+        self.jitter = jitter
+        self.seed = seed
+        self.models_seen: Dict[str, None] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._occurrences: Dict[str, int] = {}
+        self.stats = {"requests": 0, "streamed": 0, "replayed": 0, "misses": 0, "recorded": 0, "queued": 0}
+
+    def profile_for(self, model: Optional[str]) -> Dict[str, float]:
+        for fragment, name in self.model_profiles.items():
+            if model and fragment in model:
+                return PROFILES[name]
+        return PROFILES[self.profile]
+
+    def _rng(self, key: str) -> random.Random:
+        # Same request, same occurrence -> same answer and timing on every run
+        count = self._occurrences.get(key, 0)
+        self._occurrences[key] = count + 1
+        return random.Random(f"{self.seed}:{key}:{count}")
+
+    def _schedule(self, tokens: List[str], profile: Dict[str, float], rng: random.Random) -> List[Tuple[float, str]]:
+        """(offset ms, token) pairs for a profile-timed answer."""
+        scale = 1 + rng.uniform(-self.jitter, self.jitter) if self.jitter else 1.0
+        per_token = 1000.0 / profile["tokens_per_sec"] if profile["tokens_per_sec"] else 0.0
+        return [((profile["ttft_ms"] + i * per_token) * scale, token) for i, token in enumerate(tokens)]
+
+    async def _answer(self, path: str, body: Dict[str, Any]) -> Tuple[str, List[Tuple[float, str]], Dict[str, Any]]:
+        """Text, its timed chunks and usage for one request (synth or replay)."""
+        key = request_key(path, body)
+        rng = self._rng(key)
+        profile = self.profile_for(body.get("model"))
+        entry = self.cassette.next(key) if self.cassette is not None else None
+        if entry is not None:
+            self.stats["replayed"] += 1
+            text = entry["text"]
+            if self.timing == "recorded" and entry.get("chunks"):
+                chunks = [(offset, delta) for offset, delta in entry["chunks"]]
+            elif self.timing == "recorded":
+                chunks = [(entry.get("duration_ms", 0), text)]
+            else:
+                chunks = self._schedule(split_tokens(text), profile, rng)
+            return text, chunks, entry.get("usage") or {}
+        if self.cassette is not None:
+            self.stats["misses"] += 1
+            if self.miss == "error":
+                raise KeyError(key)
+
+        reply_tokens = min(int(profile["reply_tokens"]), body.get("max_tokens") or 2048)
+        text = _apply_stop(synthesize(path, body, reply_tokens, rng), body.get("stop"))
+        tokens = split_tokens(text)[:body.get("max_tokens") or None]
+        text = "".join(tokens)
+        prompt = body.get("prompt") or "".join(m.get("content") or "" for m in body.get("messages") or [])
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(tokens), "total_tokens": len(prompt) // 4 + len(tokens)}
+        return text, self._schedule(tokens, profile, rng), usage
+
+    @staticmethod
+    async def _sleep_until(start: float, offset_ms: float):
+        delay = start + offset_ms / 1000 - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _envelope(path: str, model: str, key: str, text: Optional[str], finish: Optional[str], stream: bool) -> Dict[str, Any]:
+        chat = path.endswith("/chat/completions")
+        if chat and stream:
+            choice = {"index": 0, "delta": {"content": text} if text is not None else {}, "finish_reason": finish}
+        elif chat:
+            choice = {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish}
+        else:
+            choice = {"index": 0, "text": text or "", "finish_reason": finish}
+        kind = "chat.completion" if chat else "text_completion"
+        return {
+            "id": f"cmpl-{key[:12]}",
+            "object": kind + ".chunk" if stream and chat else kind,
+            "created": int(time.time()),
+            "model": model,
+            "choices": [choice]
+        }
+
+    async def generate(self, path: str, body: Dict[str, Any]):
+        self.stats["requests"] += 1
+        model = body.get("model") or "mock"
+        self.models_seen[model] = None
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.parallel)
+        if self.record:
+            return await self._proxy(path, body)
+        try:
+            text, chunks, usage = await self._answer(path, body)
+        except KeyError as e:
+            return JSONResponse({"error": {"message": f"No recording for request {e.args[0][:12]}"}}, status_code=404)
+        key = request_key(path, body)
+
+        if not body.get("stream"):
+            async with self._queued():
+                start = time.perf_counter()
+                await self._sleep_until(start, chunks[-1][0] if chunks else 0)
+            return {**self._envelope(path, model, key, text, "stop", False), "usage": usage}
+
+        self.stats["streamed"] += 1
+
+        async def events() -> AsyncIterator[bytes]:
+            async with self._queued():
+                start = time.perf_counter()
+                for offset, delta in chunks:
+                    await self._sleep_until(start, offset)
+                    yield self._sse(self._envelope(path, model, key, delta, None, True))
+                yield self._sse(self._envelope(path, model, key, None, "stop", True))
+                yield b"data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def _queued(self):
+        if self._semaphore.locked():
+            self.stats["queued"] += 1
+        return self._semaphore
+
+    @staticmethod
+    def _sse(data: Dict[str, Any]) -> bytes:
+        return f"data: {json.dumps(data)}\n\n".encode()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600))
+        return self._session
+
+    async def _proxy(self, path: str, body: Dict[str, Any]):
+        """Forwards to the real server and appends the exchange to the cassette."""
+        session = self._ensure_session()
+        key = request_key(path, body)
+        start = time.perf_counter()
+        resp = await session.post(self.upstream + path, json=body)
+        if resp.status != 200:
+            error = await resp.text()
+            resp.release()
+            return JSONResponse({"error": {"message": error}}, status_code=resp.status)
+        request = {k: v for k, v in body.items() if k != "stream"}
+
+        if not body.get("stream"):
+            data = await resp.json(content_type=None)
+            resp.release()
+            choice = data["choices"][0]
+            text = choice["message"]["content"] if "message" in choice else choice.get("text", "")
+            await self._record(key, path, request, text, None, start, data.get("usage"))
+            return data
+
+        async def relay() -> AsyncIterator[bytes]:
+            chunks, finished = [], False
+            try:
+                async for raw_line in resp.content:
+                    yield raw_line
+                    line = raw_line.decode("utf-8", errors="ignore").strip()
+                    if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                        continue
+                    choices = json.loads(line[5:].strip()).get("choices") or []
+                    delta = (choices[0].get("delta", {}).get("content") or choices[0].get("text")) if choices else None
+                    if delta:
+                        chunks.append([round((time.perf_counter() - start) * 1000, 1), delta])
+                finished = True
+            finally:
+                resp.release()
+                if finished:
+                    await self._record(key, path, request, "".join(d for _, d in chunks), chunks, start, None)
+        return StreamingResponse(relay(), media_type="text/event-stream")
+
+    async def _record(self, key: str, path: str, request: Dict[str, Any], text: str, chunks, start: float, usage):
+        await self.cassette.append({
+            "key": key,
+            "path": path,
+            "request": request,
+            "text": text,
+            "chunks": chunks,
+            "ttft_ms": chunks[0][0] if chunks else None,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            "usage": usage
+        })
+        self.stats["recorded"] += 1
+
+    async def loaded_models(self) -> Dict[str, Any]:
+        if self.record:
+            async with self._ensure_session().get(self.upstream + "/api/ps") as resp:
+                return await resp.json(content_type=None)
+        # Every model asked for so far counts as resident, so the router never sees it cold
+        return {"models": [{"name": m, "model": m} for m in self.models_seen]}
+
+def create_app(server: MockInferenceServer) -> FastAPI:
+    app = FastAPI(title="OpenClaw Mock Inference")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await server.generate("/v1/chat/completions", await request.json())
+
+    @app.post("/v1/completions")
+    async def completions(request: Request):
+        return await server.generate("/v1/completions", await request.json())
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": m, "object": "model"} for m in server.models_seen]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return await server.loaded_models()
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {**server.stats, "cassette_entries": len(server.cassette) if server.cassette is not None else None}
+
+    return app
+
+def serve_in_thread(server: MockInferenceServer, host: str = "127.0.0.1", port: int = 11435) -> uvicorn.Server:
+    """Starts the mock on a daemon thread (for benchmarks); set `.should_exit = True` to stop it."""
+    httpd = uvicorn.Server(uvicorn.Config(create_app(server), host=host, port=port, log_level="warning"))
+    threading.Thread(target=httpd.run, daemon=True).start()
+    while not httpd.started:
+        time.sleep(0.01)
+    return httpd
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="phi3-m3")
+    parser.add_argument("--model-profile", action="append", default=[], metavar="SUBSTRING=PROFILE",
+                        help="Timing for matching model names (default: 70b=70b-m3, coder=coder-m3)")
+    parser.add_argument("--parallel", type=int, default=1, help="Concurrent generations (Ollama: OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Seeded +/- fraction applied to each answer's timing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", metavar="UPSTREAM", help="Proxy to this server (e.g. http://localhost:11434) and record")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Answer from a recorded cassette")
+    parser.add_argument("--cassette", help="Cassette file written in --record mode")
+    parser.add_argument("--timing", choices=["profile", "recorded"], default="profile", help="Replay pacing")
+    parser.add_argument("--miss", choices=["synth", "error"], default="synth", help="Replay of an unrecorded request")
+    args = parser.parse_args()
+
+    if args.record and not args.cassette:
+        parser.error("--record needs --cassette")
+    model_profiles = dict(MODEL_PROFILES)
+    for item in args.model_profile:
+        fragment, _, name = item.partition("=")
+        if name not in PROFILES:
+            parser.error(f"Unknown profile '{name}' (known: {', '.join(PROFILES)})")
+        model_profiles[fragment] = name
+
+    cassette = Cassette(args.cassette or args.replay) if (args.record or args.replay) else None
+    server = MockInferenceServer(
+        profile=args.profile, model_profiles=model_profiles, upstream=args.record, cassette=cassette,
+        record=bool(args.record), timing=args.timing, miss=args.miss, parallel=args.parallel,
+        jitter=args.jitter, seed=args.seed
+    )
+    mode = "record" if args.record else "replay" if args.replay else "synth"
+    print(f"🧪 Mock inference server ({mode}, profile {args.profile}) on http://{args.host}:{args.port}")
+    if cassette is not None:
+        print(f"📼 Cassette: {cassette.path} ({len(cassette)} entries)")
+    print(f"   OPENCLAW_INFERENCE_URL=http://{args.host}:{args.port}/v1/chat/completions")
+    uvicorn.run(create_app(server), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,193 @@
+import time
+import copy
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Routing Table: task -> model tier, token cap and latency budget.
+# Tiers: "fast" (chat model), "quality" (large model), "code" (fill-in-the-middle coder model).
+# "fallback" is the tier used when the preferred model is cold or over budget.
+DEFAULT_ROUTES = {
+    "chat":       {"tier": "fast",    "max_tokens": 2048, "latency_budget_ms": 30000,  "fallback": None},
+    "completion": {"tier": "code",    "max_tokens": 64,   "latency_budget_ms": 150,    "fallback": "fast"},
+    "voice":      {"tier": "fast",    "max_tokens": 1024, "latency_budget_ms": 10000,  "fallback": None},
+    "summary":    {"tier": "fast",    "max_tokens": 512,  "latency_budget_ms": 15000,  "fallback": None},
+    "suggestion": {"tier": "fast",    "max_tokens": 100,  "latency_budget_ms": 5000,   "fallback": None},
+    "greeting":   {"tier": "fast",    "max_tokens": 150,  "latency_budget_ms": 10000,  "fallback": None},
+    "lore":       {"tier": "fast",    "max_tokens": 150,  "latency_budget_ms": 10000,  "fallback": None},
+    "security":   {"tier": "fast",    "max_tokens": 256,  "latency_budget_ms": 15000,  "fallback": None},
+    "briefing":   {"tier": "quality", "max_tokens": 512,  "latency_budget_ms": 60000,  "fallback": "fast"},
+    "fix":        {"tier": "quality", "max_tokens": 2048, "latency_budget_ms": 90000,  "fallback": "fast"},
+    "reasoning":  {"tier": "quality", "max_tokens": 1024, "latency_budget_ms": 60000,  "fallback": "fast"},
+    "agent":      {"tier": "quality", "max_tokens": 1024, "latency_budget_ms": 60000,  "fallback": "fast"},
+    "deadlock":   {"tier": "quality", "max_tokens": 1024, "latency_budget_ms": 60000,  "fallback": "fast"},
+    "sandbox":    {"tier": "quality", "max_tokens": 2048, "latency_budget_ms": 120000, "fallback": "fast"},
+    "default":    {"tier": "quality", "max_tokens": 2048, "latency_budget_ms": 120000, "fallback": "fast"},
+}
+LOADED_MODELS_TTL = 10.0 # Seconds between checks of which models are resident
+LATENCY_SAMPLES = 100
+OVERLOAD_WINDOW = 300.0  # Seconds of history used to judge a model overloaded
+OVERLOAD_MIN_SAMPLES = 5 # Recent calls needed before latency can trigger a fallback
+WARM_RETRY_INTERVAL = 300.0 # Seconds before a failed warm load of a cold model is tried again
+
+class ModelRouter:
+    """
+    Maps each call site's task to a model tier, token cap and latency budget.
+    A route falls back to its fallback tier when the preferred model is not
+    loaded (cold) or its recent median latency exceeds the route's budget
+    (overloaded). Routes and tiers can be changed at runtime. A cold preferred
+    model is loaded in the background with `warm_fn`, so the fallback only
+    lasts until it is resident.
+    """
+
+    def __init__(self, tiers: Dict[str, str], routes: Dict[str, Dict] = None,
+                 loaded_models_fn: Optional[Callable[[], Awaitable[Optional[List[str]]]]] = None,
+                 warm_fn: Optional[Callable[[str], Awaitable[Any]]] = None):
+        self.tiers = dict(tiers)
+        self.routes = copy.deepcopy(routes or DEFAULT_ROUTES)
+        self.loaded_models_fn = loaded_models_fn
+        self.warm_fn = warm_fn
+        self._warming: Dict[str, asyncio.Future] = {} # model -> in-flight warm load
+        self._warm_failed: Dict[str, float] = {}      # model -> monotonic time of the last failed load
+        self.warm_stats = {"started": 0, "loaded": 0, "failed": 0}
+        self._loaded: Optional[set] = None # None: unknown, assume warm
+        self._loaded_checked = 0.0
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {} # model -> (timestamp, latency ms) of recent calls
+        self.route_stats: Dict[str, Dict[str, Any]] = {}
+
+    def route(self, task: str) -> Dict[str, Any]:
+        return self.routes.get(task) or self.routes["default"]
+
+    def preferred_model(self, task: str) -> str:
+        return self.tiers[self.route(task)["tier"]]
+
+    async def _loaded_models(self) -> Optional[set]:
+        if self.loaded_models_fn and time.monotonic() - self._loaded_checked > LOADED_MODELS_TTL:
+            self._loaded_checked = time.monotonic()
+            try:
+                models = await self.loaded_models_fn()
+                self._loaded = set(models) if models is not None else None
+            except Exception:
+                self._loaded = None
+        return self._loaded
+
+    def _median_latency(self, model: str) -> Optional[float]:
+        # Only recent calls count, so a route that fell back retries its preferred model later
+        cutoff = time.monotonic() - OVERLOAD_WINDOW
+        with self._lock:
+            samples = sorted(ms for t, ms in self._latencies.get(model, ()) if t >= cutoff)
+        if len(samples) < OVERLOAD_MIN_SAMPLES:
+            return None
+        return samples[len(samples) // 2]
+
+    async def resolve(self, task: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Returns {'task', 'model', 'max_tokens', 'latency_budget_ms', 'fallback_reason'} for a call."""
+        route = self.route(task)
+        model = self.preferred_model(task)
+        reason = None
+        if route.get("fallback"):
+            fallback = self.tiers[route["fallback"]]
+            loaded = await self._loaded_models()
+            median = self._median_latency(model)
+            fallback_median = self._median_latency(fallback)
+            if loaded is not None and model not in loaded:
+                reason = "cold"
+                if self._start_warm(model):
+                    with self._lock:
+                        self._route_stats(task)["warm_loads"] += 1
+            elif median is not None and median > route["latency_budget_ms"] and (fallback_median is None or fallback_median < median):
+                reason = "overloaded" # Only when the fallback is actually faster
+            if reason:
+                model = fallback
+        cap = route["max_tokens"]
+        return {
+            "task": task,
+            "model": model,
+            "max_tokens": min(max_tokens, cap) if max_tokens else cap,
+            "latency_budget_ms": route["latency_budget_ms"],
+            "fallback_reason": reason
+        }
+
+    def _start_warm(self, model: str) -> bool:
+        """Starts one background load of a cold model (none while one runs or shortly after a failure)."""
+        if self.warm_fn is None:
+            return False
+        task = self._warming.get(model)
+        if task is not None and not task.done():
+            return False
+        failed = self._warm_failed.get(model)
+        if failed is not None and time.monotonic() - failed < WARM_RETRY_INTERVAL:
+            return False
+        self.warm_stats["started"] += 1
+        self._warming[model] = asyncio.ensure_future(self._warm(model))
+        return True
+
+    async def _warm(self, model: str):
+        print(f"🔥 Loading cold model {model} in the background...")
+        try:
+            await self.warm_fn(model)
+        except Exception as e:
+            self._warm_failed[model] = time.monotonic()
+            self.warm_stats["failed"] += 1
+            print(f"🔥 Warm load of {model} failed: {e}")
+            return
+        self.warm_stats["loaded"] += 1
+        self._warm_failed.pop(model, None)
+        if self._loaded is not None:
+            self._loaded.add(model) # Routes go back to it without waiting for the next /api/ps check
+        print(f"🔥 {model} loaded")
+
+    def _route_stats(self, task: str) -> Dict[str, Any]:
+        return self.route_stats.setdefault(task, {
+            "calls": 0, "errors": 0, "fallbacks": 0, "over_budget": 0, "warm_loads": 0,
+            "latencies": deque(maxlen=LATENCY_SAMPLES)
+        })
+
+    def record(self, decision: Dict[str, Any], elapsed_ms: float, ok: bool = True):
+        """Records the outcome of a routed call."""
+        with self._lock:
+            if ok:
+                self._latencies.setdefault(decision["model"], deque(maxlen=LATENCY_SAMPLES)).append((time.monotonic(), elapsed_ms))
+            stats = self._route_stats(decision["task"])
+            stats["calls"] += 1
+            if not ok:
+                stats["errors"] += 1
+            if decision.get("fallback_reason"):
+                stats["fallbacks"] += 1
+            if elapsed_ms > decision["latency_budget_ms"]:
+                stats["over_budget"] += 1
+            stats["latencies"].append(elapsed_ms)
+
+    def configure(self, task: str, **changes) -> Dict[str, Any]:
+        """Creates or updates a route; `tier`/`fallback` must name known tiers."""
+        for key in ("tier", "fallback"):
+            if changes.get(key) is not None and changes[key] not in self.tiers:
+                raise ValueError(f"Unknown tier '{changes[key]}' (known: {', '.join(self.tiers)})")
+        route = dict(self.routes.get(task) or self.routes["default"])
+        route.update({k: v for k, v in changes.items() if k in ("tier", "max_tokens", "latency_budget_ms", "fallback")})
+        self.routes[task] = route
+        return route
+
+    def set_tier(self, tier: str, model: str):
+        self.tiers[tier] = model
+
+    def get_stats(self) -> Dict[str, Any]:
+        routes = {}
+        with self._lock:
+            for task, stats in self.route_stats.items():
+                samples = sorted(stats["latencies"])
+                routes[task] = {
+                    **{k: v for k, v in stats.items() if k != "latencies"},
+                    "p50_ms": round(samples[len(samples) // 2]) if samples else None,
+                    "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))]) if samples else None
+                }
+        return {
+            "tiers": self.tiers,
+            "routes": self.routes,
+            "loaded_models": sorted(self._loaded) if self._loaded is not None else None,
+            "warming": sorted(model for model, task in self._warming.items() if not task.done()),
+            "warm_loads": dict(self.warm_stats),
+            "stats": routes
+        }
@@ -1,14 +1,19 @@
 import time
 import os
 import re
-from typing import Callable, List
+from typing import Callable, List, Optional
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+CODE_EXTENSIONS = (".py", ".c", ".h", ".cpp", ".hpp", ".js", ".ts", ".tsx")
+SKIP_MARKERS = ["venv", "node_modules", "__pycache__", "dist", "/."] # Hidden dirs too (.git)
+
 class PeripheralMonitor(FileSystemEventHandler):
-    def __init__(self, root_dir: str, callback: Callable[[str, bool, str], None]):
+    def __init__(self, root_dir: str, callback: Callable[[str, bool, str], None],
+                 code_callback: Optional[Callable[[str], None]] = None):
         self.root_dir = root_dir
         self.callback = callback
+        self.code_callback = code_callback # Called with the path of a created, modified or deleted code file
         self.observer = Observer()
         self.last_events = {} # Debounce path -> timestamp
 
@@ -36,9 +41,26 @@ class PeripheralMonitor(FileSystemEventHandler):
         if event.src_path.endswith((".log", ".txt", ".out", ".err")):
             self._analyze_file(event.src_path)
         else:
-            # Just notify of update without error check for code files?
-            # For now, let's just focus on logs/errors as per requirement.
-            pass
+            self._code_changed(event.src_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._code_changed(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.last_events.pop(event.src_path, None)
+            self._code_changed(event.src_path)
+
+    def on_moved(self, event):
+        # Editors often save by writing a temp file and renaming it over the original
+        if not event.is_directory:
+            self._code_changed(event.src_path)
+            self._code_changed(event.dest_path)
+
+    def _code_changed(self, path: str):
+        if self.code_callback and path.endswith(CODE_EXTENSIONS) and not any(m in path for m in SKIP_MARKERS):
+            self.code_callback(path)
 
     def _analyze_file(self, filepath: str):
         try:
@@ -0,0 +1,110 @@
+import os
+import hashlib
+from typing import Any, Dict, List, Optional
+from context_packer import estimate_tokens
+
+# Bump when SYSTEM_PROMPT changes so cached prefixes and stats are told apart
+SYSTEM_PROMPT_VERSION = 1
+SYSTEM_PROMPT = (
+    "You are OpenClaw, an AI coding assistant running on Apple M3 Max hardware.\n"
+    "Be helpful, concise, and accurate. When writing code, prefer Python unless asked otherwise.\n"
+)
+PROJECT_MAP_TOKENS = int(os.environ.get("OPENCLAW_PROJECT_MAP_TOKENS", "500")) # phi3:mini has a 4K window
+MAX_FUNCTIONS_PER_FILE = 12
+
+def compact_project_map(files: Dict[str, Dict], max_tokens: int = PROJECT_MAP_TOKENS) -> str:
+    """
+    One line per file ("path: func, func, ... (+N)"), sorted so the text only
+    changes when files or their functions do. Files past the budget are counted, not listed.
+    """
+    lines = []
+    used = 0
+    paths = sorted(files)
+    for i, path in enumerate(paths):
+        # Private helpers and dunders cost tokens without telling the model where things live
+        funcs = list(dict.fromkeys(f for f in files[path].get("functions", []) if not f.startswith("_")))
+        line = path
+        if funcs:
+            shown = ", ".join(funcs[:MAX_FUNCTIONS_PER_FILE])
+            more = f" (+{len(funcs) - MAX_FUNCTIONS_PER_FILE})" if len(funcs) > MAX_FUNCTIONS_PER_FILE else ""
+            line += f": {shown}{more}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            lines.append(f"... (+{len(paths) - i} more files)")
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+class PromptBuilder:
+    """
+    Assembles chat prompts as a stable, versioned prefix (system prompt plus
+    compacted project map) followed by the per-request context and question.
+    The prefix is byte-identical between requests until the project map
+    changes, so the inference server's prefix (KV) cache can skip it.
+    """
+
+    def __init__(self, system_prompt: str = SYSTEM_PROMPT):
+        self.system_prompt = system_prompt
+        self.project_map = ""
+        self.prefix = self._render()
+        self.version = self._version()
+        self._served_version: Optional[str] = None # Prefix last sent to (or warmed on) the server
+        self.stats = {"builds": 0, "prefix_hits": 0, "prefix_changes": 0, "prewarms": 0, "last_prewarm_ms": None}
+
+    def _render(self) -> str:
+        if not self.project_map:
+            return self.system_prompt
+        return f"{self.system_prompt}\nProject map (files and their functions):\n{self.project_map}\n"
+
+    def _version(self) -> str:
+        return f"v{SYSTEM_PROMPT_VERSION}.{hashlib.sha1(self.prefix.encode()).hexdigest()[:10]}"
+
+    def update_project_map(self, files: Dict[str, Dict]) -> bool:
+        """Recomputes the prefix from the graph's file table. Returns True if it changed."""
+        project_map = compact_project_map(files)
+        if project_map == self.project_map:
+            return False
+        self.project_map = project_map
+        self.prefix = self._render()
+        self.version = self._version()
+        self.stats["prefix_changes"] += 1
+        return True
+
+    @property
+    def prefix_tokens(self) -> int:
+        return estimate_tokens(self.prefix)
+
+    def build(self, user_message: str, context: str = "") -> List[Dict[str, str]]:
+        """Messages for one chat turn: stable prefix first, variable context last."""
+        self.stats["builds"] += 1
+        if self._served_version == self.version:
+            self.stats["prefix_hits"] += 1
+        self._served_version = self.version
+        content = f"Relevant context:\n{context}\n\n{user_message}" if context else user_message
+        return [
+            {"role": "system", "content": self.prefix},
+            {"role": "user", "content": content}
+        ]
+
+    def warmup_messages(self) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.prefix},
+            {"role": "user", "content": "ping"}
+        ]
+
+    def record_prewarm(self, version: str, elapsed_ms: float):
+        self._served_version = version
+        self.stats["prewarms"] += 1
+        self.stats["last_prewarm_ms"] = round(elapsed_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        builds = self.stats["builds"]
+        return {
+            **self.stats,
+            "version": self.version,
+            "prefix_tokens": self.prefix_tokens,
+            "prefix_hit_rate": round(self.stats["prefix_hits"] / builds, 3) if builds else None
+        }
+
+prompt_builder = PromptBuilder()
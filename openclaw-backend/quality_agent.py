@@ -18,7 +18,7 @@ class QualityAuditor:
         
         # 1. Python Analysis (Radon)
         # radon cc . -j (JSON output)
-        python_results = []
+        python_results = {} # file -> blocks, as radon -j reports it
         try:
             # We use the full path to the venv python to ensure radon is found if installed there
             # But radon is a script. Let's try running it directly or via python module if possible.
@@ -1,6 +1,6 @@
 import sqlite3
 import chromadb
-from chromadb.utils import embedding_functions
+from embedding_service import embedding_service
 import time
 import os
 import json
@@ -13,7 +13,7 @@ class RAGSystem:
         self._init_sqlite()
         
         self.client = chromadb.PersistentClient(path=vector_db_path)
-        self.emb_fn = embedding_functions.DefaultEmbeddingFunction()
+        self.emb_fn = embedding_service.embedding_function()
         self.collection = self.client.get_or_create_collection(
             name="rag_documents",
             embedding_function=self.emb_fn
@@ -89,7 +89,7 @@ class RAGSystem:
 
     def search(self, query: str, n_results: int = 3) -> List[Dict]:
         results = self.collection.query(
-            query_texts=[query],
+            query_embeddings=[self.emb_fn.embed_query(query)],
             n_results=n_results
         )
         
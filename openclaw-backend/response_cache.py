@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional
+
+# Configuration
+RESPONSE_CACHE_PATH = os.environ.get(
+    "OPENCLAW_RESPONSE_CACHE", os.path.join(os.getcwd(), "..", ".gemini", "antigravity", "response_cache.db")
+)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("OPENCLAW_RESPONSE_CACHE_MB", "64")) * 1024 * 1024
+RESPONSE_CACHE_TTL = 7 * 24 * 3600   # Seconds before an entry is considered stale
+MAX_CACHEABLE_TEMPERATURE = 0.2      # Sampling above this is not repeatable enough to cache
+SEMANTIC_CACHE = os.environ.get("OPENCLAW_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_THRESHOLD = 0.98            # Cosine similarity for a near-duplicate prompt to count as a hit
+SEMANTIC_CANDIDATES = 256            # Most recently used entries compared per lookup
+SAMPLING_PARAMS = ("temperature", "max_tokens", "stop", "top_p", "top_k", "seed", "repeat_penalty")
+
+def normalize_prompt(text: str) -> str:
+    """Line endings and trailing whitespace don't change the answer; indentation might."""
+    text = text.replace("\r\n", "\n")
+    return re.sub(r"[ \t]+\n", "\n", text).strip()
+
+def cacheable(payload: Dict[str, Any]) -> bool:
+    temperature = payload.get("temperature")
+    return temperature is not None and temperature <= MAX_CACHEABLE_TEMPERATURE and not payload.get("stream")
+
+class ResponseCache:
+    """
+    Disk-backed LRU of LLM responses keyed by (model, normalized messages,
+    sampling params), for low-temperature calls only. Entries are evicted
+    least-recently-used once the stored text exceeds `max_bytes`, and can be
+    tagged with source files so saving a file drops every answer about it.
+    With `embed_fn` (see SEMANTIC_CACHE), a miss falls back to the closest
+    earlier prompt with the same model and params if it is a near-duplicate.
+    """
+
+    def __init__(self, db_path: str = RESPONSE_CACHE_PATH, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 embed_fn: Optional[Callable[[str], np.ndarray]] = None, threshold: float = SEMANTIC_THRESHOLD):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._init_db()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _init_db(self):
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                scope TEXT,          -- Hash of model + params: semantic lookups stay within it
+                response TEXT,
+                embedding BLOB,      -- Normalized prompt embedding (float32), semantic mode only
+                size INTEGER,
+                created REAL,
+                last_access REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses (scope, last_access)")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_sources (
+                key TEXT,
+                path TEXT
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sources_path ON response_sources (path)")
+        self._conn.commit()
+
+    @staticmethod
+    def _prompt(payload: Dict[str, Any]) -> str:
+        if "prompt" in payload: # Raw /v1/completions request
+            return "raw: " + normalize_prompt(payload["prompt"])
+        return "\n".join(f"{m.get('role')}: {normalize_prompt(m.get('content') or '')}" for m in payload.get("messages", []))
+
+    @staticmethod
+    def _scope(payload: Dict[str, Any]) -> str:
+        params = {k: payload.get(k) for k in SAMPLING_PARAMS if payload.get(k) is not None}
+        return hashlib.sha256(json.dumps([payload.get("model"), params], sort_keys=True).encode()).hexdigest()
+
+    def _key(self, scope: str, prompt: str) -> str:
+        return hashlib.sha256(f"{scope}\n{prompt}".encode()).hexdigest()
+
+    def get(self, payload: Dict[str, Any], semantic: bool = True) -> Optional[str]:
+        """Returns the cached response for `payload`, or None. Blocking (sqlite, embedding)."""
+        scope, prompt = self._scope(payload), self._prompt(payload)
+        key = self._key(scope, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created > ?", (key, now - RESPONSE_CACHE_TTL)
+            ).fetchone()
+            if row:
+                self._touch(key, now)
+                self.stats["hits"] += 1
+                return row[0]
+
+        if semantic and self.embed_fn is not None:
+            match = self._nearest(scope, prompt, now)
+            if match:
+                self.stats["semantic_hits"] += 1
+                return match
+        self.stats["misses"] += 1
+        return None
+
+    def _nearest(self, scope: str, prompt: str, now: float) -> Optional[str]:
+        query = np.asarray(self.embed_fn(prompt), dtype=np.float32)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, response, embedding FROM responses WHERE scope = ? AND embedding IS NOT NULL AND created > ? "
+                "ORDER BY last_access DESC LIMIT ?", (scope, now - RESPONSE_CACHE_TTL, SEMANTIC_CANDIDATES)
+            ).fetchall()
+            if not rows:
+                return None
+            matrix = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._touch(rows[best][0], now)
+            return rows[best][1]
+
+    def _touch(self, key: str, now: float):
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+
+    def put(self, payload: Dict[str, Any], response: str, sources: Optional[List[str]] = None, semantic: bool = True):
+        """Stores a response, tagged with the source files it was computed from. Blocking."""
+        scope, prompt = self._scope(payload), self._prompt(payload)
+        key = self._key(scope, prompt)
+        embedding = None
+        if semantic and self.embed_fn is not None:
+            embedding = np.asarray(self.embed_fn(prompt), dtype=np.float32).tobytes()
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, response, embedding, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, scope, response, embedding, size, now, now)
+            )
+            self._conn.execute("DELETE FROM response_sources WHERE key = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO response_sources (key, path) VALUES (?, ?)",
+                [(key, os.path.abspath(p)) for p in sources or []]
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            self.stats["stores"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not victims:
+                self.total_bytes = 0
+                return
+            for key, size in victims:
+                self._delete(key)
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+                if self.total_bytes <= self.max_bytes:
+                    return
+
+    def _delete(self, key: str):
+        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM response_sources WHERE key = ?", (key,))
+
+    def invalidate_source(self, path: str) -> int:
+        """Drops every response computed from `path`. Returns the number of entries removed."""
+        with self._lock:
+            keys = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT key FROM response_sources WHERE path = ?", (os.path.abspath(path),)
+            ).fetchall()]
+            for key in keys:
+                size = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._delete(key)
+                self.total_bytes -= size[0] if size else 0
+            self._conn.commit()
+            self.stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("DELETE FROM response_sources")
+            self._conn.commit()
+            self.total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            **self.stats,
+            "entries": entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round((self.stats["hits"] + self.stats["semantic_hits"]) / lookups, 3) if lookups else None
+        }
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Configuration
+RETRIEVAL_BUDGET_MS = float(os.environ.get("OPENCLAW_RETRIEVAL_BUDGET_MS", "400")) # Hard cap for the whole fan-out
+DEFAULT_SOURCE_DEADLINE_MS = 300
+RETRIEVAL_WORKERS = 8
+TIMING_WINDOW = 200 # Recent samples kept per source for percentiles
+
+class RetrievalResult:
+    """Results of the sources that finished in time, plus per-source timings in ms."""
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Optional[float]] = {} # None: missed its deadline or skipped
+        self.status: Dict[str, str] = {}               # ok | timeout | error | busy
+        self.elapsed_ms = 0.0
+
+    def get(self, name: str, default=None):
+        return self.results.get(name, default)
+
+class RetrievalOrchestrator:
+    """
+    Runs every registered retrieval source concurrently in a worker pool, off the
+    event loop. Each source has its own deadline (capped by the overall budget);
+    sources that miss it are dropped from the result, so a turn waits for the
+    slowest source that made it and never longer than the budget.
+    A source whose previous call is still running is skipped instead of queued.
+    """
+
+    def __init__(self, budget_ms: float = RETRIEVAL_BUDGET_MS, max_workers: int = RETRIEVAL_WORKERS):
+        self.budget_ms = budget_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, fn: Callable[[str], Any], deadline_ms: float = DEFAULT_SOURCE_DEADLINE_MS):
+        """Registers `fn(query) -> result`. Returning None or [] counts as no result."""
+        self.sources[name] = {
+            "fn": fn,
+            "deadline_ms": deadline_ms,
+            "inflight": False,
+            "samples": deque(maxlen=TIMING_WINDOW),
+            "calls": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "skipped": 0
+        }
+
+    def _run_source(self, name: str, query: str):
+        source = self.sources[name]
+        start = time.perf_counter()
+        try:
+            return source["fn"](query)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                source["inflight"] = False
+                source["samples"].append(elapsed) # True latency, even when the caller gave up
+
+    async def retrieve(self, query: str, budget_ms: Optional[float] = None) -> RetrievalResult:
+        budget = (budget_ms or self.budget_ms) / 1000.0
+        loop = asyncio.get_running_loop()
+        result = RetrievalResult()
+        start = time.perf_counter()
+
+        names, tasks = [], []
+        for name, source in self.sources.items():
+            with self._lock:
+                source["calls"] += 1
+                if source["inflight"]:
+                    source["skipped"] += 1
+                    result.status[name] = "busy"
+                    result.timings[name] = None
+                    continue
+                source["inflight"] = True
+            future = loop.run_in_executor(self.executor, self._run_source, name, query)
+            timeout = min(source["deadline_ms"] / 1000.0, budget)
+            names.append(name)
+            tasks.append(self._await_source(future, timeout, start))
+
+        for name, (status, value, elapsed) in zip(names, await asyncio.gather(*tasks)):
+            source = self.sources[name]
+            result.status[name] = status
+            result.timings[name] = elapsed
+            if status == "ok":
+                if value:
+                    result.results[name] = value
+            elif status == "timeout":
+                source["timeouts"] += 1
+            else:
+                source["errors"] += 1
+                print(f"⚠️ Retrieval source '{name}' failed: {value}")
+
+        result.elapsed_ms = (time.perf_counter() - start) * 1000
+        return result
+
+    @staticmethod
+    async def _await_source(future, timeout: float, start: float):
+        try:
+            # Shielded: the worker can't be interrupted, and a late result is simply discarded
+            value = await asyncio.wait_for(asyncio.shield(future), timeout)
+            return "ok", value, (time.perf_counter() - start) * 1000
+        except asyncio.TimeoutError:
+            return "timeout", None, None
+        except Exception as e:
+            return "error", e, (time.perf_counter() - start) * 1000
+
+    def get_stats(self) -> Dict[str, Dict]:
+        stats = {}
+        with self._lock:
+            for name, source in self.sources.items():
+                samples = sorted(source["samples"])
+                stats[name] = {
+                    "deadline_ms": source["deadline_ms"],
+                    "calls": source["calls"],
+                    "timeouts": source["timeouts"],
+                    "errors": source["errors"],
+                    "skipped": source["skipped"],
+                    "p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+                    "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1) if samples else None
+                }
+        return {"budget_ms": self.budget_ms, "sources": stats}
+
+retrieval_orchestrator = RetrievalOrchestrator()
@@ -77,7 +77,8 @@ class SecurityScanner:
         )
 
         try:
-            response = await self.call_llm_fn(prompt, max_tokens=256)
+            # Deterministic verdict: repeat audits of unchanged code are served from the response cache
+            response = await self.call_llm_fn(prompt, max_tokens=256, temperature=0.0, sources=[filepath])
             if "SAFE" not in response:
                 import re
                 json_match = re.search(r"\{.*\}", response, re.DOTALL)
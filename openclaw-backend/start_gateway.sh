@@ -7,13 +7,15 @@ LOG="$SCRIPT_DIR/gateway_run.log"
 VENV_PY="$SCRIPT_DIR/../openclaw-env-39/bin/python3"
 
 # Kill any existing gateway
-pkill -f "gateway.py" 2>/dev/null
+pkill -f "gateway.py|uvicorn gateway:app" 2>/dev/null
 sleep 1
 
 # Start as true daemon (double-fork)
 (
   cd "$SCRIPT_DIR"
-  nohup "$VENV_PY" gateway.py >> "$LOG" 2>&1 &
+  # Run through uvicorn's __main__ rather than gateway.py: spawned worker processes
+  # (graph parsing) re-import the main script, and gateway.py loads every model
+  nohup "$VENV_PY" -m uvicorn gateway:app --host 0.0.0.0 --port 8000 >> "$LOG" 2>&1 &
   disown $!
   echo "Gateway started with PID: $!"
 )
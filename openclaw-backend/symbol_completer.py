@@ -0,0 +1,212 @@
+import os
+import re
+import bisect
+import keyword
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Configuration
+MIN_PARTIAL = 2        # Characters typed before identifiers are suggested
+MIN_TOKEN_LENGTH = 3   # Shorter identifiers aren't worth a suggestion
+MAX_SCAN = 500         # Vocabulary entries ranked per lookup
+MAX_CANDIDATES = 5
+BIGRAM_WEIGHT = 10.0   # Following the previous identifier in the project outweighs raw frequency
+FUNCTION_BOOST = 5.0
+MODULE_BOOST = 20.0    # After import/from/#include, prefer known modules
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+IMPORT_KEYWORDS = {"import", "from", "include"}
+PY_SIGNATURE = re.compile(r"def\s+([A-Za-z_]\w*)\s*\(([^)]*)\)")
+C_SIGNATURE = re.compile(r"\b([A-Za-z_]\w*)\s*\(([^;{)]*)\)\s*\{")
+C_KEYWORDS = {"if", "for", "while", "switch", "return", "sizeof"}
+# Never valid right after "obj."
+KEYWORDS = set(keyword.kwlist) | C_KEYWORDS | {"int", "char", "void", "const", "struct", "static", "unsigned"}
+
+def _split_params(params: str) -> List[str]:
+    """Splits a parameter list on top-level commas (not those inside brackets)."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(params):
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(params[start:i])
+            start = i + 1
+    parts.append(params[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+def _signatures(path: str, text: str) -> Dict[str, str]:
+    """Function name -> names of its required parameters, for Python `def`s and C definitions."""
+    signatures = {}
+    if path.endswith(".py"):
+        for name, params in PY_SIGNATURE.findall(text):
+            args = []
+            for arg in _split_params(params):
+                if "=" in arg or arg.startswith("*") or arg == "/":
+                    continue # Optional, variadic or marker
+                arg = arg.split(":")[0].strip()
+                if arg not in ("self", "cls"):
+                    args.append(arg)
+            signatures[name] = ", ".join(args)
+    else:
+        for name, params in C_SIGNATURE.findall(text):
+            if name not in C_KEYWORDS:
+                args = [IDENTIFIER.findall(arg)[-1] for arg in _split_params(params) if IDENTIFIER.findall(arg)]
+                signatures[name] = ", ".join(a for a in args if a != "void")
+    return signatures
+
+class SymbolCompleter:
+    """
+    Model-free completion from the project's own symbols. Identifiers from the
+    indexed code are kept in a sorted vocabulary (prefix ranges by bisection)
+    with unigram and bigram counts, so a partial identifier is completed with
+    the candidate that most often follows the previous identifier. Function
+    signatures come from the knowledge graph and parsed definitions. Counts are
+    kept per file, so a saved file is swapped in without a rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.vocab: List[str] = []               # Sorted distinct identifiers
+        self.unigrams: Counter = Counter()
+        self.bigrams: Counter = Counter()        # (previous, identifier) -> count
+        self.functions: set = set()              # Function names from the graph
+        self.modules: set = set()                # Imported modules/headers from the graph
+        self.signatures: Dict[str, str] = {}
+        self._file_unigrams: Dict[str, Counter] = {}
+        self._file_bigrams: Dict[str, Counter] = {}
+        self._file_signatures: Dict[str, Dict[str, str]] = {}
+        self.stats = {"lookups": 0, "hits": 0, "files": 0}
+
+    def build(self, graph: Dict, chunk_texts: Iterable[Tuple[str, str]]):
+        """Full build from the knowledge graph and the code index's (path, text) chunks."""
+        texts: Dict[str, List[str]] = defaultdict(list)
+        for path, text in chunk_texts:
+            texts[os.path.abspath(path)].append(text)
+        with self._lock:
+            self.unigrams, self.bigrams, self.signatures = Counter(), Counter(), {}
+            self._file_unigrams, self._file_bigrams, self._file_signatures = {}, {}, {}
+            self.functions = set(graph.get("functions", {}))
+            self.modules = set()
+            for data in graph.get("files", {}).values():
+                for module in data.get("imports", []):
+                    self.modules.update(IDENTIFIER.findall(module))
+            for path, parts in texts.items():
+                self._replace_file(path, "\n".join(parts), index_vocab=False)
+            self.vocab = sorted(self.unigrams) # One sort instead of an insort per new identifier
+            self.stats["files"] = len(self._file_unigrams)
+
+    def update_file(self, path: str, content: str):
+        """Replaces one file's contribution (call on save)."""
+        with self._lock:
+            self._replace_file(os.path.abspath(path), content)
+            self.stats["files"] = len(self._file_unigrams)
+
+    def remove_file(self, path: str):
+        with self._lock:
+            self._replace_file(os.path.abspath(path), None)
+            self.stats["files"] = len(self._file_unigrams)
+
+    def _replace_file(self, path: str, content: Optional[str], index_vocab: bool = True):
+        old_unigrams = self._file_unigrams.pop(path, Counter())
+        old_bigrams = self._file_bigrams.pop(path, Counter())
+        self.unigrams.subtract(old_unigrams)
+        self.bigrams.subtract(old_bigrams)
+        for token in old_unigrams:
+            if self.unigrams[token] <= 0:
+                del self.unigrams[token]
+                index = bisect.bisect_left(self.vocab, token)
+                if index < len(self.vocab) and self.vocab[index] == token:
+                    self.vocab.pop(index)
+        for pair in old_bigrams:
+            if self.bigrams[pair] <= 0:
+                del self.bigrams[pair]
+
+        old_signatures = self._file_signatures.pop(path, {})
+        signatures = {}
+        if content is not None:
+            tokens = IDENTIFIER.findall(content)
+            unigrams = Counter(t for t in tokens if len(t) >= MIN_TOKEN_LENGTH)
+            bigrams = Counter(pair for pair in zip(tokens, tokens[1:]) if len(pair[1]) >= MIN_TOKEN_LENGTH)
+            if index_vocab:
+                for token in unigrams:
+                    if token not in self.unigrams:
+                        bisect.insort(self.vocab, token)
+            self.unigrams.update(unigrams)
+            self.bigrams.update(bigrams)
+            self._file_unigrams[path] = unigrams
+            self._file_bigrams[path] = bigrams
+            signatures = self._file_signatures[path] = _signatures(path, content)
+
+        for name in old_signatures:
+            if name not in signatures:
+                # Another file may still define it
+                self.signatures.pop(name, None)
+                for other in self._file_signatures.values():
+                    if name in other:
+                        self.signatures[name] = other[name]
+                        break
+        self.signatures.update(signatures)
+
+    def complete(self, prefix: str, suffix: str = "") -> Optional[Dict]:
+        """
+        Completes the identifier (or call arguments after `name(`) ending `prefix`.
+        Returns {"completion", "candidates", "context"} or None when the model should
+        answer; context is "call", "member" (after `obj.`) or "identifier".
+        """
+        self.stats["lookups"] += 1
+        if suffix[:1].isalnum() or suffix[:1] == "_":
+            return None # Cursor is inside a word
+
+        with self._lock:
+            call = re.search(r"([A-Za-z_]\w*)\($", prefix)
+            if call:
+                params = self.signatures.get(call.group(1))
+                if not params:
+                    return None
+                self.stats["hits"] += 1
+                return {"completion": params + ")", "candidates": [f"{call.group(1)}({params})"], "context": "call"}
+
+            partial_match = re.search(r"[A-Za-z_]\w*$", prefix)
+            if not partial_match or len(partial_match.group(0)) < MIN_PARTIAL:
+                return None
+            partial = partial_match.group(0)
+            before = prefix[max(0, partial_match.start() - 200):partial_match.start()]
+            previous = IDENTIFIER.findall(before)
+            previous = previous[-1] if previous else None
+            member = before.rstrip().endswith(".") # obj.<partial>: only what has followed obj counts
+
+            start = bisect.bisect_left(self.vocab, partial)
+            scored = []
+            for token in self.vocab[start:start + MAX_SCAN]:
+                if not token.startswith(partial):
+                    break
+                if token == partial or (member and token in KEYWORDS):
+                    continue
+                score = float(self.unigrams[token])
+                if previous:
+                    follows = self.bigrams.get((previous, token), 0)
+                    if member and not follows:
+                        score /= 100 # Unseen attributes sink below every known one
+                    score += BIGRAM_WEIGHT * follows
+                    if previous in IMPORT_KEYWORDS and token in self.modules:
+                        score += MODULE_BOOST
+                if token in self.functions or token in self.signatures:
+                    score += FUNCTION_BOOST
+                scored.append((score, token))
+        if not scored:
+            return None
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        self.stats["hits"] += 1
+        return {
+            "completion": scored[0][1][len(partial):],
+            "candidates": [token for _, token in scored[:MAX_CANDIDATES]],
+            "context": "member" if member else "identifier"
+        }
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "vocabulary": len(self.vocab), "signatures": len(self.signatures)}
+
+symbol_completer = SymbolCompleter()
@@ -0,0 +1,329 @@
+import os
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# An unqualified call that can't be resolved through its scope or imports links to
+# every definition of the name, but only up to this many (`get`, `run` ... link to none).
+# Calls on anything but self or a project module/class (`items.append()`) never do.
+AMBIGUOUS_CALL_LIMIT = 3
+
+def module_name(rel: str) -> str:
+    """Dotted module of a project file ("pkg/mod.py" -> "pkg.mod", "pkg/__init__.py" -> "pkg"); C files keep their path."""
+    if not rel.endswith(".py"):
+        return rel
+    parts = os.path.splitext(rel)[0].split(os.sep)
+    if parts[-1] == "__init__" and len(parts) > 1:
+        parts.pop()
+    return ".".join(parts)
+
+def qualify(module: str, func: Dict[str, Any]) -> str:
+    """`module.Class.method` for Python, `path:function` for C (whose module is its path)."""
+    if module.endswith((".c", ".h")):
+        return f"{module}:{func['name']}"
+    return f"{module}.{func.get('qualname', func['name'])}"
+
+class SymbolTable:
+    """
+    Functions and methods keyed by qualified name, with integer IDs and
+    id-indexed adjacency (callees/callers) built from the knowledge graph's
+    parse records. Call sites are resolved through the caller's class, module
+    and imports before falling back to the bare name, so same-named functions
+    in different files stay distinct. `set_file` swaps one file in and
+    re-resolves only the call sites whose candidates changed.
+    """
+
+    def __init__(self):
+        self.names: List[Optional[str]] = []                # id -> qualified name (None: free slot)
+        self.ids: Dict[str, int] = {}
+        self.callees: List[Set[int]] = []
+        self.callers: List[Set[int]] = []
+        self._where: List[Optional[Tuple[str, int]]] = []    # id -> (file, line)
+        self._scope: List[Optional[Tuple[str, Optional[str], str]]] = [] # id -> (module, enclosing class, short name)
+        self._sites: List[List[Tuple[Optional[str], str]]] = [] # id -> (receiver, name) call sites
+        self._by_name: Dict[str, Set[int]] = {}              # short name (and class name, for __init__) -> ids
+        self._waiting: Dict[str, Set[int]] = {}              # called name -> ids with a call site using it
+        self._file_ids: Dict[str, List[int]] = {}
+        self._aliases: Dict[str, Dict[str, str]] = {}        # file -> import alias -> dotted target
+        self._modules: Dict[str, Set[str]] = {}              # every dotted suffix of a project module -> modules
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, records: Dict[str, Dict[str, Any]]):
+        """Bulk load: every file's symbols first, then one resolution pass."""
+        for rel, record in records.items():
+            if record is not None:
+                self.set_file(rel, record, link=False)
+        for sid, name in enumerate(self.names):
+            if name is not None:
+                self._link(sid)
+
+    def set_file(self, rel: str, record: Optional[Dict[str, Any]], link: bool = True):
+        """Replaces (or with record=None, removes) one file's symbols."""
+        module = module_name(rel)
+        definitions: Dict[str, list] = {}
+        if record is not None:
+            for func in record["functions"]:
+                qualname = qualify(module, func)
+                sites = list(zip(func.get("receivers") or [None] * len(func["calls"]), func["calls"]))
+                if qualname in definitions:
+                    definitions[qualname][2].extend(sites) # Redefinitions (property setters, conditional defs) merge
+                else:
+                    definitions[qualname] = [func["line"], func.get("cls"), sites, func["name"]]
+
+        changed = set()
+        old_ids = self._file_ids.pop(rel, [])
+        for sid in old_ids:
+            if self.names[sid] not in definitions:
+                changed.update(self._keys(sid))
+                self._remove(sid)
+
+        if rel.endswith(".py"):
+            self._index_module(rel, present=record is not None)
+        if record is not None:
+            self._aliases[rel] = self._resolve_aliases(rel, record.get("aliases", {}))
+        else:
+            self._aliases.pop(rel, None)
+
+        ids = []
+        for qualname, (line, cls, sites, short) in definitions.items():
+            sid = self.ids.get(qualname)
+            if sid is not None and self._where[sid][0] != rel:
+                qualname = f"{qualname}@{rel}" # Same module path from two files (e.g. foo.py and foo/__init__.py)
+                sid = self.ids.get(qualname)
+            if sid is None:
+                sid = self._add(qualname)
+                self._scope[sid] = (module, cls, short)
+                for key in self._keys(sid):
+                    self._by_name.setdefault(key, set()).add(sid)
+                changed.update(self._keys(sid))
+            else:
+                self._unlink(sid)
+                self._scope[sid] = (module, cls, short)
+            self._where[sid] = (rel, line)
+            self._sites[sid] = sites
+            ids.append(sid)
+        if ids:
+            self._file_ids[rel] = ids
+
+        if link:
+            dirty = set(ids)
+            for name in changed:
+                dirty.update(self._waiting.get(name, ()))
+            for sid in dirty:
+                if self.names[sid] is not None:
+                    self._unlink(sid)
+                    self._link(sid)
+
+    def _keys(self, sid: int) -> Tuple[str, ...]:
+        """Names a call site can use to reach this symbol: its own, plus the class name for constructors."""
+        _, cls, short = self._scope[sid]
+        if short == "__init__" and cls:
+            return (short, cls.rsplit(".", 1)[-1])
+        return (short,)
+
+    def _add(self, qualname: str) -> int:
+        if self._free:
+            sid = self._free.pop()
+            self.names[sid] = qualname
+        else:
+            sid = len(self.names)
+            self.names.append(qualname)
+            self.callees.append(set())
+            self.callers.append(set())
+            self._where.append(None)
+            self._scope.append(None)
+            self._sites.append([])
+        self.ids[qualname] = sid
+        return sid
+
+    def _remove(self, sid: int):
+        self._unlink(sid)
+        for caller in self.callers[sid]:
+            self.callees[caller].discard(sid)
+        self.callers[sid] = set()
+        for key in self._keys(sid):
+            ids = self._by_name.get(key)
+            if ids is not None:
+                ids.discard(sid)
+                if not ids:
+                    del self._by_name[key]
+        del self.ids[self.names[sid]]
+        self.names[sid] = None
+        self._where[sid] = self._scope[sid] = None
+        self._sites[sid] = []
+        self._free.append(sid)
+
+    def _unlink(self, sid: int):
+        for target in self.callees[sid]:
+            self.callers[target].discard(sid)
+        self.callees[sid] = set()
+        for _, name in self._sites[sid]:
+            waiting = self._waiting.get(name)
+            if waiting is not None:
+                waiting.discard(sid)
+                if not waiting:
+                    del self._waiting[name]
+
+    def _link(self, sid: int):
+        module, cls, _ = self._scope[sid]
+        aliases = self._aliases.get(self._where[sid][0], {})
+        targets = self.callees[sid]
+        for receiver, name in self._sites[sid]:
+            self._waiting.setdefault(name, set()).add(sid)
+            targets.update(self._resolve(receiver, name, module, cls, aliases))
+        for target in targets:
+            self.callers[target].add(sid)
+
+    def _resolve(self, receiver: Optional[str], name: str, module: str, cls: Optional[str],
+                 aliases: Dict[str, str]) -> Iterable[int]:
+        if receiver is None:
+            # Module-level function or class of this file, then an imported name
+            sid = self._get(f"{module}.{name}")
+            if sid is None and name in aliases:
+                sid = self._lookup(aliases[name], module)
+        elif receiver == "self":
+            sid = self.ids.get(f"{module}.{cls}.{name}") if cls else None
+        else:
+            # Module attribute (`pkg.mod.func()`) or class attribute (`Class.method()`)
+            head, _, rest = receiver.partition(".")
+            sid = self._get(f"{module}.{receiver}.{name}")
+            if sid is None and head in aliases:
+                sid = self._lookup(".".join(part for part in (aliases[head], rest, name) if part), module)
+        if sid is not None:
+            return (sid,)
+        if receiver is not None and receiver != "self" and not self._is_project_receiver(receiver, module, aliases):
+            return () # A local or a third-party object: its type is unknown
+        candidates = self._by_name.get(name, ())
+        if receiver == "self":
+            candidates = [c for c in candidates if self._scope[c][1]] # Inherited: methods only
+        return candidates if len(candidates) <= AMBIGUOUS_CALL_LIMIT else ()
+
+    def _is_project_receiver(self, receiver: str, module: str, aliases: Dict[str, str]) -> bool:
+        """Whether `receiver` names a project module or class (imported, or a class of this module)."""
+        head, _, rest = receiver.partition(".")
+        if head not in aliases:
+            return self._get(f"{module}.{receiver}") is not None
+        dotted = ".".join(part for part in (aliases[head], rest) if part)
+        return dotted in self._modules or self._lookup(dotted, module) is not None
+
+    def _get(self, qualname: str) -> Optional[int]:
+        """A function, or the constructor when the name is a class."""
+        sid = self.ids.get(qualname)
+        return sid if sid is not None else self.ids.get(qualname + ".__init__")
+
+    def _lookup(self, dotted: str, importer: str) -> Optional[int]:
+        """Resolves an imported dotted name to a project symbol; module prefixes may be partial paths."""
+        sid = self._get(dotted)
+        if sid is not None:
+            return sid
+        parts = dotted.split(".")
+        for i in range(len(parts) - 1, 0, -1):
+            modules = self._modules.get(".".join(parts[:i]))
+            if not modules:
+                continue
+            attribute = ".".join(parts[i:])
+            # Several modules share the suffix: prefer the one nearest the importer
+            for module in sorted(modules, key=lambda m: -len(os.path.commonprefix([m, importer]))):
+                sid = self._get(f"{module}.{attribute}")
+                if sid is not None:
+                    return sid
+        return None
+
+    def _index_module(self, rel: str, present: bool):
+        module = module_name(rel)
+        parts = module.split(".")
+        for i in range(len(parts)):
+            suffix = ".".join(parts[i:])
+            if present:
+                self._modules.setdefault(suffix, set()).add(module)
+            elif suffix in self._modules:
+                self._modules[suffix].discard(module)
+                if not self._modules[suffix]:
+                    del self._modules[suffix]
+
+    @staticmethod
+    def _resolve_aliases(rel: str, aliases: Dict[str, str]) -> Dict[str, str]:
+        """Makes relative import targets (leading dots) absolute from the file's package."""
+        package = module_name(rel).split(".")
+        if not rel.endswith("__init__.py"):
+            package = package[:-1]
+        resolved = {}
+        for alias, target in aliases.items():
+            if target.startswith("."):
+                level = len(target) - len(target.lstrip("."))
+                base = package[:len(package) - level + 1] if level > 1 else package
+                target = ".".join(base + [target.lstrip(".")] if target.lstrip(".") else base)
+            resolved[alias] = target
+        return resolved
+
+    # Queries
+
+    def find(self, target: str) -> List[int]:
+        """IDs for a qualified name, a `Class.method` suffix or a bare name."""
+        sid = self.ids.get(target)
+        if sid is not None:
+            return [sid]
+        short = target.rsplit(".", 1)[-1]
+        ids = self._by_name.get(short, ())
+        if short == target:
+            return sorted(ids)
+        return sorted(i for i in ids if self.names[i].endswith("." + target))
+
+    def describe(self, sid: int, **extra) -> Dict[str, Any]:
+        path, line = self._where[sid]
+        return {"symbol": self.names[sid], "file": path, "line": line, **extra}
+
+    def callers_of(self, target: str) -> List[str]:
+        return sorted({self.names[c] for sid in self.find(target) for c in self.callers[sid]})
+
+    def callees_of(self, target: str) -> List[str]:
+        return sorted({self.names[c] for sid in self.find(target) for c in self.callees[sid]})
+
+    def impact(self, target: str, max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Everything that transitively calls `target` (what a change to it can break), nearest first."""
+        sources = self.find(target)
+        depth = dict.fromkeys(sources, 0)
+        frontier = sources
+        level = 0
+        while frontier and (max_depth is None or level < max_depth):
+            level += 1
+            next_frontier = []
+            for sid in frontier:
+                for caller in self.callers[sid]:
+                    if caller not in depth:
+                        depth[caller] = level
+                        next_frontier.append(caller)
+            frontier = next_frontier
+        hits = [(d, self.names[sid], sid) for sid, d in depth.items() if d > 0]
+        return [self.describe(sid, depth=d) for d, _, sid in sorted(hits)]
+
+    def shortest_path(self, source: str, target: str) -> Optional[List[str]]:
+        """Shortest call chain from `source` to `target` (BFS over callees), or None."""
+        goals = set(self.find(target))
+        starts = self.find(source)
+        if not goals or not starts:
+            return None
+        parent: Dict[int, Optional[int]] = dict.fromkeys(starts)
+        queue = deque(starts)
+        while queue:
+            sid = queue.popleft()
+            if sid in goals:
+                path = []
+                while sid is not None:
+                    path.append(self.names[sid])
+                    sid = parent[sid]
+                return path[::-1]
+            for callee in self.callees[sid]:
+                if callee not in parent:
+                    parent[callee] = sid
+                    queue.append(callee)
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "symbols": len(self.ids),
+            "edges": sum(len(targets) for targets in self.callees),
+            "modules": len({m for modules in self._modules.values() for m in modules})
+        }
@@ -32,7 +32,8 @@ class TestAgent:
         """
         
         try:
-            test_code = await self.call_llm_fn(prompt)
+            # Low temperature so regenerating for unchanged code hits the response cache
+            test_code = await self.call_llm_fn(prompt, temperature=0.1, sources=[file_path])
             # Clean up Markdown artifacts if any
             test_code = re.sub(r"```[a-zA-Z]*\n", "", test_code)
             test_code = test_code.replace("```", "").strip()
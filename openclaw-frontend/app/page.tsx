@@ -15,6 +15,7 @@ import DiffModal from "@/components/DiffModal";
 import TabBar from "@/components/TabBar";
 import VoiceWaveform from "@/components/VoiceWaveform";
 import ContextToast from "@/components/ContextToast";
+import InferenceToast from "@/components/InferenceToast";
 import BootSequence from "@/components/BootSequence";
 import InterventionToast from "@/components/InterventionToast";
 import DeadlockAlert from "@/components/DeadlockAlert";
@@ -589,6 +590,7 @@ export default function Home() {
 
             <VoiceWaveform />
             <ContextToast />
+            <InferenceToast />
             <InterventionToast />
             <DeadlockAlert />
             <MorningBriefModal />
@@ -671,6 +671,7 @@ export default function ChatInterface({
                         onChange={setInputText}
                         onSend={handleSend}
                         isProcessing={isProcessing}
+                        onStop={() => sendAction({ type: "stop" })}
                     />
                     <div className="absolute right-14 bottom-3 z-30">
                         <AudioRecorder onTranscript={(text) => setInputText(prev => prev + (prev ? " " : "") + text)} />
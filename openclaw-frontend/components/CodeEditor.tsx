@@ -28,6 +28,9 @@ export default function CodeEditor({ filePath, content, onChange, onSave }: Code
     const [prediction, setPrediction] = useState("");
     const [isPredicting, setIsPredicting] = useState(false);
     const debounceRef = useRef<NodeJS.Timeout | null>(null);
+    const completionAbortRef = useRef<AbortController | null>(null);
+    // Lets the backend cancel this editor's stale completion requests
+    const completionSessionRef = useRef(`editor-${Math.random().toString(36).slice(2)}`);
 
     const monaco = useMonaco();
     const editorRef = useRef<any>(null);
@@ -269,21 +272,31 @@ export default function CodeEditor({ filePath, content, onChange, onSave }: Code
                             // Heuristic: Only predict if at end of line
                             if (position.column < model.getLineContent(position.lineNumber).length + 1) return;
 
+                            // A newer keystroke supersedes the request still in flight
+                            completionAbortRef.current?.abort();
+                            const controller = new AbortController();
+                            completionAbortRef.current = controller;
+
                             setIsPredicting(true);
                             try {
                                 const res = await fetch("http://localhost:8000/tools/completion", {
                                     method: "POST",
                                     headers: { "Content-Type": "application/json" },
+                                    signal: controller.signal,
                                     body: JSON.stringify({
                                         code: value,
                                         language: filePath?.endsWith(".py") ? "python" : "c",
-                                        cursor_line: position.lineNumber
+                                        cursor_line: position.lineNumber,
+                                        cursor_column: position.column - 1,
+                                        session_id: completionSessionRef.current
                                     })
                                 });
                                 const data = await res.json();
-                                if (data.completion) setPrediction(data.completion);
-                            } catch (e) { } finally { setIsPredicting(false); }
-                        }, 500);
+                                if (data.completion && !controller.signal.aborted) setPrediction(data.completion);
+                            } catch (e) { } finally {
+                                if (completionAbortRef.current === controller) setIsPredicting(false);
+                            }
+                        }, 150);
                     }}
                     options={{
                         fontFamily: "JetBrains Mono, Menlo, monospace",
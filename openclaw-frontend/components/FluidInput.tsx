@@ -1,7 +1,7 @@
 "use client";
 
 import { useRef, useEffect, useState } from "react";
-import { Send, Mic } from "lucide-react";
+import { Send, Mic, Square } from "lucide-react";
 import { clsx } from "clsx";
 import CommandSelector from "./CommandSelector";
 
@@ -10,9 +10,10 @@ interface FluidInputProps {
     onChange: (value: string) => void;
     onSend: (message: string) => void;
     isProcessing: boolean;
+    onStop?: () => void;
 }
 
-export default function FluidInput({ value, onChange, onSend, isProcessing }: FluidInputProps) {
+export default function FluidInput({ value, onChange, onSend, isProcessing, onStop }: FluidInputProps) {
     const textareaRef = useRef<HTMLTextAreaElement>(null);
     const [isCommandSelectorVisible, setIsCommandSelectorVisible] = useState(false);
     const [commandFilter, setCommandFilter] = useState("");
@@ -87,17 +88,27 @@ export default function FluidInput({ value, onChange, onSend, isProcessing }: Fl
                 />
 
                 <div className="absolute right-2 bottom-2 flex items-center gap-2">
-                    <button
-                        onClick={() => {
-                            if (value.trim() && !isProcessing) {
-                                onSend(value);
-                            }
-                        }}
-                        disabled={!value.trim() || isProcessing}
-                        className="p-2 bg-neon-cyan/10 hover:bg-neon-cyan/20 text-neon-cyan disabled:text-titanium-dim disabled:bg-transparent rounded-lg transition-all"
-                    >
-                        <Send size={18} />
-                    </button>
+                    {isProcessing && onStop ? (
+                        <button
+                            onClick={onStop}
+                            title="Stop generating"
+                            className="p-2 bg-red-500/10 hover:bg-red-500/20 text-red-400 rounded-lg transition-all"
+                        >
+                            <Square size={18} />
+                        </button>
+                    ) : (
+                        <button
+                            onClick={() => {
+                                if (value.trim() && !isProcessing) {
+                                    onSend(value);
+                                }
+                            }}
+                            disabled={!value.trim() || isProcessing}
+                            className="p-2 bg-neon-cyan/10 hover:bg-neon-cyan/20 text-neon-cyan disabled:text-titanium-dim disabled:bg-transparent rounded-lg transition-all"
+                        >
+                            <Send size={18} />
+                        </button>
+                    )}
                 </div>
             </div>
         </div>
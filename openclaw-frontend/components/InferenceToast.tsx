@@ -0,0 +1,97 @@
+"use client";
+
+import { useState, useEffect } from "react";
+import { motion, AnimatePresence } from "framer-motion";
+import { WifiOff, Wifi } from "lucide-react";
+
+// Circuit breaker state of the inference server, broadcast by the gateway as "inference_state"
+export default function InferenceToast() {
+    const [state, setState] = useState<string>("closed");
+    const [retryIn, setRetryIn] = useState(0);
+    const [lastError, setLastError] = useState<string | null>(null);
+    const [showRecovered, setShowRecovered] = useState(false);
+
+    useEffect(() => {
+        let ws: WebSocket;
+        let closed = false;
+        const connect = () => {
+            ws = new WebSocket("ws://localhost:8000/ws/voice"); // Reusing voice stream for system events
+
+            ws.onmessage = (event) => {
+                try {
+                    const data = JSON.parse(event.data);
+                    if (data.type === "inference_state") {
+                        setState((prev) => {
+                            if (data.state === "closed" && prev !== "closed") {
+                                setShowRecovered(true);
+                                setTimeout(() => setShowRecovered(false), 4000);
+                            }
+                            return data.state;
+                        });
+                        setRetryIn(Math.ceil(data.retry_in_s || 0));
+                        setLastError(data.last_error);
+                    }
+                } catch (e) {
+                    console.error("Inference State Socket Error", e);
+                }
+            };
+
+            ws.onclose = () => {
+                if (!closed) setTimeout(connect, 3000);
+            };
+        };
+
+        connect();
+        return () => {
+            closed = true;
+            ws?.close();
+        };
+    }, []);
+
+    // Count down to the next probe between broadcasts
+    useEffect(() => {
+        if (state === "closed" || retryIn <= 0) return;
+        const timer = setTimeout(() => setRetryIn((s) => Math.max(0, s - 1)), 1000);
+        return () => clearTimeout(timer);
+    }, [state, retryIn]);
+
+    const down = state !== "closed";
+
+    return (
+        <AnimatePresence>
+            {(down || showRecovered) && (
+                <motion.div
+                    initial={{ opacity: 0, x: 100, scale: 0.9 }}
+                    animate={{ opacity: 1, x: 0, scale: 1 }}
+                    exit={{ opacity: 0, x: 100, scale: 0.9 }}
+                    className="fixed top-44 right-8 z-[100] max-w-sm pointer-events-auto"
+                >
+                    <div className={`glass-panel p-4 flex items-start gap-4 rounded-2xl border-l-[4px] shadow-2xl ${down
+                            ? "border-l-red-500/80 bg-red-500/5"
+                            : "border-l-neon-cyan/80 bg-neon-cyan/5"
+                        }`}>
+                        <div className={`p-2 rounded-xl ${down ? "bg-red-500/20 text-red-400" : "bg-neon-cyan/20 text-neon-cyan"}`}>
+                            {down ? <WifiOff size={24} className="animate-pulse" /> : <Wifi size={24} />}
+                        </div>
+
+                        <div className="flex flex-col gap-1">
+                            <h3 className={`text-sm font-bold tracking-tight ${down ? "text-red-400" : "text-neon-cyan"}`}>
+                                {down ? "INFERENCE OFFLINE" : "INFERENCE RESTORED"}
+                            </h3>
+                            <p className="text-xs text-titanium-dim leading-relaxed">
+                                {!down
+                                    ? "The model server is answering again."
+                                    : state === "half_open"
+                                        ? "Checking whether the model server is back..."
+                                        : `Background agents are paused. Next check in ${retryIn}s.`}
+                            </p>
+                            {down && lastError && (
+                                <span className="text-[10px] font-mono text-titanium-dim truncate">{lastError}</span>
+                            )}
+                        </div>
+                    </div>
+                </motion.div>
+            )}
+        </AnimatePresence>
+    );
+}
@@ -57,6 +57,10 @@ export function useOpenClawStream() {
                     setStatusMessage((prev) => prev.includes("Compiling") ? prev : "Streaming...");
                     streamRef.current += data.chunk;
                     setCurrentStream(streamRef.current);
+                } else if (data.type === "stream_reset") {
+                    // Reply failed verification; a corrected one streams next
+                    streamRef.current = "";
+                    setCurrentStream("");
                 } else if (data.type === "thought") {
                     setThoughtStatus(data.status);
                     if (data.trace) setThoughtTrace(data.trace);
@@ -65,6 +65,6 @@ echo -e "\n${CYAN}[3/3] Setup Complete.${RESET}"
 echo -e "${TITANIUM}---------------------------------------------------${RESET}"
 echo -e "${GREEN}✅ OpenClaw AI is ready to launch.${RESET}"
 echo -e "${TITANIUM}To start the system, run separately:${RESET}"
-echo -e "  1. Backend:  ${BOLD}source openclaw-env/bin/activate && cd openclaw-backend && python3 gateway.py${RESET}"
+echo -e "  1. Backend:  ${BOLD}source openclaw-env/bin/activate && cd openclaw-backend && python3 -m uvicorn gateway:app --host 0.0.0.0 --port 8000${RESET}"
 echo -e "  2. Frontend: ${BOLD}cd openclaw-frontend && npm run dev${RESET}"
 echo -e "${TITANIUM}---------------------------------------------------${RESET}\n"